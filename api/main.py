@@ -2,12 +2,14 @@
 FastAPI Backend để lấy dữ liệu từ các bảng database
 """
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query, UploadFile, File
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from typing import List, Dict, Optional
 from datetime import date, datetime
 import sys
 import os
+import zipfile
 from dotenv import load_dotenv
 
 # Load biến môi trường
@@ -18,14 +20,18 @@ project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.insert(0, project_root)
 
 from service import (
-    db,
-    StudentsRepository,
-    TeachersRepository,
-    ClassesRepository,
-    FaceEmbeddingsRepository,
-    CamerasRepository,
-    AttendanceRepository
+    async_db,
+    AsyncStudentsRepository,
+    AsyncTeachersRepository,
+    AsyncClassesRepository,
+    AsyncFaceEmbeddingsRepository,
+    AsyncCamerasRepository,
+    AsyncAttendanceRepository
 )
+from service.attendance import ATTENDANCE_EXPORT_COLUMNS
+from service.export import EXPORT_MEDIA_TYPES, ndjson_chunks, csv_chunks, gzip_chunks
+from service.model_profiles import DEFAULT_MODEL_PROFILE, ModelRegistry
+from service.student_import import FaceEmbedder, ImportJobs, PhotoSource, StudentImporter, parse_roster
 
 app = FastAPI(title="Attendance System API", version="1.0.0")
 
@@ -42,12 +48,12 @@ app.add_middleware(
 @app.on_event("startup")
 async def startup_event():
     """Kết nối database khi khởi động"""
-    db.connect()
+    await async_db.connect()
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """Đóng kết nối database khi tắt"""
-    db.disconnect()
+    await async_db.disconnect()
 
 # ===========================================================
 # Endpoints cho Teachers
@@ -57,14 +63,14 @@ async def shutdown_event():
 async def get_all_teachers():
     """Lấy tất cả giáo viên"""
     try:
-        return TeachersRepository.get_all_teachers()
+        return await AsyncTeachersRepository.get_all_teachers()
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/teachers/{teacher_id}", response_model=Dict)
 async def get_teacher_by_id(teacher_id: int):
     """Lấy giáo viên theo ID"""
-    teacher = TeachersRepository.get_teacher_by_id(teacher_id)
+    teacher = await AsyncTeachersRepository.get_teacher_by_id(teacher_id)
     if not teacher:
         raise HTTPException(status_code=404, detail="Teacher not found")
     return teacher
@@ -73,7 +79,7 @@ async def get_teacher_by_id(teacher_id: int):
 async def get_teacher_classes(teacher_id: int):
     """Lấy các lớp học của giáo viên"""
     try:
-        return TeachersRepository.get_teacher_classes(teacher_id)
+        return await AsyncTeachersRepository.get_teacher_classes(teacher_id)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -85,14 +91,14 @@ async def get_teacher_classes(teacher_id: int):
 async def get_all_classes():
     """Lấy tất cả lớp học"""
     try:
-        return ClassesRepository.get_all_classes()
+        return await AsyncClassesRepository.get_all_classes()
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/classes/{class_id}", response_model=Dict)
 async def get_class_by_id(class_id: int):
     """Lấy lớp học theo ID"""
-    class_info = ClassesRepository.get_class_by_id(class_id)
+    class_info = await AsyncClassesRepository.get_class_by_id(class_id)
     if not class_info:
         raise HTTPException(status_code=404, detail="Class not found")
     return class_info
@@ -101,14 +107,14 @@ async def get_class_by_id(class_id: int):
 async def get_class_students(class_id: int):
     """Lấy học sinh trong lớp"""
     try:
-        return ClassesRepository.get_class_students(class_id)
+        return await AsyncClassesRepository.get_class_students(class_id)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/classes/{class_id}/full", response_model=Dict)
 async def get_class_with_students(class_id: int):
     """Lấy lớp học kèm danh sách học sinh"""
-    class_info = ClassesRepository.get_class_with_students(class_id)
+    class_info = await AsyncClassesRepository.get_class_with_students(class_id)
     if not class_info:
         raise HTTPException(status_code=404, detail="Class not found")
     return class_info
@@ -117,18 +123,24 @@ async def get_class_with_students(class_id: int):
 # Endpoints cho Students
 # ===========================================================
 
-@app.get("/api/students", response_model=List[Dict])
-async def get_all_students():
-    """Lấy tất cả học sinh"""
+@app.get("/api/students", response_model=Dict)
+async def get_all_students(
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None
+):
+    """Lấy học sinh theo trang (keyset): trả về items và next_cursor"""
     try:
-        return StudentsRepository.get_all_students()
+        return await AsyncStudentsRepository.get_students_page(limit, cursor, fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/students/{student_id}", response_model=Dict)
 async def get_student_by_id(student_id: int):
     """Lấy học sinh theo ID"""
-    student = StudentsRepository.get_student_by_id(student_id)
+    student = await AsyncStudentsRepository.get_student_by_id(student_id)
     if not student:
         raise HTTPException(status_code=404, detail="Student not found")
     return student
@@ -137,19 +149,72 @@ async def get_student_by_id(student_id: int):
 async def get_students_by_class(class_id: int):
     """Lấy học sinh theo lớp"""
     try:
-        return StudentsRepository.get_students_by_class(class_id)
+        return await AsyncStudentsRepository.get_students_by_class(class_id)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+# Nhập hàng loạt chạy trong nền; model chỉ được nạp khi có job đầu tiên
+IMPORT_IMAGE_DIR = os.path.join(project_root, 'data', 'images')
+import_jobs = ImportJobs()
+_import_models = ModelRegistry(ctx_id=-1)
+_import_embedder: Optional[FaceEmbedder] = None
+
+def enrollment_embedder(images):
+    """Embedding ảnh đăng ký bằng profile ENROLL_MODEL_PROFILE (nạp model ở lần gọi đầu)"""
+    global _import_embedder
+    if _import_embedder is None:
+        profile = os.getenv('ENROLL_MODEL_PROFILE', DEFAULT_MODEL_PROFILE)
+        _import_embedder = FaceEmbedder(_import_models.get(profile))
+    return _import_embedder(images)
+
+@app.post("/api/students/import", response_model=Dict)
+async def import_students(roster: UploadFile = File(...), photos: UploadFile = File(...)):
+    """Nhập hàng loạt học sinh từ CSV + file zip ảnh; trả về job_id để theo dõi tiến độ"""
+    try:
+        rows, errors = parse_roster(await roster.read())
+        source = PhotoSource(zip_bytes=await photos.read())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except zipfile.BadZipFile:
+        raise HTTPException(status_code=400, detail="File zip ảnh không hợp lệ")
+
+    os.makedirs(IMPORT_IMAGE_DIR, exist_ok=True)
+    importer = StudentImporter(enrollment_embedder, source, image_dir=IMPORT_IMAGE_DIR)
+    job_id = import_jobs.submit(importer, rows, errors)
+    return {"job_id": job_id, "total": len(rows) + len(errors)}
+
+@app.get("/api/students/import/{job_id}", response_model=Dict)
+async def get_import_status(job_id: str):
+    """Tiến độ và lỗi từng dòng của một lần nhập"""
+    state = import_jobs.get(job_id)
+    if state is None:
+        raise HTTPException(status_code=404, detail="Import job not found")
+    return state
+
 # ===========================================================
 # Endpoints cho Face Embeddings
 # ===========================================================
 
-@app.get("/api/embeddings", response_model=List[Dict])
-async def get_all_embeddings():
-    """Lấy tất cả embeddings"""
+def serialize_embeddings(rows: List[Dict]) -> List[Dict]:
+    """Chuyển embedding ndarray sang list để trả về JSON"""
+    for row in rows:
+        if row.get('embedding') is not None:
+            row['embedding'] = row['embedding'].tolist()
+    return rows
+
+@app.get("/api/embeddings", response_model=Dict)
+async def get_all_embeddings(
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None
+):
+    """Lấy embeddings theo trang (keyset); vector chỉ trả về khi fields có 'embedding'"""
     try:
-        return FaceEmbeddingsRepository.get_all_embeddings()
+        page = await AsyncFaceEmbeddingsRepository.get_embeddings_page(limit, cursor, fields)
+        serialize_embeddings(page['items'])
+        return page
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -157,7 +222,7 @@ async def get_all_embeddings():
 async def get_embeddings_by_student(student_id: int):
     """Lấy embeddings của học sinh"""
     try:
-        return FaceEmbeddingsRepository.get_embeddings_by_student(student_id)
+        return serialize_embeddings(await AsyncFaceEmbeddingsRepository.get_embeddings_by_student(student_id))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -169,14 +234,14 @@ async def get_embeddings_by_student(student_id: int):
 async def get_all_cameras():
     """Lấy tất cả camera"""
     try:
-        return CamerasRepository.get_all_cameras()
+        return await AsyncCamerasRepository.get_all_cameras()
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/cameras/{camera_id}", response_model=Dict)
 async def get_camera_by_id(camera_id: int):
     """Lấy camera theo ID"""
-    camera = CamerasRepository.get_camera_by_id(camera_id)
+    camera = await AsyncCamerasRepository.get_camera_by_id(camera_id)
     if not camera:
         raise HTTPException(status_code=404, detail="Camera not found")
     return camera
@@ -185,19 +250,54 @@ async def get_camera_by_id(camera_id: int):
 # Endpoints cho Attendance
 # ===========================================================
 
-@app.get("/api/attendance", response_model=List[Dict])
-async def get_all_attendance():
-    """Lấy tất cả điểm danh"""
+@app.get("/api/attendance", response_model=Dict)
+async def get_all_attendance(
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None
+):
+    """Lấy điểm danh theo trang (keyset, mới nhất trước): trả về items và next_cursor"""
     try:
-        return AttendanceRepository.get_all_attendance()
+        return await AsyncAttendanceRepository.get_attendance_page(limit, cursor, fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/attendance/export")
+async def export_attendance(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    gzip: bool = False,
+    class_id: Optional[int] = None,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    status: Optional[str] = Query(None, pattern="^(present|absent|late|excused)$")
+):
+    """Xuất lịch sử điểm danh dạng stream (NDJSON/CSV, tuỳ chọn gzip), bộ nhớ không tăng theo số dòng"""
+    batches = AsyncAttendanceRepository.stream_attendance_export(class_id, start_date, end_date, status)
+    if format == "csv":
+        body = csv_chunks(batches, ATTENDANCE_EXPORT_COLUMNS)
+    else:
+        body = ndjson_chunks(batches)
+
+    filename = f"attendance.{format}"
+    media_type = EXPORT_MEDIA_TYPES[format]
+    if gzip:
+        body = gzip_chunks(body)
+        filename += ".gz"
+        media_type = "application/gzip"
+
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
 @app.get("/api/attendance/student/{student_id}", response_model=List[Dict])
 async def get_attendance_by_student(student_id: int):
     """Lấy điểm danh của học sinh"""
     try:
-        return AttendanceRepository.get_attendance_by_student(student_id)
+        return await AsyncAttendanceRepository.get_attendance_by_student(student_id)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -205,7 +305,7 @@ async def get_attendance_by_student(student_id: int):
 async def get_attendance_by_class(class_id: int):
     """Lấy điểm danh của lớp"""
     try:
-        return AttendanceRepository.get_attendance_by_class(class_id)
+        return await AsyncAttendanceRepository.get_attendance_by_class(class_id)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -213,7 +313,7 @@ async def get_attendance_by_class(class_id: int):
 async def get_attendance_statistics(class_id: int):
     """Lấy thống kê điểm danh của lớp"""
     try:
-        return AttendanceRepository.get_attendance_statistics_by_class(class_id)
+        return await AsyncAttendanceRepository.get_attendance_statistics_by_class(class_id)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -230,10 +330,10 @@ async def root():
 async def health_check():
     """Health check với database"""
     try:
-        if db.connection and db.connection.is_connected():
-            return {"status": "healthy", "database": "connected"}
+        if await async_db.is_connected():
+            return {"status": "healthy", "database": "connected", "pool": async_db.pool_metrics()}
         else:
-            return {"status": "unhealthy", "database": "disconnected"}
+            return {"status": "unhealthy", "database": "disconnected", "pool": async_db.pool_metrics()}
     except:
         return {"status": "unhealthy", "database": "error"}
 
@@ -0,0 +1,107 @@
+"""
+Script so sánh các loại vector index (flat / ivf / hnsw): recall@k và độ trễ
+
+Mặc định dùng vector ngẫu nhiên; thêm --from-db để dùng embedding thật trong database.
+    python database/benchmark_index.py --size 100000 --queries 500
+    python database/benchmark_index.py --from-db --nprobe 32
+    python database/benchmark_index.py --nlist 256 --nprobe 8 16 32 64   # recall theo từng nprobe
+"""
+
+import argparse
+import os
+import sys
+import numpy as np
+from dotenv import load_dotenv
+
+# Load biến môi trường từ file .env
+load_dotenv()
+
+# Thêm thư mục gốc của project vào path để tìm module service
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+
+from service.vector_index import FlatIndex, INDEX_TYPES, IVFIndex, benchmark_index, create_index
+
+
+def load_vectors(args):
+    """Trả về (ids, vectors) từ database hoặc sinh ngẫu nhiên"""
+    if args.from_db:
+        from service import db, FaceEmbeddingsRepository
+        if not db.connect():
+            print("✗ Không thể kết nối database!")
+            sys.exit(1)
+        try:
+            rows = [r for r in FaceEmbeddingsRepository.get_all_embeddings_for_recognition()
+                    if r.get('embedding') is not None]
+        finally:
+            db.disconnect()
+        if not rows:
+            print("✗ Chưa có embedding nào trong database")
+            sys.exit(1)
+        return [r['student_id'] for r in rows], np.stack([r['embedding'] for r in rows])
+
+    rng = np.random.default_rng(args.seed)
+    vectors = rng.standard_normal((args.size, args.dim)).astype(np.float32)
+    return list(range(1, args.size + 1)), vectors
+
+
+def main():
+    """Hàm chính"""
+    parser = argparse.ArgumentParser(description="Benchmark vector index")
+    parser.add_argument('--from-db', action='store_true', help="Dùng embedding trong database")
+    parser.add_argument('--size', type=int, default=20000, help="Số vector ngẫu nhiên")
+    parser.add_argument('--dim', type=int, default=512)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--noise', type=float, default=0.5, help="Nhiễu cộng vào query so với vector gốc")
+    parser.add_argument('--nlist', type=int, default=256)
+    parser.add_argument('--nprobe', type=int, nargs='+', default=[4, 8, 16, 32, 64],
+                        help="Một hoặc nhiều giá trị nprobe của IVF (đo recall cho từng giá trị)")
+    parser.add_argument('--ef', type=int, default=64, help="ef_search của HNSW")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    ids, vectors = load_vectors(args)
+    dim = vectors.shape[1]
+    rng = np.random.default_rng(args.seed + 1)
+    picks = rng.choice(len(ids), size=min(args.queries, len(ids)), replace=False)
+    queries = vectors[picks] + args.noise * rng.standard_normal((len(picks), dim)).astype(np.float32)
+
+    print("=" * 60)
+    print(f"BENCHMARK VECTOR INDEX: {len(ids)} vector, {len(picks)} query, k={args.k}")
+    print("=" * 60)
+
+    exact = FlatIndex(dim)
+    exact.add(ids, vectors)
+
+    options = {
+        'flat': {},
+        'ivf': {'nlist': args.nlist},
+        'hnsw': {'max_elements': len(ids), 'ef_search': args.ef},
+    }
+    for kind in INDEX_TYPES:
+        try:
+            index = create_index(kind, dim, **options[kind])
+        except ImportError as e:
+            print(f"- {kind:5s} bỏ qua: {e}")
+            continue
+        if isinstance(index, IVFIndex):
+            if len(ids) < index.min_train_size:
+                print(f"! ivf   chỉ có {len(ids)} vector < nlist * 39 = {index.min_train_size}: "
+                      f"tâm cụm kém ổn định, nên giảm --nlist")
+            index.train(vectors)
+        index.add(ids, vectors)
+        settings = [''] if kind != 'ivf' else args.nprobe
+        for nprobe in settings:
+            label = kind
+            if kind == 'ivf':
+                index.nprobe = nprobe
+                label = f"ivf nlist={args.nlist} nprobe={nprobe}"
+            result = benchmark_index(index, exact, queries, args.k)
+            print(f"✓ {label:28s} recall@{args.k}={result['recall_at_k']:.3f} "
+                  f"p50={result['latency_ms_p50']:.2f}ms p99={result['latency_ms_p99']:.2f}ms "
+                  f"qps={result['queries_per_sec']:.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+Script so sánh các model profile: thời gian nạp, độ trễ và độ chính xác trên bộ ảnh cục bộ
+
+Bộ ảnh gồm mỗi người một thư mục con:
+    images/
+        nguyen_van_a/1.jpg, 2.jpg ...
+        tran_thi_b/1.jpg ...
+
+Chạy:
+    python database/benchmark_models.py images/ --profiles accurate,balanced,fast,light
+
+Độ chính xác:
+- detect_rate: tỉ lệ ảnh phát hiện được ít nhất một khuôn mặt
+- rank1: nhận diện leave-one-out (mỗi ảnh so với các ảnh còn lại, đúng nếu ảnh gần nhất cùng người),
+  tính trong không gian embedding của chính profile đó
+"""
+
+import argparse
+import os
+import sys
+import time
+import numpy as np
+from dotenv import load_dotenv
+
+# Load biến môi trường từ file .env
+load_dotenv()
+
+# Thêm thư mục gốc của project vào path để tìm module service
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+
+import cv2
+from service.face_engine import detect_and_embed, detect_faces
+from service.gallery import normalize_rows
+from service.model_profiles import MODEL_PROFILES, ModelRegistry
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+
+
+def load_image_set(folder):
+    """Trả về [(nhãn người, đường dẫn ảnh)]"""
+    items = []
+    for person in sorted(os.listdir(folder)):
+        person_dir = os.path.join(folder, person)
+        if not os.path.isdir(person_dir):
+            continue
+        for fname in sorted(os.listdir(person_dir)):
+            if os.path.splitext(fname)[1].lower() in IMAGE_EXTENSIONS:
+                items.append((person, os.path.join(person_dir, fname)))
+    return items
+
+
+def rank1_accuracy(labels, embeddings):
+    """Leave-one-out: tỉ lệ ảnh có ảnh gần nhất (trừ chính nó) cùng người"""
+    labels = np.asarray(labels)
+    # Chỉ tính ảnh của người có từ 2 ảnh trở lên
+    counts = {label: int((labels == label).sum()) for label in set(labels)}
+    keep = np.array([counts[label] > 1 for label in labels])
+    if keep.sum() < 2:
+        return None
+    matrix = normalize_rows(np.asarray(embeddings, dtype=np.float32))
+    scores = matrix @ matrix.T
+    np.fill_diagonal(scores, -np.inf)
+    nearest = scores.argmax(axis=1)
+    return float((labels[nearest] == labels)[keep].mean())
+
+
+def benchmark_profile(registry, name, images):
+    """Đo một profile trên toàn bộ ảnh đã giải mã"""
+    start = time.perf_counter()
+    profile = registry.get(name)
+    load_s = time.perf_counter() - start
+
+    latencies, labels, embeddings = [], [], []
+    detected = 0
+    for label, img in images:
+        start = time.perf_counter()
+        if profile.recognition:
+            emb, bboxes = detect_and_embed(profile.model, img, first_only=True, det_size=profile.det_size)
+        else:
+            bboxes, _ = detect_faces(profile.model, img, det_size=profile.det_size)
+            emb = None
+        latencies.append((time.perf_counter() - start) * 1000)
+        if len(bboxes):
+            detected += 1
+            if emb is not None and len(emb):
+                labels.append(label)
+                embeddings.append(emb[0])
+
+    latencies = np.asarray(latencies)
+    return {
+        'load_s': load_s,
+        'latency_ms_p50': float(np.percentile(latencies, 50)),
+        'latency_ms_p99': float(np.percentile(latencies, 99)),
+        'detect_rate': detected / len(images),
+        'rank1': rank1_accuracy(labels, embeddings) if embeddings else None,
+    }
+
+
+def main():
+    """Hàm chính"""
+    parser = argparse.ArgumentParser(description="Benchmark model profile")
+    parser.add_argument('images', help="Thư mục ảnh, mỗi người một thư mục con")
+    parser.add_argument('--profiles', default=','.join(MODEL_PROFILES),
+                        help="Danh sách profile, phân tách bởi dấu phẩy")
+    args = parser.parse_args()
+
+    items = load_image_set(args.images)
+    if not items:
+        print("✗ Không tìm thấy ảnh nào")
+        sys.exit(1)
+    images = [(label, img) for label, img in ((label, cv2.imread(path)) for label, path in items)
+              if img is not None]
+
+    print("=" * 60)
+    print(f"BENCHMARK MODEL PROFILE: {len(images)} ảnh, {len(set(l for l, _ in images))} người")
+    print("=" * 60)
+
+    registry = ModelRegistry(ctx_id=-1)
+    for name in args.profiles.split(','):
+        name = name.strip()
+        try:
+            result = benchmark_profile(registry, name, images)
+        except Exception as e:
+            print(f"✗ {name:10s} lỗi: {e}")
+            continue
+        rank1 = f"{result['rank1']:.3f}" if result['rank1'] is not None else "-"
+        print(f"✓ {name:10s} load={result['load_s']:.1f}s "
+              f"p50={result['latency_ms_p50']:.1f}ms p99={result['latency_ms_p99']:.1f}ms "
+              f"detect={result['detect_rate']:.3f} rank1={rank1}")
+
+
+if __name__ == "__main__":
+    main()
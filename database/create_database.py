@@ -64,10 +64,15 @@ CREATE TABLE students (
 CREATE TABLE face_embeddings (
     embedding_id INT PRIMARY KEY AUTO_INCREMENT,
     student_id INT NOT NULL,
-    embedding_json LONGTEXT NOT NULL,
+    embedding_blob BLOB NOT NULL,        -- vector little-endian (float32/float16/int8)
+    embedding_dtype ENUM('float32','float16','int8') NOT NULL DEFAULT 'float32',
+    embedding_scale FLOAT,               -- hệ số lượng tử hoá cho int8
     image_url VARCHAR(255),
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    FOREIGN KEY (student_id) REFERENCES students(student_id)
+    FOREIGN KEY (student_id) REFERENCES students(student_id),
+
+    -- Ảnh mẫu mới nhất của mỗi học sinh (ROW_NUMBER theo student_id)
+    INDEX idx_embeddings_student_id (student_id, embedding_id)
 );
 
 -- ===========================================================
@@ -78,7 +83,15 @@ CREATE TABLE cameras (
     camera_id INT PRIMARY KEY AUTO_INCREMENT,
     camera_name VARCHAR(50),
     location VARCHAR(100),
-    ip_address VARCHAR(50)
+    ip_address VARCHAR(50),
+    -- Nguồn video: rtsp://, http(s):// (MJPEG hoặc ảnh snapshot) hoặc đường dẫn file video
+    stream_url VARCHAR(500),
+    class_id INT,
+    sample_fps FLOAT,
+    -- Tỉ lệ điểm ảnh thay đổi tối thiểu để chạy detect (NULL: mặc định, 0: tắt lọc chuyển động)
+    motion_threshold FLOAT,
+
+    FOREIGN KEY (class_id) REFERENCES classes(class_id) ON DELETE SET NULL
 );
 
 -- ===========================================================
@@ -90,6 +103,7 @@ CREATE TABLE attendance (
     student_id INT NOT NULL,
     class_id INT NOT NULL,
     timestamp DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    attendance_day DATE AS (DATE(timestamp)) STORED,
     session ENUM('morning','afternoon','evening') NOT NULL,
     status ENUM('present','absent','late','excused') NOT NULL,
     method ENUM('face_recognition','manual') DEFAULT 'face_recognition',
@@ -100,7 +114,31 @@ CREATE TABLE attendance (
     FOREIGN KEY (class_id) REFERENCES classes(class_id),
     FOREIGN KEY (camera_id) REFERENCES cameras(camera_id),
 
-    INDEX idx_attendance_student_date (student_id, timestamp)
+    -- Mỗi học sinh một bản ghi cho (lớp, buổi, ngày); camera ghi bằng INSERT ... ON DUPLICATE KEY UPDATE
+    UNIQUE KEY uniq_attendance_student_class_session_day (student_id, class_id, session, attendance_day),
+
+    -- Index theo các truy vấn của AttendanceRepository (kèm status để COUNT/SUM không cần đọc bảng)
+    INDEX idx_attendance_student_time (student_id, timestamp, status),
+    INDEX idx_attendance_class_time (class_id, timestamp, status),
+    INDEX idx_attendance_status_time (status, timestamp),
+    INDEX idx_attendance_session_time (session, timestamp),
+    INDEX idx_attendance_timestamp (timestamp)
+);
+
+-- ===========================================================
+-- 7. Bảng tổng hợp điểm danh theo ngày (cho thống kê)
+-- ===========================================================
+
+CREATE TABLE attendance_daily_rollup (
+    class_id INT NOT NULL,
+    student_id INT NOT NULL,
+    day DATE NOT NULL,
+    session ENUM('morning','afternoon','evening') NOT NULL,
+    status ENUM('present','absent','late','excused') NOT NULL,
+    record_count INT NOT NULL DEFAULT 0,
+
+    PRIMARY KEY (class_id, day, student_id, session, status),
+    INDEX idx_rollup_student_day (student_id, day)
 );
 """
 
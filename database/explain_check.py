@@ -0,0 +1,125 @@
+"""
+Script kiểm tra EXPLAIN các truy vấn điểm danh thường dùng
+Báo lỗi (exit code 1) nếu còn truy vấn quét toàn bộ bảng attendance hoặc
+attendance_daily_rollup (type = ALL).
+
+Chạy sau khi đã migrate và có dữ liệu:
+    python database/explain_check.py
+
+Lưu ý: với bảng rất nhỏ MySQL có thể chủ động chọn quét toàn bảng vì rẻ hơn,
+nên kết quả có ý nghĩa nhất khi chạy trên dữ liệu có kích thước thực tế.
+"""
+
+import os
+import sys
+from datetime import date, timedelta
+from dotenv import load_dotenv
+
+# Load biến môi trường từ file .env
+load_dotenv()
+
+# Thêm thư mục gốc của project vào path để tìm module service
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+
+from service import db, AttendanceRepository
+
+# Các truy vấn cần kiểm tra: (tên, hàm gọi repository với bộ tham số mẫu)
+HOT_QUERIES = [
+    ("get_attendance_by_date",
+     lambda p: AttendanceRepository.get_attendance_by_date(p['day'])),
+    ("get_attendance_by_class_and_date",
+     lambda p: AttendanceRepository.get_attendance_by_class_and_date(p['class_id'], p['day'])),
+    ("get_attendance_by_class",
+     lambda p: AttendanceRepository.get_attendance_by_class(p['class_id'])),
+    ("get_attendance_by_student",
+     lambda p: AttendanceRepository.get_attendance_by_student(p['student_id'])),
+    ("get_attendance_by_status",
+     lambda p: AttendanceRepository.get_attendance_by_status('present')),
+    ("get_attendance_by_session",
+     lambda p: AttendanceRepository.get_attendance_by_session('morning')),
+    ("get_attendance_statistics_by_class",
+     lambda p: AttendanceRepository.get_attendance_statistics_by_class(
+         p['class_id'], p['day'] - timedelta(days=30), p['day'])),
+    ("get_student_attendance_summary",
+     lambda p: AttendanceRepository.get_student_attendance_summary(
+         p['student_id'], p['day'] - timedelta(days=30), p['day'])),
+    ("get_attendance_page",
+     lambda p: AttendanceRepository.get_attendance_page(limit=100)),
+]
+
+# Bảng (hoặc alias) cần kiểm tra; các truy vấn thống kê đọc từ attendance_daily_rollup
+CHECKED_TABLES = ('a', 'attendance', 'attendance_daily_rollup')
+
+
+def capture_queries(call, sample):
+    """Chạy hàm repository nhưng chỉ ghi lại (query, params) thay vì thực thi"""
+    captured = []
+
+    def recorder(query, params=None):
+        captured.append((query, params))
+        return []
+
+    db.execute_query = recorder
+    try:
+        call(sample)
+    finally:
+        del db.execute_query
+    return captured
+
+
+def sample_params():
+    """Lấy bộ tham số mẫu từ bản ghi điểm danh mới nhất"""
+    rows = db.execute_query("""
+        SELECT student_id, class_id, timestamp
+        FROM attendance
+        ORDER BY attendance_id DESC
+        LIMIT 1
+    """)
+    if rows:
+        return {
+            'student_id': rows[0]['student_id'],
+            'class_id': rows[0]['class_id'],
+            'day': rows[0]['timestamp'].date(),
+        }
+    return {'student_id': 1, 'class_id': 1, 'day': date.today()}
+
+
+def main():
+    """Hàm chính"""
+    print("=" * 60)
+    print("KIỂM TRA EXPLAIN CÁC TRUY VẤN ĐIỂM DANH")
+    print("=" * 60)
+
+    if not db.connect():
+        print("✗ Không thể kết nối database!")
+        sys.exit(1)
+
+    failures = []
+    try:
+        sample = sample_params()
+        for name, call in HOT_QUERIES:
+            for query, params in capture_queries(call, sample):
+                plan = db.execute_query("EXPLAIN " + query, params)
+                for row in plan:
+                    table = row.get('table')
+                    access = row.get('type')
+                    line = (f"{name:40s} {str(table):24s} type={str(access):6s} "
+                            f"key={row.get('key')} rows={row.get('rows')}")
+                    if table in CHECKED_TABLES and access == 'ALL':
+                        failures.append(name)
+                        print(f"✗ {line}")
+                    elif table in CHECKED_TABLES:
+                        print(f"✓ {line}")
+    finally:
+        db.disconnect()
+
+    if failures:
+        print(f"\n✗ Còn quét toàn bảng attendance/attendance_daily_rollup ở: {', '.join(sorted(set(failures)))}")
+        print("  Hãy chạy python database/migrate.py để tạo index.")
+        sys.exit(1)
+    print("\n✓ Không truy vấn nào quét toàn bảng attendance/attendance_daily_rollup")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Script nhập hàng loạt học sinh kèm ảnh khuôn mặt vào database
+
+CSV gồm các cột: full_name, student_code, class_id, date_of_birth, gender, photo
+(photo là tên file ảnh trong file zip hoặc thư mục ảnh).
+
+Chạy:
+    python database/import_students.py roster.csv --photos photos.zip
+    python database/import_students.py roster.csv --photos ./photos --chunk-size 500 --workers 8
+
+Có thể chạy lại cùng lệnh nếu bị ngắt giữa chừng: học sinh đã có student_code trong DB được bỏ qua.
+"""
+
+import argparse
+import json
+import os
+import sys
+from dotenv import load_dotenv
+
+# Load biến môi trường từ file .env
+load_dotenv()
+
+# Thêm thư mục gốc của project vào path để tìm module service
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+
+from service import db
+from service.model_profiles import DEFAULT_MODEL_PROFILE, ModelRegistry
+from service.student_import import (
+    IMPORT_CHUNK_SIZE, FaceEmbedder, PhotoSource, StudentImporter, parse_roster
+)
+
+
+def print_progress(state):
+    """In tiến độ trên một dòng"""
+    print(f"\r  {state['processed']}/{state['total']} dòng - "
+          f"thêm {state['inserted']}, bỏ qua {state['skipped']}, lỗi {state['failed']}",
+          end='', flush=True)
+
+
+def main():
+    """Hàm chính"""
+    parser = argparse.ArgumentParser(description="Nhập hàng loạt học sinh kèm ảnh")
+    parser.add_argument('csv', help="File CSV danh sách học sinh")
+    parser.add_argument('--photos', required=True, help="File zip hoặc thư mục chứa ảnh")
+    parser.add_argument('--chunk-size', type=int, default=IMPORT_CHUNK_SIZE,
+                        help="Số học sinh mỗi transaction")
+    parser.add_argument('--workers', type=int, default=4, help="Số thread detect khuôn mặt")
+    parser.add_argument('--profile', default=os.getenv('ENROLL_MODEL_PROFILE', DEFAULT_MODEL_PROFILE),
+                        help="Model profile dùng để tính embedding")
+    parser.add_argument('--image-dir', default=os.path.join(project_root, 'data', 'images'),
+                        help="Thư mục lưu ảnh đại diện (để trống để không lưu)")
+    parser.add_argument('--errors', help="Ghi danh sách lỗi từng dòng ra file JSON")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("NHẬP HÀNG LOẠT HỌC SINH")
+    print("=" * 60)
+
+    with open(args.csv, 'rb') as f:
+        try:
+            rows, errors = parse_roster(f.read())
+        except ValueError as e:
+            print(f"✗ {e}")
+            sys.exit(1)
+
+    if os.path.isdir(args.photos):
+        photos = PhotoSource(folder=args.photos)
+    else:
+        with open(args.photos, 'rb') as f:
+            photos = PhotoSource(zip_bytes=f.read())
+
+    if args.image_dir:
+        os.makedirs(args.image_dir, exist_ok=True)
+
+    if not db.connect():
+        print("✗ Không thể kết nối database!")
+        sys.exit(1)
+
+    print(f"Nạp model ({args.profile})...")
+    embedder = FaceEmbedder(ModelRegistry(ctx_id=-1).get(args.profile), workers=args.workers)
+    importer = StudentImporter(
+        embedder,
+        photos,
+        chunk_size=args.chunk_size,
+        image_dir=args.image_dir or None,
+        progress=print_progress
+    )
+    try:
+        state = importer.run(rows, errors)
+    finally:
+        embedder.close()
+        db.disconnect()
+    print()
+
+    for error in state['errors'][:20]:
+        print(f"  ✗ dòng {error['row']} ({error['student_code']}): {error['error']}")
+    if len(state['errors']) > 20:
+        print(f"  ... và {len(state['errors']) - 20} lỗi khác")
+    if args.errors:
+        with open(args.errors, 'w', encoding='utf-8') as f:
+            json.dump(state['errors'], f, ensure_ascii=False, indent=2)
+        print(f"Đã ghi danh sách lỗi vào {args.errors}")
+
+    if state['status'] != 'done':
+        print(f"✗ Dừng giữa chừng: {state.get('error')}. Chạy lại lệnh để tiếp tục.")
+        sys.exit(1)
+    print(f"✓ Hoàn tất: thêm {state['inserted']}, bỏ qua {state['skipped']}, lỗi {state['failed']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,426 @@
+"""
+Script chạy các migration có đánh số phiên bản cho database đã tồn tại
+Phiên bản đã áp dụng được lưu trong bảng schema_migrations.
+
+Cách dùng:
+    python database/migrate.py              # áp dụng mọi migration còn thiếu
+    python database/migrate.py --status     # xem trạng thái
+    python database/migrate.py --rebuild-rollup  # tính lại bảng attendance_daily_rollup
+"""
+
+import argparse
+import json
+import os
+import sys
+
+import mysql.connector
+from mysql.connector import Error
+from dotenv import load_dotenv
+
+# Load biến môi trường từ file .env
+load_dotenv()
+
+# Thêm thư mục gốc của project vào path để tìm module service
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+
+from service.db_connection import DatabaseConnection
+from service.embedding_codec import encode_embedding, DEFAULT_EMBEDDING_DTYPE
+
+BATCH_SIZE = 1000
+
+
+# ===========================================================
+# Helpers
+# ===========================================================
+
+def column_exists(cursor, table: str, column: str) -> bool:
+    """Kiểm tra cột đã tồn tại trong bảng chưa"""
+    cursor.execute(
+        """
+        SELECT COUNT(*) FROM information_schema.columns
+        WHERE table_schema = DATABASE() AND table_name = %s AND column_name = %s
+        """,
+        (table, column)
+    )
+    return cursor.fetchone()[0] > 0
+
+
+def index_exists(cursor, table: str, index: str) -> bool:
+    """Kiểm tra index đã tồn tại trong bảng chưa"""
+    cursor.execute(
+        """
+        SELECT COUNT(*) FROM information_schema.statistics
+        WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s
+        """,
+        (table, index)
+    )
+    return cursor.fetchone()[0] > 0
+
+
+# ===========================================================
+# 1. embedding_json LONGTEXT -> embedding_blob BLOB
+# ===========================================================
+
+def migrate_binary_embeddings(connection, embedding_dtype: str = None):
+    """Chuyển embedding JSON sang BLOB nhị phân, theo từng lô"""
+    cursor = connection.cursor()
+
+    if not column_exists(cursor, 'face_embeddings', 'embedding_blob'):
+        cursor.execute("""
+            ALTER TABLE face_embeddings
+            ADD COLUMN embedding_blob BLOB NULL AFTER student_id,
+            ADD COLUMN embedding_dtype ENUM('float32','float16','int8') NOT NULL DEFAULT 'float32' AFTER embedding_blob,
+            ADD COLUMN embedding_scale FLOAT NULL AFTER embedding_dtype
+        """)
+
+    if column_exists(cursor, 'face_embeddings', 'embedding_json'):
+        last_id = 0
+        converted = 0
+        invalid_ids = []
+        while True:
+            cursor.execute(
+                """
+                SELECT embedding_id, embedding_json FROM face_embeddings
+                WHERE embedding_id > %s AND embedding_blob IS NULL
+                ORDER BY embedding_id
+                LIMIT %s
+                """,
+                (last_id, BATCH_SIZE)
+            )
+            rows = cursor.fetchall()
+            if not rows:
+                break
+
+            params = []
+            for embedding_id, embedding_json in rows:
+                try:
+                    blob, dtype, scale = encode_embedding(json.loads(embedding_json), embedding_dtype)
+                except (TypeError, ValueError):
+                    invalid_ids.append(embedding_id)
+                    continue
+                params.append((blob, dtype, scale, embedding_id))
+
+            cursor.executemany(
+                """
+                UPDATE face_embeddings
+                SET embedding_blob = %s, embedding_dtype = %s, embedding_scale = %s
+                WHERE embedding_id = %s
+                """,
+                params
+            )
+            connection.commit()
+            converted += len(params)
+            last_id = rows[-1][0]
+            print(f"   ✓ Đã chuyển {converted} embedding...")
+
+        if invalid_ids:
+            raise RuntimeError(
+                f"Không đọc được embedding_json của các bản ghi: {invalid_ids[:20]} "
+                f"({len(invalid_ids)} bản ghi). Hãy sửa hoặc xoá rồi chạy lại."
+            )
+
+        cursor.execute("ALTER TABLE face_embeddings DROP COLUMN embedding_json")
+
+    cursor.execute("ALTER TABLE face_embeddings MODIFY embedding_blob BLOB NOT NULL")
+    cursor.close()
+
+
+# ===========================================================
+# 2. Index cho phân trang keyset của /api/attendance
+# ===========================================================
+
+def add_attendance_timestamp_index(connection):
+    """Index (timestamp) - InnoDB tự kèm khoá chính nên phục vụ được ORDER BY (timestamp, attendance_id)"""
+    cursor = connection.cursor()
+    if not index_exists(cursor, 'attendance', 'idx_attendance_timestamp'):
+        cursor.execute("CREATE INDEX idx_attendance_timestamp ON attendance (timestamp)")
+    cursor.close()
+
+
+# ===========================================================
+# 3. Index phủ cho các truy vấn điểm danh theo lớp/học sinh/trạng thái/ca
+# ===========================================================
+
+ATTENDANCE_INDEXES = {
+    # get_student_attendance_summary, get_attendance_by_student
+    'idx_attendance_student_time': '(student_id, timestamp, status)',
+    # get_attendance_by_class(_and_date), get_attendance_statistics_by_class
+    'idx_attendance_class_time': '(class_id, timestamp, status)',
+    # get_attendance_by_status
+    'idx_attendance_status_time': '(status, timestamp)',
+    # get_attendance_by_session
+    'idx_attendance_session_time': '(session, timestamp)',
+}
+
+
+def add_attendance_covering_indexes(connection):
+    """Tạo các index phủ và bỏ idx_attendance_student_date (đã bị idx_attendance_student_time thay thế)"""
+    cursor = connection.cursor()
+    for name, columns in ATTENDANCE_INDEXES.items():
+        if not index_exists(cursor, 'attendance', name):
+            print(f"   → Tạo index {name} {columns}")
+            cursor.execute(f"CREATE INDEX {name} ON attendance {columns}")
+    if index_exists(cursor, 'attendance', 'idx_attendance_student_date'):
+        cursor.execute("DROP INDEX idx_attendance_student_date ON attendance")
+    cursor.close()
+
+
+# ===========================================================
+# 4. Bảng tổng hợp điểm danh theo ngày
+# ===========================================================
+
+def create_attendance_rollup(connection):
+    """Tạo attendance_daily_rollup và tính lại toàn bộ từ bảng attendance"""
+    cursor = connection.cursor()
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS attendance_daily_rollup (
+            class_id INT NOT NULL,
+            student_id INT NOT NULL,
+            day DATE NOT NULL,
+            session ENUM('morning','afternoon','evening') NOT NULL,
+            status ENUM('present','absent','late','excused') NOT NULL,
+            record_count INT NOT NULL DEFAULT 0,
+
+            PRIMARY KEY (class_id, day, student_id, session, status),
+            INDEX idx_rollup_student_day (student_id, day)
+        )
+    """)
+    rebuild_attendance_rollup(connection)
+    cursor.close()
+
+
+def rebuild_attendance_rollup(connection):
+    """Tính lại rollup từ attendance (dùng khi backfill hoặc sửa lệch số liệu)
+
+    Chạy dưới LOCK TABLES (attendance READ, rollup WRITE): điểm danh ghi trong lúc tính lại phải
+    chờ tới khi xong, nên không bị đếm hai lần hay bị mất. Ghi điểm danh bị chặn trong suốt thời
+    gian tính lại, nên với bảng attendance lớn nên chạy ngoài giờ học.
+    """
+    cursor = connection.cursor()
+    # LOCK TABLES với bảng InnoDB cần autocommit = 0 để DELETE + INSERT nằm trong một transaction
+    connection.autocommit = False
+    cursor.execute("LOCK TABLES attendance READ, attendance_daily_rollup WRITE")
+    try:
+        cursor.execute("DELETE FROM attendance_daily_rollup")
+        cursor.execute("""
+            INSERT INTO attendance_daily_rollup
+            (class_id, student_id, day, session, status, record_count)
+            SELECT class_id, student_id, DATE(timestamp), session, status, COUNT(*)
+            FROM attendance
+            GROUP BY class_id, student_id, DATE(timestamp), session, status
+        """)
+        rows = cursor.rowcount
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        cursor.execute("UNLOCK TABLES")
+        cursor.close()
+    print(f"   ✓ Đã tổng hợp {rows} dòng rollup")
+
+
+# ===========================================================
+# 5. Nguồn stream của camera cho dịch vụ đọc camera
+# ===========================================================
+
+def add_camera_stream_columns(connection):
+    """Thêm stream_url, class_id (lớp học trong phòng camera) và sample_fps vào cameras"""
+    cursor = connection.cursor()
+    if not column_exists(cursor, 'cameras', 'stream_url'):
+        cursor.execute("""
+            ALTER TABLE cameras
+            ADD COLUMN stream_url VARCHAR(500) NULL AFTER ip_address,
+            ADD COLUMN class_id INT NULL AFTER stream_url,
+            ADD COLUMN sample_fps FLOAT NULL AFTER class_id,
+            ADD FOREIGN KEY (class_id) REFERENCES classes(class_id) ON DELETE SET NULL
+        """)
+    cursor.close()
+
+
+# ===========================================================
+# 6. Ngưỡng lọc chuyển động riêng cho từng camera
+# ===========================================================
+
+def add_camera_motion_threshold(connection):
+    """Thêm motion_threshold (tỉ lệ điểm ảnh thay đổi để chạy detect; NULL: mặc định, 0: tắt lọc)"""
+    cursor = connection.cursor()
+    if not column_exists(cursor, 'cameras', 'motion_threshold'):
+        cursor.execute("ALTER TABLE cameras ADD COLUMN motion_threshold FLOAT NULL AFTER sample_fps")
+    cursor.close()
+
+
+# ===========================================================
+# 7. Index cho truy vấn ảnh mẫu mới nhất của mỗi học sinh
+# ===========================================================
+
+def add_embedding_student_index(connection):
+    """Index face_embeddings(student_id, embedding_id) cho ROW_NUMBER() OVER (PARTITION BY student_id ...)"""
+    cursor = connection.cursor()
+    if not index_exists(cursor, 'face_embeddings', 'idx_embeddings_student_id'):
+        cursor.execute("CREATE INDEX idx_embeddings_student_id ON face_embeddings (student_id, embedding_id)")
+    cursor.close()
+
+
+# ===========================================================
+# 8. Mỗi học sinh một bản ghi cho (lớp, buổi, ngày)
+# ===========================================================
+
+DUPLICATE_ATTENDANCE_QUERY = """
+    DELETE a FROM attendance a
+    JOIN attendance keep
+      ON keep.student_id = a.student_id
+     AND keep.class_id = a.class_id
+     AND keep.session = a.session
+     AND DATE(keep.timestamp) = DATE(a.timestamp)
+     AND keep.attendance_id < a.attendance_id
+"""
+
+
+def add_attendance_unique_day(connection):
+    """Cột sinh attendance_day = DATE(timestamp) và unique key (student_id, class_id, session, attendance_day)
+
+    Bản ghi trùng đã có (ghi đồng thời trước khi có khoá) được xoá, giữ bản ghi sớm nhất,
+    rồi tính lại rollup cho khớp.
+    """
+    cursor = connection.cursor()
+    if not column_exists(cursor, 'attendance', 'attendance_day'):
+        cursor.execute("""
+            ALTER TABLE attendance
+            ADD COLUMN attendance_day DATE AS (DATE(timestamp)) STORED AFTER timestamp
+        """)
+    if not index_exists(cursor, 'attendance', 'uniq_attendance_student_class_session_day'):
+        cursor.execute(DUPLICATE_ATTENDANCE_QUERY)
+        removed = cursor.rowcount
+        connection.commit()
+        if removed:
+            print(f"   → Đã xoá {removed} bản ghi điểm danh trùng")
+            rebuild_attendance_rollup(connection)
+        cursor.execute("""
+            ALTER TABLE attendance
+            ADD UNIQUE KEY uniq_attendance_student_class_session_day
+            (student_id, class_id, session, attendance_day)
+        """)
+    cursor.close()
+
+
+# Danh sách migration theo thứ tự phiên bản: (version, mô tả, hàm)
+MIGRATIONS = [
+    (1, "Lưu embedding dạng BLOB nhị phân thay cho embedding_json", migrate_binary_embeddings),
+    (2, "Index attendance(timestamp) cho phân trang keyset", add_attendance_timestamp_index),
+    (3, "Index phủ cho truy vấn điểm danh theo lớp/học sinh/trạng thái/ca", add_attendance_covering_indexes),
+    (4, "Bảng tổng hợp điểm danh theo ngày attendance_daily_rollup", create_attendance_rollup),
+    (5, "Cột stream_url, class_id, sample_fps cho cameras", add_camera_stream_columns),
+    (6, "Cột motion_threshold cho cameras", add_camera_motion_threshold),
+    (7, "Index face_embeddings(student_id, embedding_id) cho gallery nhiều ảnh mẫu", add_embedding_student_index),
+    (8, "Unique key attendance(student_id, class_id, session, attendance_day) cho điểm danh từ camera", add_attendance_unique_day),
+]
+
+
+# ===========================================================
+# Runner
+# ===========================================================
+
+def ensure_migrations_table(connection):
+    """Tạo bảng schema_migrations nếu chưa có"""
+    cursor = connection.cursor()
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INT PRIMARY KEY,
+            description VARCHAR(255) NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    connection.commit()
+    cursor.close()
+
+
+def get_applied_versions(connection) -> set:
+    """Lấy các phiên bản migration đã áp dụng"""
+    cursor = connection.cursor()
+    cursor.execute("SELECT version FROM schema_migrations")
+    versions = {row[0] for row in cursor.fetchall()}
+    cursor.close()
+    return versions
+
+
+def run_migrations(connection, options: dict = None):
+    """Áp dụng lần lượt các migration chưa chạy
+
+    options: tham số riêng cho từng migration, dạng {version: {tham số}}
+    """
+    options = options or {}
+    ensure_migrations_table(connection)
+    applied = get_applied_versions(connection)
+
+    pending = [m for m in MIGRATIONS if m[0] not in applied]
+    if not pending:
+        print("✓ Database đã ở phiên bản mới nhất")
+        return
+
+    for version, description, migration in pending:
+        print(f"\n→ Migration {version}: {description}")
+        migration(connection, **options.get(version, {}))
+        cursor = connection.cursor()
+        cursor.execute(
+            "INSERT INTO schema_migrations (version, description) VALUES (%s, %s)",
+            (version, description)
+        )
+        connection.commit()
+        cursor.close()
+        print(f"✓ Đã áp dụng migration {version}")
+
+
+def print_status(connection):
+    """In trạng thái các migration"""
+    ensure_migrations_table(connection)
+    applied = get_applied_versions(connection)
+    for version, description, _ in MIGRATIONS:
+        mark = "✓" if version in applied else " "
+        print(f"[{mark}] {version}: {description}")
+
+
+def main():
+    """Hàm chính"""
+    parser = argparse.ArgumentParser(description="Chạy migration cho database ai_attendance")
+    parser.add_argument("--status", action="store_true", help="Chỉ in trạng thái migration")
+    parser.add_argument("--rebuild-rollup", action="store_true", help="Tính lại bảng attendance_daily_rollup")
+    parser.add_argument(
+        "--embedding-dtype",
+        choices=["float32", "float16", "int8"],
+        default=DEFAULT_EMBEDDING_DTYPE,
+        help="Kiểu lưu embedding khi chuyển từ JSON (migration 1)"
+    )
+    args = parser.parse_args()
+
+    config = DatabaseConnection().config
+
+    print("=" * 60)
+    print("MIGRATION DATABASE")
+    print("=" * 60)
+    print(f"Host: {config['host']}")
+    print(f"Database: {config['database']}")
+
+    connection = None
+    try:
+        connection = mysql.connector.connect(**config)
+        if args.status:
+            print_status(connection)
+        elif args.rebuild_rollup:
+            rebuild_attendance_rollup(connection)
+        else:
+            run_migrations(connection, {1: {"embedding_dtype": args.embedding_dtype}})
+    except (Error, RuntimeError) as e:
+        print(f"✗ Lỗi migration: {e}")
+        if connection:
+            connection.rollback()
+        sys.exit(1)
+    finally:
+        if connection and connection.is_connected():
+            connection.close()
+            print("\nĐã đóng kết nối.")
+
+
+if __name__ == "__main__":
+    main()
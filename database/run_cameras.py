@@ -0,0 +1,107 @@
+"""
+Dịch vụ đọc camera: mở nguồn video của từng camera trong bảng cameras, lấy mẫu frame,
+nhận diện theo gallery của lớp (cameras.class_id) và ghi điểm danh kèm camera_id
+
+Nguồn (cameras.stream_url): rtsp://..., http(s)://... (stream MJPEG hoặc ảnh snapshot
+.jpg / đường dẫn chứa "snapshot") hoặc đường dẫn file video.
+
+Chạy:
+    python database/run_cameras.py
+    python database/run_cameras.py --fps 2 --profile fast
+    python database/run_cameras.py --source 1=tests/lop_10a1.mp4   # thay nguồn camera 1 bằng file video
+
+Với nguồn file (không --loop), dịch vụ dừng khi mọi file đã đọc xong.
+Frame không đổi so với frame đã xử lý gần nhất được bỏ qua trước bước detect (tắt: --no-motion-gate).
+Khuôn mặt được theo dõi qua các frame: mỗi người chỉ embedding tới khi được xác nhận k / n frame
+(TRACK_VOTE_K / TRACK_VOTE_N), sau đó chỉ kiểm tra lại định kỳ (tắt: --no-tracking).
+Cần chạy migration 5, 6 (python database/migrate.py) để bảng cameras có stream_url, class_id,
+sample_fps, motion_threshold.
+"""
+
+import argparse
+import json
+import os
+import sys
+from dotenv import load_dotenv
+
+# Load biến môi trường từ file .env
+load_dotenv()
+
+# Thêm thư mục gốc của project vào path để tìm module service
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+
+from service import db
+from service.camera_ingest import CameraIngestionService, FrameRecognizer
+from service.motion_gate import MOTION_METHOD, MOTION_METHODS, CameraMotionGates
+from service.model_profiles import DEFAULT_MODEL_PROFILE, ModelRegistry, check_compatible
+
+
+def parse_sources(values):
+    """--source CAMERA_ID=URL -> {camera_id: url}"""
+    sources = {}
+    for value in values or []:
+        camera_id, sep, url = value.partition('=')
+        if not sep or not camera_id.isdigit():
+            raise ValueError(f"--source phải có dạng CAMERA_ID=URL: {value}")
+        sources[int(camera_id)] = url
+    return sources
+
+
+def main():
+    """Hàm chính"""
+    parser = argparse.ArgumentParser(description="Dịch vụ đọc camera và điểm danh tự động")
+    parser.add_argument('--profile', default=DEFAULT_MODEL_PROFILE, help="Model profile dùng để nhận diện")
+    parser.add_argument('--fps', type=float, help="Số frame xử lý mỗi giây (mặc định theo cameras.sample_fps)")
+    parser.add_argument('--source', action='append', help="Thay nguồn camera: CAMERA_ID=URL (lặp lại được)")
+    parser.add_argument('--loop', action='store_true', help="Đọc lại file video từ đầu khi hết")
+    parser.add_argument('--no-motion-gate', action='store_true', help="Chạy detect trên mọi frame lấy mẫu")
+    parser.add_argument('--motion-method', default=MOTION_METHOD, choices=MOTION_METHODS,
+                        help="Cách so sánh frame để bỏ qua cảnh không đổi")
+    parser.add_argument('--no-tracking', action='store_true',
+                        help="Không theo dõi khuôn mặt: embedding mọi khuôn mặt ở mọi frame")
+    parser.add_argument('--refresh', type=float, default=60, help="Số giây giữa các lần đọc lại bảng cameras")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("DỊCH VỤ ĐỌC CAMERA")
+    print("=" * 60)
+
+    try:
+        sources = parse_sources(args.source)
+        # Embedding trong DB được tính bằng profile ghi danh
+        check_compatible(args.profile, os.getenv('ENROLL_MODEL_PROFILE', DEFAULT_MODEL_PROFILE))
+    except ValueError as e:
+        print(f"✗ {e}")
+        sys.exit(1)
+
+    if not db.connect():
+        print("✗ Không thể kết nối database!")
+        sys.exit(1)
+
+    print(f"Nạp model ({args.profile})...")
+    recognizer = FrameRecognizer(ModelRegistry(ctx_id=-1).get(args.profile))
+    motion_gates = None if args.no_motion_gate else CameraMotionGates(method=args.motion_method)
+    service = CameraIngestionService(recognizer, sample_fps=args.fps, sources=sources, loop=args.loop,
+                                     on_frame=motion_gates, tracking=not args.no_tracking)
+    if not service.load_cameras():
+        print("✗ Không có camera nào có stream_url và class_id")
+        db.disconnect()
+        sys.exit(1)
+
+    try:
+        service.run(refresh_s=args.refresh)
+    except KeyboardInterrupt:
+        print("\nĐang dừng...")
+        service.stop()
+    finally:
+        db.disconnect()
+
+    print(json.dumps(service.metrics(), ensure_ascii=False, indent=2))
+    if motion_gates is not None:
+        print("Lọc chuyển động:")
+        print(json.dumps(motion_gates.metrics(), ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -7,6 +7,8 @@ const DataViewer = ({ tableName, onClose }) => {
   const [loading, setLoading] = useState(true)
   const [error, setError] = useState(null)
   const [selectedItem, setSelectedItem] = useState(null)
+  const [nextCursor, setNextCursor] = useState(null)
+  const [loadingMore, setLoadingMore] = useState(false)
 
   const endpoints = {
     teachers: '/api/teachers',
@@ -21,13 +23,20 @@ const DataViewer = ({ tableName, onClose }) => {
     fetchData()
   }, [tableName])
 
+  // Các endpoint phân trang trả về { items, next_cursor }
+  const applyResponse = (payload, append) => {
+    const items = Array.isArray(payload) ? payload : payload.items
+    setData((prev) => (append ? [...prev, ...items] : items))
+    setNextCursor(Array.isArray(payload) ? null : payload.next_cursor)
+  }
+
   const fetchData = async () => {
     setLoading(true)
     setError(null)
     try {
       const endpoint = endpoints[tableName]
       const response = await axios.get(endpoint)
-      setData(response.data)
+      applyResponse(response.data, false)
     } catch (err) {
       setError(err.message)
       console.error('Error fetching data:', err)
@@ -36,6 +45,21 @@ const DataViewer = ({ tableName, onClose }) => {
     }
   }
 
+  const fetchMore = async () => {
+    if (!nextCursor) return
+    setLoadingMore(true)
+    try {
+      const endpoint = endpoints[tableName]
+      const response = await axios.get(endpoint, { params: { cursor: nextCursor } })
+      applyResponse(response.data, true)
+    } catch (err) {
+      setError(err.message)
+      console.error('Error fetching more data:', err)
+    } finally {
+      setLoadingMore(false)
+    }
+  }
+
   const formatValue = (value) => {
     if (value === null || value === undefined) return '-'
     if (typeof value === 'boolean') return value ? 'Có' : 'Không'
@@ -84,7 +108,9 @@ const DataViewer = ({ tableName, onClose }) => {
           {tableName === 'attendance' && '✅ Điểm danh'}
         </h2>
         <div className="header-actions">
-          <span className="count">Tổng: {data.length} bản ghi</span>
+          <span className="count">
+            {nextCursor ? `Đã tải: ${data.length} bản ghi` : `Tổng: ${data.length} bản ghi`}
+          </span>
           <button onClick={fetchData} className="refresh-btn">🔄 Làm mới</button>
           <button onClick={onClose} className="close-btn">✕ Đóng</button>
         </div>
@@ -125,6 +151,13 @@ const DataViewer = ({ tableName, onClose }) => {
               ))}
             </tbody>
           </table>
+          {nextCursor && (
+            <div className="load-more">
+              <button onClick={fetchMore} className="refresh-btn" disabled={loadingMore}>
+                {loadingMore ? 'Đang tải...' : 'Tải thêm'}
+              </button>
+            </div>
+          )}
         </div>
       )}
 
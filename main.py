@@ -1,51 +1,325 @@
-from fastapi import FastAPI, UploadFile, File, Form
+from fastapi import FastAPI, HTTPException, UploadFile, File, Form
+from fastapi.responses import JSONResponse
+from contextlib import asynccontextmanager
+from typing import List
 from app.db import db
 from app.models import Teacher, Class, Student, Attendance
-import os, io, asyncio
-from PIL import Image
+import os, io, gc, asyncio, zipfile
 import numpy as np
 from bson import ObjectId
 from datetime import datetime
 from concurrent.futures import ThreadPoolExecutor
-import insightface
-import cv2
+from service.gallery import ClassGallery, GalleryCache
+from service.face_engine import detect_faces, embed_crops
+from service.image_decode import decode_image
+from service.inference_pool import InferencePool
+from service.batching import BatcherUnavailable, MicroBatcher
+from service.attendance_marker import AttendanceMarker
+from service.recognition_cache import RecognitionCache, NO_FACE, content_hash, perceptual_hash
+from service.face_quality import FaceQualityFilter, reject_message
+from service.model_profiles import (
+    ModelRegistry, DEFAULT_MODEL_PROFILE, get_profile_config, check_compatible
+)
 
-app = FastAPI()
 IMAGE_DIR = "data/images"
 os.makedirs(IMAGE_DIR, exist_ok=True)
 
 executor = ThreadPoolExecutor(max_workers=4)
 
+# Profile model mặc định (MODEL_PROFILE); embedding lưu trong DB được tính bằng pack của profile này
+DEFAULT_PROFILE = DEFAULT_MODEL_PROFILE
+ENROLL_PROFILE = os.getenv('ENROLL_MODEL_PROFILE', DEFAULT_PROFILE)
+check_compatible(ENROLL_PROFILE, DEFAULT_PROFILE)
+_default_config = get_profile_config(DEFAULT_PROFILE)
+
+# Pool worker process cho inference (INFERENCE_WORKERS > 0), None thì chạy model trong process này
+inference_pool = InferencePool.from_env(
+    model_name=_default_config['pack'],
+    det_size=(_default_config['det_size'], _default_config['det_size'])
+)
+
+RECOGNITION_THRESHOLD = 0.7  # ngưỡng 70%
+MAX_BATCH_IMAGES = 64        # số ảnh tối đa trong một request /recognize/batch
+
+# Gallery embedding theo lớp, giữ trong bộ nhớ
+gallery_cache = GalleryCache()
+# Các lần nạp gallery đang chạy theo class_id
+_gallery_loads = {}
+
+# Cache kết quả detect + embedding theo ảnh upload (None nếu RECOGNITION_CACHE_SIZE = 0)
+recognition_cache = RecognitionCache.from_env()
+
+# Lọc khuôn mặt kém chất lượng trước khi embedding (FACE_QUALITY_*), ảnh ghi danh lọc chặt hơn (ENROLL_QUALITY_*)
+quality_filters = {
+    'recognition': FaceQualityFilter.from_env(),
+    'enroll': FaceQualityFilter.for_enrollment(),
+}
+
+# Điểm danh tự động: mỗi học sinh một bản ghi cho mỗi (lớp, buổi, ngày)
+attendance_marker = AttendanceMarker(db.attendance)
+
 # ----------------------
 # Load InsightFace model
 # ----------------------
-face_model = insightface.app.FaceAnalysis(name="buffalo_l")  # model lớn
-face_model.prepare(ctx_id=-1, det_size=(640, 640))           # CPU
+# Model được nạp trong nền khi app khởi động (hoặc ở request đầu tiên cần đến),
+# các endpoint CRUD dùng được ngay mà không phải chờ.
+MODEL_WARMUP = os.getenv('MODEL_WARMUP', '1') == '1'    # chạy thử một lần sau khi nạp
+PRELOAD_MODELS = os.getenv('PRELOAD_MODELS', '0') == '1'  # nạp ngay khi import, trước khi fork worker
+
+# Khi nạp trước fork (gunicorn --preload), session được dựng lại với 1 thread intra-op (không có
+# thread pool, vì thread không còn sau fork) và số thread được đọc lại từ ONNX Runtime để kiểm tra;
+# session mặc định do FaceAnalysis tạo ra bị giải phóng trước khi fork.
+# Các worker con dùng chung trọng số model theo copy-on-write.
+model_registry = ModelRegistry(ctx_id=-1, threads=1 if PRELOAD_MODELS else None)
+model_warmed_up = False
+
+if PRELOAD_MODELS:
+    model_registry.get(DEFAULT_PROFILE)
+    # Đưa các object đã nạp ra khỏi GC để worker con không ghi vào các trang bộ nhớ dùng chung
+    gc.freeze()
+
+# Gom khuôn mặt của các request đồng thời thành một lần chạy model recognition (mỗi pack một batcher)
+embed_batchers = {}
+
+
+def get_embed_batcher(profile):
+    batcher = embed_batchers.get(profile.pack)
+    if batcher is None:
+        model = profile.model
+        batcher = MicroBatcher.from_env(lambda crops: embed_crops(model, crops), executor=executor)
+        embed_batchers[profile.pack] = batcher
+    return batcher
+
+
+def warm_up_inference(profile):
+    """Chạy thử detector + recognition trên ảnh rỗng để ONNX Runtime cấp phát bộ nhớ trước."""
+    dummy = np.zeros((profile.det_size[1], profile.det_size[0], 3), dtype=np.uint8)
+    detect_faces(profile.model, dummy, det_size=profile.det_size)
+    if profile.recognition:
+        image_size = profile.model.models['recognition'].input_size
+        embed_crops(profile.model, [np.zeros((image_size[1], image_size[0], 3), dtype=np.uint8)])
+
+
+async def warm_up_models():
+    """Nạp model mặc định trong nền; request đến trước khi xong sẽ tự chờ nạp."""
+    global model_warmed_up
+    loop = asyncio.get_event_loop()
+    try:
+        if inference_pool is not None:
+            await loop.run_in_executor(executor, inference_pool.wait_ready)
+        else:
+            profile = await get_profile(DEFAULT_PROFILE)
+            if MODEL_WARMUP:
+                await loop.run_in_executor(executor, warm_up_inference, profile)
+        model_warmed_up = True
+        print("Model sẵn sàng")
+    except Exception as e:
+        print("Lỗi nạp model:", e)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    try:
+        await attendance_marker.ensure_indexes()
+    except Exception as e:
+        print("Lỗi tạo index attendance:", e)
+    if inference_pool is not None:
+        inference_pool.start()
+    warm_up_task = asyncio.create_task(warm_up_models())
+    yield
+    warm_up_task.cancel()
+    if inference_pool is not None:
+        inference_pool.stop()
+
+
+app = FastAPI(lifespan=lifespan)
 
 
 # ----------------------
 # Utils
 # ----------------------
-def compute_embedding_insightface(img_bytes):
-    """Chuyển ảnh bytes sang embedding InsightFace."""
+def scale_bboxes(bboxes, scale):
+    """Đưa toạ độ bbox trên ảnh đã thu nhỏ khi giải mã về toạ độ ảnh gốc."""
+    if scale == 1.0 or len(bboxes) == 0:
+        return bboxes
+    bboxes = np.array(bboxes, dtype=np.float32)
+    bboxes[:, :4] /= scale
+    return bboxes
+
+
+def detect_and_align(img_bytes, profile=None, quality='recognition', first_only=False):
+    """Giải mã + phát hiện + lọc chất lượng + căn chỉnh mặt của một ảnh (chưa chạy recognition).
+
+    Trả về (ảnh mặt đã căn chỉnh, bbox tương ứng, lý do loại các mặt không đạt).
+    """
+    profile = profile or model_registry.get(DEFAULT_PROFILE)
     try:
-        img = Image.open(io.BytesIO(img_bytes)).convert("RGB")
-        img_np = np.array(img)
+        # JPEG lớn được giải mã thẳng ở độ phân giải gần với kích thước detector
+        img_bgr, scale = decode_image(img_bytes, min_side=max(profile.det_size))
+        bboxes, kpss = detect_faces(profile.model, img_bgr, det_size=profile.det_size)
+        if first_only:
+            bboxes, kpss = bboxes[:1], kpss[:1]
+        crops, kept, rejected = quality_filters[quality].select(profile.model, img_bgr, bboxes, kpss)
+        return crops, scale_bboxes(bboxes[kept], scale), rejected
+    except Exception as e:
+        print("Lỗi detect_and_align:", e)
+        return [], np.empty((0, 5), dtype=np.float32), []
 
-        # Chuyển RGB sang BGR vì InsightFace dùng OpenCV
-        img_bgr = cv2.cvtColor(img_np, cv2.COLOR_RGB2BGR)
 
-        faces = face_model.get(img_bgr)
-        if not faces:
-            print("Không tìm thấy mặt")
-            return None
+def read_zip_images(zip_bytes):
+    """Đọc các file ảnh trong file zip: trả về [(tên file, bytes)]."""
+    images = []
+    with zipfile.ZipFile(io.BytesIO(zip_bytes)) as zf:
+        for info in zf.infolist():
+            if info.is_dir():
+                continue
+            if os.path.splitext(info.filename)[1].lower() not in (".jpg", ".jpeg", ".png", ".bmp", ".webp"):
+                continue
+            images.append((info.filename, zf.read(info)))
+    return images
 
-        return faces[0].embedding.tolist()
 
+def submit_to_pool(img_bytes, first_only, det_size, quality='recognition'):
+    """Giải mã ảnh rồi gửi frame tới inference worker (chạy trong thread pool vì có thể chờ slot).
+
+    Trả về (Future, tỉ lệ thu nhỏ khi giải mã).
+    """
+    img_bgr, scale = decode_image(img_bytes, min_side=max(det_size))
+    return inference_pool.submit(img_bgr, first_only=first_only, det_size=det_size, quality=quality), scale
+
+
+async def get_profile(name: str = None):
+    """Profile model đã nạp; lần đầu nạp trong thread pool để không chặn event loop."""
+    profile = model_registry.peek(name or DEFAULT_PROFILE)
+    if profile is not None:
+        return profile
+    loop = asyncio.get_event_loop()
+    return await loop.run_in_executor(executor, model_registry.get, name or DEFAULT_PROFILE)
+
+
+async def run_face_inference(content, first_only: bool, profile_name: str, quality: str = 'recognition'):
+    """Detect + lọc chất lượng + embedding một ảnh: (ma trận embedding, danh sách bbox, lý do loại).
+
+    Chạy trên inference worker nếu bật pool, ngược lại detect trong thread pool rồi
+    embedding qua micro-batcher.
+    """
+    loop = asyncio.get_event_loop()
+    if inference_pool is None:
+        profile = await get_profile(profile_name)
+        crops, bboxes, rejected = await loop.run_in_executor(
+            executor, detect_and_align, content, profile, quality, first_only
+        )
+        embeddings = np.asarray(await get_embed_batcher(profile).submit_many(crops), dtype=np.float32)
+    else:
+        # Worker dùng chung pack với profile mặc định, chỉ đổi kích thước detector
+        det_size = get_profile_config(profile_name)['det_size']
+        future, scale = await loop.run_in_executor(
+            executor, submit_to_pool, content, first_only, (det_size, det_size), quality
+        )
+        embeddings, bboxes, rejected = await asyncio.wrap_future(future)
+        bboxes = scale_bboxes(bboxes, scale)
+        # Bộ đếm của worker nằm ở process khác: cộng lại ở đây
+        quality_filters[quality].record(len(bboxes), rejected)
+    return embeddings, [bbox[:4].astype(int).tolist() for bbox in bboxes], rejected
+
+
+def inference_unavailable(error) -> HTTPException:
+    """503 khi micro-batcher quá tải (chờ hàng đợi quá hạn) hoặc worker đã dừng."""
+    print("Không tính được embedding (quá tải):", repr(error))
+    return HTTPException(status_code=503, detail="Máy chủ nhận diện đang quá tải, vui lòng thử lại")
+
+
+def image_cache_keys(content):
+    """sha256 của file và dHash (nếu bật near-duplicate) - chạy trong thread pool."""
+    phash = perceptual_hash(content) if recognition_cache.near_duplicates else None
+    return content_hash(content), phash
+
+
+async def infer_face_embeddings(content, first_only: bool = False, profile_name: str = None,
+                                cache_scope: str = None):
+    """(ma trận embedding, danh sách bbox) của các khuôn mặt trong ảnh, None nếu không có mặt.
+
+    cache_scope: bật cache kết quả cho ảnh này; ảnh gần giống chỉ dùng lại kết quả trong
+    cùng scope (ví dụ cùng lớp).
+    """
+    loop = asyncio.get_event_loop()
+    profile_name = profile_name or DEFAULT_PROFILE
+    use_cache = recognition_cache is not None and cache_scope is not None
+
+    if use_cache:
+        digest, phash = await loop.run_in_executor(executor, image_cache_keys, content)
+        key = (digest, profile_name, first_only)
+        cached = recognition_cache.get(key, cache_scope, phash)
+        if cached is not None:
+            return None if cached is NO_FACE else cached
+
+    try:
+        embeddings, bboxes, _ = await run_face_inference(content, first_only, profile_name)
+    except (asyncio.TimeoutError, BatcherUnavailable) as e:
+        # Quá tải không phải "không có mặt": trả 503 để client thử lại
+        raise inference_unavailable(e)
     except Exception as e:
-        print("Lỗi compute_embedding_insightface:", e)
+        print("Lỗi infer_face_embeddings:", e)
         return None
 
+    detected = (embeddings, bboxes) if len(embeddings) else None
+    if use_cache:
+        recognition_cache.put(key, detected if detected is not None else NO_FACE, cache_scope, phash)
+    if detected is None:
+        print("Không tìm thấy mặt")
+    return detected
+
+
+async def infer_embedding(content, profile_name: str = None, cache_scope: str = None):
+    """Embedding của khuôn mặt rõ nhất trong ảnh (list), None nếu không có mặt."""
+    detected = await infer_face_embeddings(content, first_only=True, profile_name=profile_name,
+                                           cache_scope=cache_scope)
+    return detected[0][0].tolist() if detected is not None else None
+
+
+async def load_class_gallery(class_id: str) -> ClassGallery:
+    """Nạp gallery của lớp từ DB và lưu vào cache.
+
+    Nếu lớp có ghi danh / xoá học sinh trong lúc đọc thì gallery vẫn được trả về cho request
+    hiện tại nhưng không được cache (request sau nạp lại bản mới).
+    """
+    token = gallery_cache.begin_load(class_id)
+    student_ids, names, embeddings = [], [], []
+    try:
+        cursor = db.students.find(
+            {"class_id": class_id},
+            {"name": 1, "face_embedding": 1}
+        )
+        async for student in cursor:
+            if not student.get("face_embedding"):
+                continue
+            student_ids.append(str(student["_id"]))
+            names.append(student["name"])
+            embeddings.append(student["face_embedding"])
+    except BaseException:
+        gallery_cache.end_load(class_id, token)
+        raise
+    gallery = ClassGallery(student_ids, names, embeddings)
+    gallery_cache.put(class_id, gallery, token)
+    return gallery
+
+
+async def get_class_gallery(class_id: str) -> ClassGallery:
+    """Lấy gallery của lớp từ cache, nạp từ DB nếu chưa có."""
+    gallery = gallery_cache.get(class_id)
+    if gallery is not None:
+        return gallery
+
+    # Tránh nhiều request cùng nạp một lớp: các request đồng thời chờ chung một lần nạp,
+    # lần nạp xong thì bị bỏ khỏi _gallery_loads (không giữ gì theo class_id ngoài cache)
+    task = _gallery_loads.get(class_id)
+    if task is None:
+        task = asyncio.ensure_future(load_class_gallery(class_id))
+        _gallery_loads[class_id] = task
+        task.add_done_callback(lambda _: _gallery_loads.pop(class_id, None))
+    # Một request bị huỷ không huỷ lần nạp mà các request khác đang chờ
+    return await asyncio.shield(task)
+
 
 # ----------------------
 # Teacher CRUD
@@ -83,11 +357,17 @@ async def create_student(
 
     content = await file.read()
 
-    # Tính embedding trong thread pool
-    loop = asyncio.get_event_loop()
-    embedding = await loop.run_in_executor(executor, compute_embedding_insightface, content)
-    if embedding is None:
-        return {"ok": False, "msg": "Không tìm thấy mặt trong ảnh"}
+    # Tính embedding ngoài event loop (thread pool hoặc inference worker); ảnh kém chất lượng bị từ chối
+    try:
+        embeddings, _, rejected = await run_face_inference(content, True, ENROLL_PROFILE, quality='enroll')
+    except (asyncio.TimeoutError, BatcherUnavailable) as e:
+        raise inference_unavailable(e)
+    except Exception as e:
+        print("Lỗi tính embedding ghi danh:", e)
+        return {"ok": False, "msg": "Không tính được embedding từ ảnh"}
+    if len(embeddings) == 0:
+        return {"ok": False, "msg": reject_message(rejected)}
+    embedding = embeddings[0].tolist()
 
     # Save image
     fname = f"{mssv}_{int(datetime.utcnow().timestamp())}.jpg"
@@ -111,9 +391,30 @@ async def create_student(
         {"$push": {"student_ids": str(res.inserted_id)}}
     )
 
+    # Cập nhật gallery của lớp
+    gallery_cache.add_student(class_id, str(res.inserted_id), name, embedding)
+
     return {"ok": True, "student_id": str(res.inserted_id)}
 
 
+@app.delete("/students/{student_id}")
+async def delete_student(student_id: str):
+    if not ObjectId.is_valid(student_id):
+        return {"ok": False, "msg": "student_id không hợp lệ"}
+
+    student = await db.students.find_one_and_delete({"_id": ObjectId(student_id)})
+    if student is None:
+        return {"ok": False, "msg": "Không tìm thấy học sinh"}
+
+    await db.classes.update_one(
+        {"_id": ObjectId(student["class_id"])},
+        {"$pull": {"student_ids": student_id}}
+    )
+    gallery_cache.remove_student(student["class_id"], student_id)
+
+    return {"ok": True}
+
+
 # ----------------------
 # Attendance manual
 # ----------------------
@@ -139,41 +440,201 @@ async def mark_attendance(class_id: str = Form(...), student_id: str = Form(...)
 # AI Recognition / Điểm danh tự động
 # ----------------------
 @app.post("/recognize/")
-async def recognize(file: UploadFile = File(...), class_id: str = Form(...)):
+async def recognize(
+    file: UploadFile = File(...),
+    class_id: str = Form(...),
+    top_k: int = Form(5, ge=1),
+    multi_face: bool = Form(False),
+    profile: str = Form(None)
+):
     # Validate class_id
     if not ObjectId.is_valid(class_id):
         return {"ok": False, "msg": "class_id không hợp lệ"}
+    if profile:
+        try:
+            check_compatible(profile, DEFAULT_PROFILE)
+        except ValueError as e:
+            return {"ok": False, "msg": str(e)}
 
     content = await file.read()
 
-    loop = asyncio.get_event_loop()
-    emb = await loop.run_in_executor(executor, compute_embedding_insightface, content)
+    if multi_face:
+        return await recognize_all_faces(content, class_id, profile)
+
+    emb = await infer_embedding(content, profile, cache_scope=class_id)
     if emb is None:
         return {"ok": True, "results": [], "msg": "Không nhận diện được mặt"}
 
-    emb_norm = np.array(emb) / np.linalg.norm(emb)
+    gallery = await get_class_gallery(class_id)
+    matches = gallery.search(emb, top_k=top_k, threshold=RECOGNITION_THRESHOLD)
+    results = []
+
+    for match in matches:
+        results.append({
+            "name": match["name"],
+            "score": match["score"]
+        })
+
+    # Tự động điểm danh: một lần ghi cho mọi học sinh khớp, bỏ qua học sinh đã có mặt
+    await attendance_marker.mark(class_id, [match["student_id"] for match in matches])
+
+    return {"ok": True, "results": results}
 
-    # Lấy toàn bộ sinh viên của lớp
-    cursor = db.students.find({"class_id": class_id})
+
+async def recognize_all_faces(content, class_id: str, profile_name: str = None):
+    """Điểm danh cả phòng: ghép mọi khuôn mặt trong ảnh với gallery của lớp."""
+    detected = await infer_face_embeddings(content, profile_name=profile_name, cache_scope=class_id)
+    if detected is None:
+        return {"ok": True, "results": [], "msg": "Không nhận diện được mặt"}
+    embeddings, bboxes = detected
+
+    gallery = await get_class_gallery(class_id)
+    matches = gallery.match_faces(embeddings, threshold=RECOGNITION_THRESHOLD)
     results = []
+    student_ids = []
+
+    for bbox, match in zip(bboxes, matches):
+        if match is None:
+            continue
+        results.append({
+            "name": match["name"],
+            "score": match["score"],
+            "bbox": bbox
+        })
+        student_ids.append(match["student_id"])
+
+    # Tự động điểm danh
+    await attendance_marker.mark(class_id, student_ids)
 
-    async for student in cursor:
-        student_emb = np.array(student["face_embedding"])
-        student_emb_norm = student_emb / np.linalg.norm(student_emb)
-        score = float(np.dot(emb_norm, student_emb_norm))
+    return {"ok": True, "faces": len(bboxes), "results": results}
 
-        if score >= 0.7:  # ngưỡng 70%
+
+@app.post("/recognize/batch")
+async def recognize_batch(
+    class_id: str = Form(...),
+    files: List[UploadFile] = File(None),
+    archive: UploadFile = File(None),
+    multi_face: bool = Form(False),
+    profile: str = Form(None)
+):
+    """Nhận diện nhiều ảnh (multipart hoặc file zip) với một lần chạy model recognition."""
+    if not ObjectId.is_valid(class_id):
+        return {"ok": False, "msg": "class_id không hợp lệ"}
+    if profile:
+        try:
+            check_compatible(profile, DEFAULT_PROFILE)
+        except ValueError as e:
+            return {"ok": False, "msg": str(e)}
+
+    loop = asyncio.get_event_loop()
+    images = []
+    for f in files or []:
+        images.append((f.filename, await f.read()))
+    if archive is not None:
+        zip_bytes = await archive.read()
+        try:
+            images.extend(await loop.run_in_executor(executor, read_zip_images, zip_bytes))
+        except zipfile.BadZipFile:
+            return {"ok": False, "msg": "File zip không hợp lệ"}
+
+    if not images:
+        return {"ok": False, "msg": "Không có ảnh nào"}
+    if len(images) > MAX_BATCH_IMAGES:
+        return {"ok": False, "msg": f"Tối đa {MAX_BATCH_IMAGES} ảnh mỗi request"}
+
+    if inference_pool is not None:
+        # Mỗi ảnh chạy trọn detect + embedding trên một inference worker, song song theo số worker
+        detected = await asyncio.gather(*[
+            infer_face_embeddings(content, first_only=not multi_face, profile_name=profile, cache_scope=class_id)
+            for _, content in images
+        ])
+        faces = [d if d is not None else (np.empty((0, 512), dtype=np.float32), []) for d in detected]
+    else:
+        model_profile = await get_profile(profile)
+
+        # Giải mã + phát hiện song song trên thread pool
+        aligned = await asyncio.gather(*[
+            loop.run_in_executor(executor, detect_and_align, content, model_profile, 'recognition', not multi_face)
+            for _, content in images
+        ])
+
+        # Gom toàn bộ khuôn mặt thành một batch ONNX duy nhất
+        crops, counts = [], []
+        for image_crops, _, _ in aligned:
+            crops.extend(image_crops)
+            counts.append(len(image_crops))
+        embeddings = await loop.run_in_executor(executor, embed_crops, model_profile.model, crops)
+
+        faces, start = [], 0
+        for (_, bboxes, _), count in zip(aligned, counts):
+            faces.append((embeddings[start:start + count], [bbox[:4].astype(int).tolist() for bbox in bboxes]))
+            start += count
+
+    gallery = await get_class_gallery(class_id)
+    per_image = []
+    student_ids = []
+
+    for (name, _), (embeddings, bboxes) in zip(images, faces):
+        if multi_face:
+            # Ghép trong phạm vi từng ảnh: một học sinh có thể xuất hiện ở nhiều ảnh
+            matches = gallery.match_faces(embeddings, threshold=RECOGNITION_THRESHOLD)
+        else:
+            matches = [
+                next(iter(gallery.search(emb, top_k=1, threshold=RECOGNITION_THRESHOLD)), None)
+                for emb in embeddings
+            ]
+
+        results = []
+        per_image.append({"file": name, "faces": len(bboxes), "results": results})
+        for bbox, match in zip(bboxes, matches):
+            if match is None:
+                continue
             results.append({
-                "name": student["name"],
-                "score": score
+                "name": match["name"],
+                "score": match["score"],
+                "bbox": bbox
             })
+            student_ids.append(match["student_id"])
+
+    # Tự động điểm danh cho cả batch trong một lần ghi
+    await attendance_marker.mark(class_id, student_ids)
+
+    return {"ok": True, "images": per_image}
 
-            # Tự động điểm danh
-            await db.attendance.insert_one({
-                "class_id": class_id,
-                "student_id": str(student["_id"]),  # vẫn lưu trong DB để quản lý
-                "time": datetime.utcnow(),
-                "status": "present"
-            })
 
-    return {"ok": True, "results": results}
\ No newline at end of file
+@app.get("/metrics/inference")
+async def inference_metrics():
+    """Số liệu micro-batcher (histogram kích thước batch, thời gian chờ) và inference worker."""
+    return {
+        "profiles": model_registry.loaded(),
+        "cache": recognition_cache.metrics() if recognition_cache is not None else None,
+        "attendance": attendance_marker.metrics(),
+        "quality": {name: quality.metrics() for name, quality in quality_filters.items()},
+        "batcher": {pack: batcher.metrics() for pack, batcher in embed_batchers.items()},
+        "pool": inference_pool.metrics() if inference_pool is not None else None
+    }
+
+
+@app.get("/health")
+async def health():
+    """Liveness: process còn phục vụ request (không phụ thuộc model)."""
+    return {"ok": True}
+
+
+@app.get("/ready")
+async def readiness():
+    """Readiness: 200 khi model mặc định đã nạp xong, 503 nếu chưa."""
+    if inference_pool is not None:
+        ready = inference_pool.is_ready()
+    else:
+        ready = model_registry.peek(DEFAULT_PROFILE) is not None
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={
+            "ready": ready,
+            "warmed_up": model_warmed_up,
+            "default_profile": DEFAULT_PROFILE,
+            "models": model_registry.status(),
+            "pool": inference_pool.metrics() if inference_pool is not None else None
+        }
+    )
@@ -3,21 +3,38 @@ Service module - Các repository để trích xuất và quản lý dữ liệu
 """
 
 from service.db_connection import db, DatabaseConnection
-from service.students import StudentsRepository
-from service.teachers import TeachersRepository
-from service.classes import ClassesRepository
-from service.face_embeddings import FaceEmbeddingsRepository
-from service.cameras import CamerasRepository
-from service.attendance import AttendanceRepository
+from service.async_db_connection import async_db, AsyncDatabaseConnection
+from service.students import StudentsRepository, AsyncStudentsRepository
+from service.teachers import TeachersRepository, AsyncTeachersRepository
+from service.classes import ClassesRepository, AsyncClassesRepository
+from service.face_embeddings import FaceEmbeddingsRepository, AsyncFaceEmbeddingsRepository
+from service.cameras import CamerasRepository, AsyncCamerasRepository
+from service.attendance import AttendanceRepository, AsyncAttendanceRepository
+from service.gallery import ClassGallery, GalleryCache, TemplateGallery, build_template_gallery
+from service.vector_index import StudentEmbeddingIndex, create_index
 
 __all__ = [
     'db',
     'DatabaseConnection',
+    'async_db',
+    'AsyncDatabaseConnection',
     'StudentsRepository',
     'TeachersRepository',
     'ClassesRepository',
     'FaceEmbeddingsRepository',
     'CamerasRepository',
-    'AttendanceRepository'
+    'AttendanceRepository',
+    'AsyncStudentsRepository',
+    'AsyncTeachersRepository',
+    'AsyncClassesRepository',
+    'AsyncFaceEmbeddingsRepository',
+    'AsyncCamerasRepository',
+    'AsyncAttendanceRepository',
+    'ClassGallery',
+    'GalleryCache',
+    'TemplateGallery',
+    'build_template_gallery',
+    'StudentEmbeddingIndex',
+    'create_index'
 ]
 
@@ -0,0 +1,188 @@
+import aiomysql
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, Optional, Sequence
+from dotenv import load_dotenv
+
+from service.bulk import DEFAULT_CHUNK_SIZE, chunked, insert_rows_async
+
+# Load biến môi trường từ file .env
+load_dotenv()
+
+class AsyncDatabaseConnection:
+    """Quản lý pool kết nối MySQL bất đồng bộ (aiomysql) cho các endpoint async"""
+
+    def __init__(self):
+        self.pool: Optional[aiomysql.Pool] = None
+        self.config = {
+            'host': os.getenv('DB_HOST', 'localhost'),
+            'port': int(os.getenv('DB_PORT', '3306')),
+            'db': os.getenv('DB_NAME', 'ai_attendance'),
+            'user': os.getenv('DB_USER', 'root'),
+            'password': os.getenv('DB_PASSWORD', ''),
+            'charset': 'utf8mb4',
+            # SELECT không giữ snapshot cũ; transaction tường minh dùng conn.begin()
+            'autocommit': True
+        }
+        self.pool_size = max(int(os.getenv('DB_POOL_SIZE', '5')), 1)
+        self.pool_timeout = float(os.getenv('DB_POOL_TIMEOUT', '10'))
+        # Đóng kết nối đã mở quá số giây này, phải nhỏ hơn wait_timeout của MySQL (mặc định 8 giờ)
+        self.pool_recycle = int(os.getenv('DB_POOL_RECYCLE', '3600'))
+        self._connect_lock = asyncio.Lock()
+        self._stats = {
+            'checkouts': 0,
+            'total_wait_ms': 0.0,
+            'max_wait_ms': 0.0,
+            'timeouts': 0,
+        }
+
+    async def connect(self):
+        """Tạo pool kết nối đến database"""
+        async with self._connect_lock:
+            if self.pool is not None:
+                return True
+            try:
+                self.pool = await aiomysql.create_pool(
+                    minsize=1,
+                    maxsize=self.pool_size,
+                    pool_recycle=self.pool_recycle,
+                    **self.config
+                )
+                print(f"Kết nối thành công đến database: {self.config['db']} (async pool {self.pool_size})")
+                return True
+            except aiomysql.Error as e:
+                print(f"Lỗi kết nối database: {e}")
+                return False
+
+    async def disconnect(self):
+        """Đóng pool kết nối"""
+        if self.pool is not None:
+            self.pool.close()
+            await self.pool.wait_closed()
+            self.pool = None
+            print("Đã đóng pool kết nối database (async)")
+
+    async def is_connected(self) -> bool:
+        """Kiểm tra database còn kết nối được không"""
+        try:
+            async with self.checkout() as conn:
+                await conn.ping(reconnect=False)
+                return True
+        except (aiomysql.Error, asyncio.TimeoutError):
+            return False
+
+    @asynccontextmanager
+    async def checkout(self):
+        """Mượn một kết nối từ pool cho một lần gọi"""
+        if self.pool is None and not await self.connect():
+            raise aiomysql.OperationalError(2003, "Không thể kết nối database")
+        start = time.monotonic()
+        try:
+            conn = await asyncio.wait_for(self.pool.acquire(), timeout=self.pool_timeout)
+        except asyncio.TimeoutError:
+            self._stats['timeouts'] += 1
+            raise
+        wait_ms = (time.monotonic() - start) * 1000
+        self._stats['checkouts'] += 1
+        self._stats['total_wait_ms'] += wait_ms
+        self._stats['max_wait_ms'] = max(self._stats['max_wait_ms'], wait_ms)
+        try:
+            yield conn
+        finally:
+            self.pool.release(conn)
+
+    @asynccontextmanager
+    async def transaction(self):
+        """Chạy nhiều câu lệnh trong một transaction trên cùng một kết nối
+
+        Yield cursor (DictCursor); commit khi khối lệnh kết thúc, rollback nếu có lỗi.
+        """
+        async with self.checkout() as conn:
+            await conn.begin()
+            try:
+                async with conn.cursor(aiomysql.DictCursor) as cursor:
+                    yield cursor
+                await conn.commit()
+            except BaseException:
+                await conn.rollback()
+                raise
+
+    def pool_metrics(self) -> Dict:
+        """Số liệu pool kết nối"""
+        stats = dict(self._stats)
+        stats['avg_wait_ms'] = stats['total_wait_ms'] / stats['checkouts'] if stats['checkouts'] else 0.0
+        if self.pool is not None:
+            stats['size'] = self.pool.maxsize
+            stats['open'] = self.pool.size
+            stats['idle'] = self.pool.freesize
+            stats['in_use'] = self.pool.size - self.pool.freesize
+        return stats
+
+    async def execute_query(self, query: str, params: tuple = None):
+        """Thực thi query SELECT và trả về kết quả"""
+        try:
+            async with self.checkout() as conn:
+                async with conn.cursor(aiomysql.DictCursor) as cursor:
+                    await cursor.execute(query, params)
+                    return list(await cursor.fetchall())
+        except (aiomysql.Error, asyncio.TimeoutError) as e:
+            print(f"Lỗi thực thi query: {e}")
+            return []
+
+    async def execute_update(self, query: str, params: tuple = None):
+        """Thực thi query INSERT/UPDATE/DELETE"""
+        try:
+            async with self.checkout() as conn:
+                async with conn.cursor() as cursor:
+                    await cursor.execute(query, params)
+                    return cursor.rowcount, cursor.lastrowid
+        except (aiomysql.Error, asyncio.TimeoutError) as e:
+            print(f"Lỗi thực thi update: {e}")
+            return 0, None
+
+    async def execute_many(self, query: str, params_seq: Sequence, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                           atomic: bool = True) -> int:
+        """Thực thi một câu lệnh với nhiều bộ tham số (executemany theo từng chunk)
+
+        atomic=True: mọi chunk trong một transaction; atomic=False: commit sau mỗi chunk.
+        Trả về tổng số dòng đã commit: lỗi giữa chừng thì với atomic=True là 0, với
+        atomic=False là số dòng của các chunk đã commit trước đó.
+        """
+        committed = 0
+        try:
+            async with self.checkout() as conn:
+                await conn.begin()
+                affected = 0
+                try:
+                    async with conn.cursor() as cursor:
+                        for chunk in chunked(params_seq, chunk_size):
+                            await cursor.executemany(query, chunk)
+                            affected += cursor.rowcount
+                            if not atomic:
+                                await conn.commit()
+                                committed = affected
+                                await conn.begin()
+                    await conn.commit()
+                    committed = affected
+                except BaseException:
+                    await conn.rollback()
+                    raise
+                return committed
+        except (aiomysql.Error, asyncio.TimeoutError) as e:
+            print(f"Lỗi thực thi executemany (đã commit {committed} dòng): {e}")
+            return committed
+
+    async def insert_many(self, table: str, columns: Sequence[str], rows: Sequence[Sequence],
+                          chunk_size: int = DEFAULT_CHUNK_SIZE, on_duplicate: str = None) -> int:
+        """Chèn nhiều dòng bằng INSERT nhiều dòng trong một transaction; trả về số dòng (0 nếu lỗi)"""
+        try:
+            async with self.transaction() as cursor:
+                return await insert_rows_async(cursor, table, columns, rows, chunk_size, on_duplicate)
+        except (aiomysql.Error, asyncio.TimeoutError) as e:
+            print(f"Lỗi chèn nhiều dòng vào {table}: {e}")
+            return 0
+
+# Singleton instance
+async_db = AsyncDatabaseConnection()
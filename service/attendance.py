@@ -1,6 +1,315 @@
 from service.db_connection import db
-from typing import List, Dict, Optional
-from datetime import datetime, date
+from mysql.connector import Error
+from service.async_db_connection import async_db
+from service.pagination import parse_fields, decode_cursor, clamp_limit, build_select, build_page
+from service.bulk import DEFAULT_CHUNK_SIZE, insert_rows, insert_rows_async
+from service.queries import update_query
+from typing import List, Dict, Optional, Iterator, AsyncIterator, Tuple
+from datetime import datetime, date, timedelta
+import aiomysql
+
+# Các trường cho phép chọn qua fields= khi phân trang: (biểu thức SQL, bảng cần JOIN)
+ATTENDANCE_PAGE_FIELDS = {
+    'attendance_id': ('a.attendance_id', None),
+    'student_id': ('a.student_id', None),
+    'class_id': ('a.class_id', None),
+    'timestamp': ('a.timestamp', None),
+    'session': ('a.session', None),
+    'status': ('a.status', None),
+    'method': ('a.method', None),
+    'camera_id': ('a.camera_id', None),
+    'note': ('a.note', None),
+    'student_name': ('s.full_name', 'students'),
+    'student_code': ('s.student_code', 'students'),
+    'class_name': ('c.class_name', 'classes'),
+    'camera_name': ('cam.camera_name', 'cameras'),
+    'camera_location': ('cam.location', 'cameras'),
+}
+
+def day_range(start_date: date, end_date: date = None):
+    """Khoảng nửa mở [start_date 00:00, (end_date + 1) 00:00) để so sánh trực tiếp cột timestamp
+
+    Tránh DATE(timestamp) trong WHERE - hàm bọc cột làm MySQL không dùng được index.
+    """
+    end_date = end_date or start_date
+    return (
+        datetime.combine(start_date, datetime.min.time()),
+        datetime.combine(end_date + timedelta(days=1), datetime.min.time())
+    )
+
+
+# Bảng tổng hợp theo (lớp, ngày, học sinh, ca, trạng thái), cập nhật cùng transaction với attendance
+ROLLUP_INCREMENT_QUERY = """
+    INSERT INTO attendance_daily_rollup
+    (class_id, student_id, day, session, status, record_count)
+    VALUES (%s, %s, %s, %s, %s, 1)
+    ON DUPLICATE KEY UPDATE record_count = record_count + 1
+"""
+
+ROLLUP_DECREMENT_QUERY = """
+    UPDATE attendance_daily_rollup
+    SET record_count = record_count - 1
+    WHERE class_id = %s AND student_id = %s AND day = %s AND session = %s AND status = %s
+"""
+
+# Khoá bản ghi để cập nhật rollup theo giá trị cũ
+ROLLUP_LOCK_QUERY = """
+    SELECT class_id, student_id, DATE(timestamp) as day, session, status
+    FROM attendance
+    WHERE attendance_id = %s
+    FOR UPDATE
+"""
+
+ROLLUP_STATISTICS_COLUMNS = """
+    COALESCE(SUM(record_count), 0) as total_records,
+    COALESCE(SUM(CASE WHEN status = 'present' THEN record_count ELSE 0 END), 0) as present_count,
+    COALESCE(SUM(CASE WHEN status = 'absent' THEN record_count ELSE 0 END), 0) as absent_count,
+    COALESCE(SUM(CASE WHEN status = 'late' THEN record_count ELSE 0 END), 0) as late_count,
+    COALESCE(SUM(CASE WHEN status = 'excused' THEN record_count ELSE 0 END), 0) as excused_count
+"""
+
+
+ATTENDANCE_INSERT_COLUMNS = ('student_id', 'class_id', 'timestamp', 'session', 'status', 'method', 'camera_id', 'note')
+ROLLUP_INSERT_COLUMNS = ('class_id', 'student_id', 'day', 'session', 'status', 'record_count')
+ROLLUP_MERGE = "record_count = record_count + VALUES(record_count)"
+
+
+def row_rollup_key(row: Tuple):
+    """Khoá rollup (class_id, student_id, day, session, status) của một dòng ATTENDANCE_INSERT_COLUMNS"""
+    student_id, class_id, timestamp, session, status = row[:5]
+    return (class_id, student_id, timestamp.date(), session, status)
+
+
+def attendance_rows(records: List[Dict]):
+    """Tham số INSERT attendance và các dòng rollup đã gộp theo khoá cho nhiều bản ghi"""
+    now = datetime.now()
+    rows, rollup = [], {}
+    for r in records:
+        row = (r['student_id'], r['class_id'], r.get('timestamp') or now, r['session'], r['status'],
+               r.get('method', 'face_recognition'), r.get('camera_id'), r.get('note'))
+        rows.append(row)
+        key = row_rollup_key(row)
+        rollup[key] = rollup.get(key, 0) + 1
+    return rows, [key + (count,) for key, count in rollup.items()]
+
+
+def rollup_key(row: Dict):
+    """Khoá rollup (class_id, student_id, day, session, status) của một bản ghi điểm danh"""
+    return (row['class_id'], row['student_id'], row['day'], row['session'], row['status'])
+
+
+def update_attendance_query(attendance_id: int, status: str = None, session: str = None, note: str = None):
+    """Câu UPDATE cho update_attendance, None nếu không có gì để cập nhật"""
+    return update_query('attendance', 'attendance_id', attendance_id, {
+        'status': status,
+        'session': session,
+        'note': note,
+    })
+
+
+def rollup_moves(old: Dict, status: str = None, session: str = None) -> List[Tuple[str, Tuple]]:
+    """Các câu lệnh chuyển số đếm rollup của bản ghi old sang trạng thái/ca mới (rỗng nếu khoá không đổi)"""
+    new = dict(old, status=status or old['status'], session=session or old['session'])
+    if rollup_key(new) == rollup_key(old):
+        return []
+    return [(ROLLUP_DECREMENT_QUERY, rollup_key(old)), (ROLLUP_INCREMENT_QUERY, rollup_key(new))]
+
+
+def build_rollup_statistics_query(key_column: str, key_value: int, start_date: date = None, end_date: date = None):
+    """Dựng query thống kê đọc từ attendance_daily_rollup (O(số ngày) thay vì O(số bản ghi))"""
+    query = f"""
+        SELECT {ROLLUP_STATISTICS_COLUMNS}
+        FROM attendance_daily_rollup
+        WHERE {key_column} = %s
+    """
+    params = [key_value]
+    if start_date and end_date:
+        query += " AND day BETWEEN %s AND %s"
+        params.extend([start_date, end_date])
+    return query, tuple(params)
+
+
+# Các cột khi xuất lịch sử điểm danh
+ATTENDANCE_EXPORT_COLUMNS = (
+    'attendance_id', 'timestamp', 'session', 'status', 'method', 'note',
+    'student_id', 'student_code', 'student_name', 'class_id', 'class_name',
+    'camera_id', 'camera_name'
+)
+
+ATTENDANCE_PAGE_JOINS = {
+    'students': 'JOIN students s ON a.student_id = s.student_id',
+    'classes': 'JOIN classes c ON a.class_id = c.class_id',
+    'cameras': 'LEFT JOIN cameras cam ON a.camera_id = cam.camera_id',
+}
+
+
+# Câu query dùng chung cho AttendanceRepository và AsyncAttendanceRepository
+ATTENDANCE_COLUMNS = """
+        a.attendance_id,
+        a.student_id,
+        a.class_id,
+        a.timestamp,
+        a.session,
+        a.status,
+        a.method,
+        a.camera_id,
+        a.note,
+        s.full_name as student_name,
+        s.student_code,
+        c.class_name,
+        cam.camera_name"""
+
+ATTENDANCE_JOINS = """
+    FROM attendance a
+    JOIN students s ON a.student_id = s.student_id
+    JOIN classes c ON a.class_id = c.class_id
+    LEFT JOIN cameras cam ON a.camera_id = cam.camera_id
+"""
+
+ALL_ATTENDANCE_QUERY = f"""
+    SELECT {ATTENDANCE_COLUMNS},
+        cam.location as camera_location
+    {ATTENDANCE_JOINS}
+    ORDER BY a.timestamp DESC
+"""
+
+ATTENDANCE_BY_ID_QUERY = f"""
+    SELECT {ATTENDANCE_COLUMNS},
+        cam.location as camera_location
+    {ATTENDANCE_JOINS}
+    WHERE a.attendance_id = %s
+"""
+
+
+def attendance_list_query(where: str) -> str:
+    """SELECT điểm danh kèm học sinh / lớp / camera theo điều kiện, mới nhất trước"""
+    return f"""
+    SELECT {ATTENDANCE_COLUMNS}
+    {ATTENDANCE_JOINS}
+    WHERE {where}
+    ORDER BY a.timestamp DESC
+"""
+
+
+ATTENDANCE_BY_STUDENT_QUERY = attendance_list_query("a.student_id = %s")
+ATTENDANCE_BY_CLASS_QUERY = attendance_list_query("a.class_id = %s")
+ATTENDANCE_BY_DATE_QUERY = attendance_list_query("a.timestamp >= %s AND a.timestamp < %s")
+ATTENDANCE_BY_CLASS_AND_DATE_QUERY = attendance_list_query(
+    "a.class_id = %s AND a.timestamp >= %s AND a.timestamp < %s")
+ATTENDANCE_BY_STATUS_QUERY = attendance_list_query("a.status = %s")
+ATTENDANCE_BY_SESSION_QUERY = attendance_list_query("a.session = %s")
+
+CREATE_ATTENDANCE_QUERY = """
+    INSERT INTO attendance 
+    (student_id, class_id, timestamp, session, status, method, camera_id, note)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+"""
+
+# Bỏ qua bản ghi trùng khoá uniq_attendance_student_class_session_day: không đổi gì nên rowcount = 0
+CREATE_ATTENDANCE_ONCE_QUERY = CREATE_ATTENDANCE_QUERY + """    ON DUPLICATE KEY UPDATE attendance_id = attendance_id
+"""
+
+DELETE_ATTENDANCE_QUERY = "DELETE FROM attendance WHERE attendance_id = %s"
+
+EMPTY_ATTENDANCE_STATISTICS = {
+    'total_records': 0,
+    'present_count': 0,
+    'absent_count': 0,
+    'late_count': 0,
+    'excused_count': 0
+}
+
+
+def attendance_statistics(results: List[Dict]) -> Dict:
+    """Dòng thống kê rollup, hoặc số 0 nếu không có dữ liệu"""
+    return results[0] if results else dict(EMPTY_ATTENDANCE_STATISTICS)
+
+
+def build_attendance_page_query(limit: int, cursor: str = None, fields=None):
+    """Dựng query keyset theo (timestamp, attendance_id) giảm dần
+
+    Chỉ JOIN các bảng cần cho những trường được chọn. Lấy limit + 1 dòng để biết còn trang sau.
+    """
+    fields = parse_fields(fields, ATTENDANCE_PAGE_FIELDS, ATTENDANCE_PAGE_FIELDS.keys())
+    key_fields = ('timestamp', 'attendance_id')
+    columns, joins = build_select(fields, key_fields, ATTENDANCE_PAGE_FIELDS)
+    join_sql = '\n            '.join(sql for name, sql in ATTENDANCE_PAGE_JOINS.items() if name in joins)
+
+    where = ""
+    params = []
+    if cursor:
+        last_timestamp, last_id = decode_cursor(cursor, 2)
+        where = "WHERE a.timestamp < %s OR (a.timestamp = %s AND a.attendance_id < %s)"
+        params = [last_timestamp, last_timestamp, last_id]
+    params.append(limit + 1)
+
+    query = f"""
+        SELECT 
+            {columns}
+        FROM attendance a
+        {join_sql}
+        {where}
+        ORDER BY a.timestamp DESC, a.attendance_id DESC
+        LIMIT %s
+    """
+    return query, tuple(params), fields, key_fields
+
+
+def build_export_query(
+    class_id: int = None,
+    start_date: date = None,
+    end_date: date = None,
+    status: str = None
+):
+    """Dựng query xuất điểm danh có lọc theo lớp, khoảng ngày [start_date, end_date] và trạng thái"""
+    conditions = []
+    params = []
+    if class_id:
+        conditions.append("a.class_id = %s")
+        params.append(class_id)
+    if start_date:
+        conditions.append("a.timestamp >= %s")
+        params.append(day_range(start_date)[0])
+    if end_date:
+        conditions.append("a.timestamp < %s")
+        params.append(day_range(end_date)[1])
+    if status:
+        conditions.append("a.status = %s")
+        params.append(status)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    query = f"""
+        SELECT 
+            a.attendance_id,
+            a.timestamp,
+            a.session,
+            a.status,
+            a.method,
+            a.note,
+            a.student_id,
+            s.student_code,
+            s.full_name as student_name,
+            a.class_id,
+            c.class_name,
+            a.camera_id,
+            cam.camera_name
+        FROM attendance a
+        JOIN students s ON a.student_id = s.student_id
+        JOIN classes c ON a.class_id = c.class_id
+        LEFT JOIN cameras cam ON a.camera_id = cam.camera_id
+        {where}
+        ORDER BY a.timestamp, a.attendance_id
+    """
+    return query, tuple(params)
+
+
+def new_attendance(student_id: int, class_id: int, session: str, status: str, method: str,
+                   camera_id: int, note: str, timestamp: datetime = None):
+    """Tham số INSERT một bản ghi điểm danh và khoá rollup cần tăng (timestamp mặc định là bây giờ)"""
+    if timestamp is None:
+        timestamp = datetime.now()
+    params = (student_id, class_id, timestamp, session, status, method, camera_id, note)
+    return params, (class_id, student_id, timestamp.date(), session, status)
 
 class AttendanceRepository:
     """Repository để trích xuất và quản lý dữ liệu điểm danh"""
@@ -8,219 +317,72 @@ class AttendanceRepository:
     @staticmethod
     def get_all_attendance() -> List[Dict]:
         """Lấy tất cả bản ghi điểm danh"""
-        query = """
-            SELECT 
-                a.attendance_id,
-                a.student_id,
-                a.class_id,
-                a.timestamp,
-                a.session,
-                a.status,
-                a.method,
-                a.camera_id,
-                a.note,
-                s.full_name as student_name,
-                s.student_code,
-                c.class_name,
-                cam.camera_name,
-                cam.location as camera_location
-            FROM attendance a
-            JOIN students s ON a.student_id = s.student_id
-            JOIN classes c ON a.class_id = c.class_id
-            LEFT JOIN cameras cam ON a.camera_id = cam.camera_id
-            ORDER BY a.timestamp DESC
-        """
-        return db.execute_query(query)
+        return db.execute_query(ALL_ATTENDANCE_QUERY)
+    
+    @staticmethod
+    def get_attendance_page(limit: int = None, cursor: str = None, fields=None) -> Dict:
+        """Lấy điểm danh theo trang (keyset), trả về {'items', 'next_cursor'}"""
+        limit = clamp_limit(limit)
+        query, params, fields, key_fields = build_attendance_page_query(limit, cursor, fields)
+        return build_page(db.execute_query(query, params), limit, key_fields, fields)
+    
+    @staticmethod
+    def iter_attendance_export(
+        class_id: int = None,
+        start_date: date = None,
+        end_date: date = None,
+        status: str = None,
+        chunk_size: int = 1000
+    ) -> Iterator[List[Dict]]:
+        """Đọc điểm danh theo từng lô bằng cursor không buffer (bộ nhớ không tăng theo số dòng)"""
+        query, params = build_export_query(class_id, start_date, end_date, status)
+        with db.checkout() as conn:
+            cursor = conn.cursor(dictionary=True, buffered=False)
+            try:
+                cursor.execute(query, params)
+                while True:
+                    rows = cursor.fetchmany(chunk_size)
+                    if not rows:
+                        break
+                    yield rows
+            finally:
+                cursor.close()
     
     @staticmethod
     def get_attendance_by_id(attendance_id: int) -> Optional[Dict]:
         """Lấy bản ghi điểm danh theo ID"""
-        query = """
-            SELECT 
-                a.attendance_id,
-                a.student_id,
-                a.class_id,
-                a.timestamp,
-                a.session,
-                a.status,
-                a.method,
-                a.camera_id,
-                a.note,
-                s.full_name as student_name,
-                s.student_code,
-                c.class_name,
-                cam.camera_name,
-                cam.location as camera_location
-            FROM attendance a
-            JOIN students s ON a.student_id = s.student_id
-            JOIN classes c ON a.class_id = c.class_id
-            LEFT JOIN cameras cam ON a.camera_id = cam.camera_id
-            WHERE a.attendance_id = %s
-        """
-        results = db.execute_query(query, (attendance_id,))
+        results = db.execute_query(ATTENDANCE_BY_ID_QUERY, (attendance_id,))
         return results[0] if results else None
     
     @staticmethod
     def get_attendance_by_student(student_id: int) -> List[Dict]:
         """Lấy tất cả điểm danh của một học sinh"""
-        query = """
-            SELECT 
-                a.attendance_id,
-                a.student_id,
-                a.class_id,
-                a.timestamp,
-                a.session,
-                a.status,
-                a.method,
-                a.camera_id,
-                a.note,
-                s.full_name as student_name,
-                s.student_code,
-                c.class_name,
-                cam.camera_name
-            FROM attendance a
-            JOIN students s ON a.student_id = s.student_id
-            JOIN classes c ON a.class_id = c.class_id
-            LEFT JOIN cameras cam ON a.camera_id = cam.camera_id
-            WHERE a.student_id = %s
-            ORDER BY a.timestamp DESC
-        """
-        return db.execute_query(query, (student_id,))
+        return db.execute_query(ATTENDANCE_BY_STUDENT_QUERY, (student_id,))
     
     @staticmethod
     def get_attendance_by_class(class_id: int) -> List[Dict]:
         """Lấy tất cả điểm danh của một lớp"""
-        query = """
-            SELECT 
-                a.attendance_id,
-                a.student_id,
-                a.class_id,
-                a.timestamp,
-                a.session,
-                a.status,
-                a.method,
-                a.camera_id,
-                a.note,
-                s.full_name as student_name,
-                s.student_code,
-                c.class_name,
-                cam.camera_name
-            FROM attendance a
-            JOIN students s ON a.student_id = s.student_id
-            JOIN classes c ON a.class_id = c.class_id
-            LEFT JOIN cameras cam ON a.camera_id = cam.camera_id
-            WHERE a.class_id = %s
-            ORDER BY a.timestamp DESC
-        """
-        return db.execute_query(query, (class_id,))
+        return db.execute_query(ATTENDANCE_BY_CLASS_QUERY, (class_id,))
     
     @staticmethod
     def get_attendance_by_date(attendance_date: date) -> List[Dict]:
         """Lấy điểm danh theo ngày"""
-        query = """
-            SELECT 
-                a.attendance_id,
-                a.student_id,
-                a.class_id,
-                a.timestamp,
-                a.session,
-                a.status,
-                a.method,
-                a.camera_id,
-                a.note,
-                s.full_name as student_name,
-                s.student_code,
-                c.class_name,
-                cam.camera_name
-            FROM attendance a
-            JOIN students s ON a.student_id = s.student_id
-            JOIN classes c ON a.class_id = c.class_id
-            LEFT JOIN cameras cam ON a.camera_id = cam.camera_id
-            WHERE DATE(a.timestamp) = %s
-            ORDER BY a.timestamp DESC
-        """
-        return db.execute_query(query, (attendance_date,))
+        return db.execute_query(ATTENDANCE_BY_DATE_QUERY, day_range(attendance_date))
     
     @staticmethod
     def get_attendance_by_class_and_date(class_id: int, attendance_date: date) -> List[Dict]:
         """Lấy điểm danh của một lớp trong một ngày"""
-        query = """
-            SELECT 
-                a.attendance_id,
-                a.student_id,
-                a.class_id,
-                a.timestamp,
-                a.session,
-                a.status,
-                a.method,
-                a.camera_id,
-                a.note,
-                s.full_name as student_name,
-                s.student_code,
-                c.class_name,
-                cam.camera_name
-            FROM attendance a
-            JOIN students s ON a.student_id = s.student_id
-            JOIN classes c ON a.class_id = c.class_id
-            LEFT JOIN cameras cam ON a.camera_id = cam.camera_id
-            WHERE a.class_id = %s AND DATE(a.timestamp) = %s
-            ORDER BY a.timestamp DESC
-        """
-        return db.execute_query(query, (class_id, attendance_date))
+        return db.execute_query(ATTENDANCE_BY_CLASS_AND_DATE_QUERY, (class_id, *day_range(attendance_date)))
     
     @staticmethod
     def get_attendance_by_status(status: str) -> List[Dict]:
         """Lấy điểm danh theo trạng thái (present, absent, late, excused)"""
-        query = """
-            SELECT 
-                a.attendance_id,
-                a.student_id,
-                a.class_id,
-                a.timestamp,
-                a.session,
-                a.status,
-                a.method,
-                a.camera_id,
-                a.note,
-                s.full_name as student_name,
-                s.student_code,
-                c.class_name,
-                cam.camera_name
-            FROM attendance a
-            JOIN students s ON a.student_id = s.student_id
-            JOIN classes c ON a.class_id = c.class_id
-            LEFT JOIN cameras cam ON a.camera_id = cam.camera_id
-            WHERE a.status = %s
-            ORDER BY a.timestamp DESC
-        """
-        return db.execute_query(query, (status,))
+        return db.execute_query(ATTENDANCE_BY_STATUS_QUERY, (status,))
     
     @staticmethod
     def get_attendance_by_session(session: str) -> List[Dict]:
         """Lấy điểm danh theo ca học (morning, afternoon, evening)"""
-        query = """
-            SELECT 
-                a.attendance_id,
-                a.student_id,
-                a.class_id,
-                a.timestamp,
-                a.session,
-                a.status,
-                a.method,
-                a.camera_id,
-                a.note,
-                s.full_name as student_name,
-                s.student_code,
-                c.class_name,
-                cam.camera_name
-            FROM attendance a
-            JOIN students s ON a.student_id = s.student_id
-            JOIN classes c ON a.class_id = c.class_id
-            LEFT JOIN cameras cam ON a.camera_id = cam.camera_id
-            WHERE a.session = %s
-            ORDER BY a.timestamp DESC
-        """
-        return db.execute_query(query, (session,))
+        return db.execute_query(ATTENDANCE_BY_SESSION_QUERY, (session,))
     
     @staticmethod
     def create_attendance(
@@ -233,18 +395,58 @@ class AttendanceRepository:
         note: str = None,
         timestamp: datetime = None
     ) -> int:
-        """Tạo bản ghi điểm danh mới"""
-        if timestamp is None:
-            timestamp = datetime.now()
-        
-        query = """
-            INSERT INTO attendance 
-            (student_id, class_id, timestamp, session, status, method, camera_id, note)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+        """Tạo bản ghi điểm danh mới (cập nhật rollup trong cùng transaction)"""
+        params, rollup = new_attendance(student_id, class_id, session, status, method, camera_id, note, timestamp)
+        try:
+            with db.transaction() as cursor:
+                cursor.execute(CREATE_ATTENDANCE_QUERY, params)
+                last_id = cursor.lastrowid
+                cursor.execute(ROLLUP_INCREMENT_QUERY, rollup)
+            return last_id
+        except Error as e:
+            print(f"Lỗi tạo điểm danh: {e}")
+            return None
+    
+    @staticmethod
+    def create_many(records: List[Dict], chunk_size: int = DEFAULT_CHUNK_SIZE) -> int:
+        """Tạo nhiều bản ghi điểm danh bằng INSERT nhiều dòng, rollup cập nhật trong cùng transaction
+
+        Mỗi record có student_id, class_id, session, status và tuỳ chọn method, camera_id, note,
+        timestamp (mặc định là bây giờ). Trả về số bản ghi đã thêm (0 nếu lỗi, không ghi gì).
         """
-        params = (student_id, class_id, timestamp, session, status, method, camera_id, note)
-        _, last_id = db.execute_update(query, params)
-        return last_id
+        if not records:
+            return 0
+        rows, rollup_rows = attendance_rows(records)
+        try:
+            with db.transaction() as cursor:
+                inserted = insert_rows(cursor, 'attendance', ATTENDANCE_INSERT_COLUMNS, rows, chunk_size)
+                insert_rows(cursor, 'attendance_daily_rollup', ROLLUP_INSERT_COLUMNS, rollup_rows,
+                            chunk_size, on_duplicate=ROLLUP_MERGE)
+            return inserted
+        except Error as e:
+            print(f"Lỗi tạo điểm danh hàng loạt: {e}")
+            return 0
+    
+    @staticmethod
+    def create_once(records: List[Dict]) -> Optional[List[Dict]]:
+        """Chỉ thêm các bản ghi chưa có cho (học sinh, lớp, ca, ngày), rollup chỉ tăng cho bản ghi được thêm
+
+        Unique key trên DB giữ đúng một bản ghi kể cả khi nhiều process cùng ghi.
+        Trả về các record vừa được thêm (None nếu lỗi, không ghi gì).
+        """
+        rows, _ = attendance_rows(records)
+        try:
+            created = []
+            with db.transaction() as cursor:
+                for record, row in zip(records, rows):
+                    cursor.execute(CREATE_ATTENDANCE_ONCE_QUERY, row)
+                    if cursor.rowcount == 1:
+                        cursor.execute(ROLLUP_INCREMENT_QUERY, row_rollup_key(row))
+                        created.append(record)
+            return created
+        except Error as e:
+            print(f"Lỗi tạo điểm danh: {e}")
+            return None
     
     @staticmethod
     def update_attendance(
@@ -253,108 +455,227 @@ class AttendanceRepository:
         session: str = None,
         note: str = None
     ) -> bool:
-        """Cập nhật bản ghi điểm danh"""
-        updates = []
-        params = []
-        
-        if status:
-            updates.append("status = %s")
-            params.append(status)
-        if session:
-            updates.append("session = %s")
-            params.append(session)
-        if note:
-            updates.append("note = %s")
-            params.append(note)
-        
-        if not updates:
+        """Cập nhật bản ghi điểm danh (chuyển số đếm rollup sang trạng thái/ca mới)"""
+        update = update_attendance_query(attendance_id, status, session, note)
+        if update is None:
+            return False
+        try:
+            with db.transaction() as cursor:
+                cursor.execute(ROLLUP_LOCK_QUERY, (attendance_id,))
+                old = cursor.fetchone()
+                if old is None:
+                    return False
+                cursor.execute(*update)
+                for query, params in rollup_moves(old, status, session):
+                    cursor.execute(query, params)
+            return True
+        except Error as e:
+            print(f"Lỗi cập nhật điểm danh: {e}")
             return False
-        
-        params.append(attendance_id)
-        query = f"UPDATE attendance SET {', '.join(updates)} WHERE attendance_id = %s"
-        affected_rows, _ = db.execute_update(query, tuple(params))
-        return affected_rows > 0
     
     @staticmethod
     def delete_attendance(attendance_id: int) -> bool:
-        """Xóa bản ghi điểm danh"""
-        query = "DELETE FROM attendance WHERE attendance_id = %s"
-        affected_rows, _ = db.execute_update(query, (attendance_id,))
-        return affected_rows > 0
+        """Xóa bản ghi điểm danh (giảm số đếm rollup tương ứng)"""
+        try:
+            with db.transaction() as cursor:
+                cursor.execute(ROLLUP_LOCK_QUERY, (attendance_id,))
+                old = cursor.fetchone()
+                if old is None:
+                    return False
+                cursor.execute(DELETE_ATTENDANCE_QUERY, (attendance_id,))
+                cursor.execute(ROLLUP_DECREMENT_QUERY, rollup_key(old))
+            return True
+        except Error as e:
+            print(f"Lỗi xóa điểm danh: {e}")
+            return False
     
     @staticmethod
     def get_attendance_statistics_by_class(class_id: int, start_date: date = None, end_date: date = None) -> Dict:
-        """Lấy thống kê điểm danh của một lớp"""
-        if start_date and end_date:
-            query = """
-                SELECT 
-                    COUNT(*) as total_records,
-                    SUM(CASE WHEN status = 'present' THEN 1 ELSE 0 END) as present_count,
-                    SUM(CASE WHEN status = 'absent' THEN 1 ELSE 0 END) as absent_count,
-                    SUM(CASE WHEN status = 'late' THEN 1 ELSE 0 END) as late_count,
-                    SUM(CASE WHEN status = 'excused' THEN 1 ELSE 0 END) as excused_count
-                FROM attendance
-                WHERE class_id = %s 
-                AND DATE(timestamp) BETWEEN %s AND %s
-            """
-            params = (class_id, start_date, end_date)
-        else:
-            query = """
-                SELECT 
-                    COUNT(*) as total_records,
-                    SUM(CASE WHEN status = 'present' THEN 1 ELSE 0 END) as present_count,
-                    SUM(CASE WHEN status = 'absent' THEN 1 ELSE 0 END) as absent_count,
-                    SUM(CASE WHEN status = 'late' THEN 1 ELSE 0 END) as late_count,
-                    SUM(CASE WHEN status = 'excused' THEN 1 ELSE 0 END) as excused_count
-                FROM attendance
-                WHERE class_id = %s
-            """
-            params = (class_id,)
-        
-        results = db.execute_query(query, params)
-        return results[0] if results else {
-            'total_records': 0,
-            'present_count': 0,
-            'absent_count': 0,
-            'late_count': 0,
-            'excused_count': 0
-        }
+        """Lấy thống kê điểm danh của một lớp (đọc từ bảng rollup theo ngày)"""
+        query, params = build_rollup_statistics_query('class_id', class_id, start_date, end_date)
+        return attendance_statistics(db.execute_query(query, params))
     
     @staticmethod
     def get_student_attendance_summary(student_id: int, start_date: date = None, end_date: date = None) -> Dict:
-        """Lấy tổng hợp điểm danh của một học sinh"""
-        if start_date and end_date:
-            query = """
-                SELECT 
-                    COUNT(*) as total_records,
-                    SUM(CASE WHEN status = 'present' THEN 1 ELSE 0 END) as present_count,
-                    SUM(CASE WHEN status = 'absent' THEN 1 ELSE 0 END) as absent_count,
-                    SUM(CASE WHEN status = 'late' THEN 1 ELSE 0 END) as late_count,
-                    SUM(CASE WHEN status = 'excused' THEN 1 ELSE 0 END) as excused_count
-                FROM attendance
-                WHERE student_id = %s 
-                AND DATE(timestamp) BETWEEN %s AND %s
-            """
-            params = (student_id, start_date, end_date)
-        else:
-            query = """
-                SELECT 
-                    COUNT(*) as total_records,
-                    SUM(CASE WHEN status = 'present' THEN 1 ELSE 0 END) as present_count,
-                    SUM(CASE WHEN status = 'absent' THEN 1 ELSE 0 END) as absent_count,
-                    SUM(CASE WHEN status = 'late' THEN 1 ELSE 0 END) as late_count,
-                    SUM(CASE WHEN status = 'excused' THEN 1 ELSE 0 END) as excused_count
-                FROM attendance
-                WHERE student_id = %s
-            """
-            params = (student_id,)
-        
-        results = db.execute_query(query, params)
-        return results[0] if results else {
-            'total_records': 0,
-            'present_count': 0,
-            'absent_count': 0,
-            'late_count': 0,
-            'excused_count': 0
-        }
+        """Lấy tổng hợp điểm danh của một học sinh (đọc từ bảng rollup theo ngày)"""
+        query, params = build_rollup_statistics_query('student_id', student_id, start_date, end_date)
+        return attendance_statistics(db.execute_query(query, params))
 
+class AsyncAttendanceRepository:
+    """Repository để trích xuất và quản lý dữ liệu điểm danh (bất đồng bộ, dùng cho các endpoint async)"""
+    
+    @staticmethod
+    async def get_all_attendance() -> List[Dict]:
+        """Lấy tất cả bản ghi điểm danh"""
+        return await async_db.execute_query(ALL_ATTENDANCE_QUERY)
+    
+    @staticmethod
+    async def get_attendance_page(limit: int = None, cursor: str = None, fields=None) -> Dict:
+        """Lấy điểm danh theo trang (keyset), trả về {'items', 'next_cursor'}"""
+        limit = clamp_limit(limit)
+        query, params, fields, key_fields = build_attendance_page_query(limit, cursor, fields)
+        return build_page(await async_db.execute_query(query, params), limit, key_fields, fields)
+    
+    @staticmethod
+    async def stream_attendance_export(
+        class_id: int = None,
+        start_date: date = None,
+        end_date: date = None,
+        status: str = None,
+        chunk_size: int = 1000
+    ) -> AsyncIterator[List[Dict]]:
+        """Đọc điểm danh theo từng lô bằng server-side cursor (SSDictCursor)"""
+        query, params = build_export_query(class_id, start_date, end_date, status)
+        async with async_db.checkout() as conn:
+            async with conn.cursor(aiomysql.SSDictCursor) as cursor:
+                await cursor.execute(query, params)
+                while True:
+                    rows = await cursor.fetchmany(chunk_size)
+                    if not rows:
+                        break
+                    yield rows
+    
+    @staticmethod
+    async def get_attendance_by_id(attendance_id: int) -> Optional[Dict]:
+        """Lấy bản ghi điểm danh theo ID"""
+        results = await async_db.execute_query(ATTENDANCE_BY_ID_QUERY, (attendance_id,))
+        return results[0] if results else None
+    
+    @staticmethod
+    async def get_attendance_by_student(student_id: int) -> List[Dict]:
+        """Lấy tất cả điểm danh của một học sinh"""
+        return await async_db.execute_query(ATTENDANCE_BY_STUDENT_QUERY, (student_id,))
+    
+    @staticmethod
+    async def get_attendance_by_class(class_id: int) -> List[Dict]:
+        """Lấy tất cả điểm danh của một lớp"""
+        return await async_db.execute_query(ATTENDANCE_BY_CLASS_QUERY, (class_id,))
+    
+    @staticmethod
+    async def get_attendance_by_date(attendance_date: date) -> List[Dict]:
+        """Lấy điểm danh theo ngày"""
+        return await async_db.execute_query(ATTENDANCE_BY_DATE_QUERY, day_range(attendance_date))
+    
+    @staticmethod
+    async def get_attendance_by_class_and_date(class_id: int, attendance_date: date) -> List[Dict]:
+        """Lấy điểm danh của một lớp trong một ngày"""
+        return await async_db.execute_query(ATTENDANCE_BY_CLASS_AND_DATE_QUERY, (class_id, *day_range(attendance_date)))
+    
+    @staticmethod
+    async def get_attendance_by_status(status: str) -> List[Dict]:
+        """Lấy điểm danh theo trạng thái (present, absent, late, excused)"""
+        return await async_db.execute_query(ATTENDANCE_BY_STATUS_QUERY, (status,))
+    
+    @staticmethod
+    async def get_attendance_by_session(session: str) -> List[Dict]:
+        """Lấy điểm danh theo ca học (morning, afternoon, evening)"""
+        return await async_db.execute_query(ATTENDANCE_BY_SESSION_QUERY, (session,))
+    
+    @staticmethod
+    async def create_attendance(
+        student_id: int,
+        class_id: int,
+        session: str,
+        status: str,
+        method: str = 'face_recognition',
+        camera_id: int = None,
+        note: str = None,
+        timestamp: datetime = None
+    ) -> int:
+        """Tạo bản ghi điểm danh mới (cập nhật rollup trong cùng transaction)"""
+        params, rollup = new_attendance(student_id, class_id, session, status, method, camera_id, note, timestamp)
+        try:
+            async with async_db.transaction() as cursor:
+                await cursor.execute(CREATE_ATTENDANCE_QUERY, params)
+                last_id = cursor.lastrowid
+                await cursor.execute(ROLLUP_INCREMENT_QUERY, rollup)
+            return last_id
+        except aiomysql.Error as e:
+            print(f"Lỗi tạo điểm danh: {e}")
+            return None
+    
+    @staticmethod
+    async def create_many(records: List[Dict], chunk_size: int = DEFAULT_CHUNK_SIZE) -> int:
+        """Tạo nhiều bản ghi điểm danh bằng INSERT nhiều dòng, rollup cập nhật trong cùng transaction"""
+        if not records:
+            return 0
+        rows, rollup_rows = attendance_rows(records)
+        try:
+            async with async_db.transaction() as cursor:
+                inserted = await insert_rows_async(cursor, 'attendance', ATTENDANCE_INSERT_COLUMNS, rows, chunk_size)
+                await insert_rows_async(cursor, 'attendance_daily_rollup', ROLLUP_INSERT_COLUMNS, rollup_rows,
+                                        chunk_size, on_duplicate=ROLLUP_MERGE)
+            return inserted
+        except aiomysql.Error as e:
+            print(f"Lỗi tạo điểm danh hàng loạt: {e}")
+            return 0
+    
+    @staticmethod
+    async def create_once(records: List[Dict]) -> Optional[List[Dict]]:
+        """Chỉ thêm các bản ghi chưa có cho (học sinh, lớp, ca, ngày), rollup chỉ tăng cho bản ghi được thêm"""
+        rows, _ = attendance_rows(records)
+        try:
+            created = []
+            async with async_db.transaction() as cursor:
+                for record, row in zip(records, rows):
+                    await cursor.execute(CREATE_ATTENDANCE_ONCE_QUERY, row)
+                    if cursor.rowcount == 1:
+                        await cursor.execute(ROLLUP_INCREMENT_QUERY, row_rollup_key(row))
+                        created.append(record)
+            return created
+        except aiomysql.Error as e:
+            print(f"Lỗi tạo điểm danh: {e}")
+            return None
+    
+    @staticmethod
+    async def update_attendance(
+        attendance_id: int,
+        status: str = None,
+        session: str = None,
+        note: str = None
+    ) -> bool:
+        """Cập nhật bản ghi điểm danh (chuyển số đếm rollup sang trạng thái/ca mới)"""
+        update = update_attendance_query(attendance_id, status, session, note)
+        if update is None:
+            return False
+        try:
+            async with async_db.transaction() as cursor:
+                await cursor.execute(ROLLUP_LOCK_QUERY, (attendance_id,))
+                old = await cursor.fetchone()
+                if old is None:
+                    return False
+                await cursor.execute(*update)
+                for query, params in rollup_moves(old, status, session):
+                    await cursor.execute(query, params)
+            return True
+        except aiomysql.Error as e:
+            print(f"Lỗi cập nhật điểm danh: {e}")
+            return False
+    
+    @staticmethod
+    async def delete_attendance(attendance_id: int) -> bool:
+        """Xóa bản ghi điểm danh (giảm số đếm rollup tương ứng)"""
+        try:
+            async with async_db.transaction() as cursor:
+                await cursor.execute(ROLLUP_LOCK_QUERY, (attendance_id,))
+                old = await cursor.fetchone()
+                if old is None:
+                    return False
+                await cursor.execute(DELETE_ATTENDANCE_QUERY, (attendance_id,))
+                await cursor.execute(ROLLUP_DECREMENT_QUERY, rollup_key(old))
+            return True
+        except aiomysql.Error as e:
+            print(f"Lỗi xóa điểm danh: {e}")
+            return False
+    
+    @staticmethod
+    async def get_attendance_statistics_by_class(class_id: int, start_date: date = None, end_date: date = None) -> Dict:
+        """Lấy thống kê điểm danh của một lớp (đọc từ bảng rollup theo ngày)"""
+        query, params = build_rollup_statistics_query('class_id', class_id, start_date, end_date)
+        return attendance_statistics(await async_db.execute_query(query, params))
+    
+    @staticmethod
+    async def get_student_attendance_summary(student_id: int, start_date: date = None, end_date: date = None) -> Dict:
+        """Lấy tổng hợp điểm danh của một học sinh (đọc từ bảng rollup theo ngày)"""
+        query, params = build_rollup_statistics_query('student_id', student_id, start_date, end_date)
+        return attendance_statistics(await async_db.execute_query(query, params))
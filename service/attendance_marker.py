@@ -0,0 +1,112 @@
+import threading
+from datetime import datetime, timezone
+from typing import Dict, List, Sequence, Set, Tuple
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+# Mã lỗi trùng khoá unique của MongoDB
+DUPLICATE_KEY_ERROR = 11000
+
+
+def local_now() -> datetime:
+    """Thời điểm hiện tại có múi giờ địa phương (dùng cho cả khoá ngày/buổi lẫn thời gian lưu)"""
+    return datetime.now(timezone.utc).astimezone()
+
+
+def session_of(moment: datetime) -> str:
+    """Buổi học theo giờ địa phương (cùng giá trị với cột session bên MySQL)"""
+    if moment.hour < 12:
+        return 'morning'
+    if moment.hour < 18:
+        return 'afternoon'
+    return 'evening'
+
+
+class AttendanceMarker:
+    """Điểm danh tự động idempotent theo (học sinh, lớp, buổi, ngày)
+
+    - Tập "đã điểm danh" trong bộ nhớ chặn các frame lặp lại trước khi chạm DB.
+    - Các học sinh mới được ghi bằng một bulk_write duy nhất, mỗi phần tử là upsert với
+      $setOnInsert nên ghi lại không tạo bản ghi mới.
+    - Unique index (student_id, class_id, session, day) giữ đúng một bản ghi kể cả khi
+      nhiều process cùng ghi.
+    """
+
+    def __init__(self, collection, status: str = 'present'):
+        self.collection = collection
+        self.status = status
+        self._marked: Set[Tuple[str, str, str, str]] = set()
+        self._day = None
+        self._lock = threading.Lock()
+        self._stats = {'skipped': 0, 'inserted': 0, 'existing': 0, 'bulk_writes': 0}
+
+    async def ensure_indexes(self):
+        """Tạo unique index; chỉ áp dụng cho bản ghi có day (bản ghi cũ không có trường này)"""
+        await self.collection.create_index(
+            [('student_id', 1), ('class_id', 1), ('session', 1), ('day', 1)],
+            name='uniq_attendance_student_class_session_day',
+            unique=True,
+            partialFilterExpression={'day': {'$type': 'string'}}
+        )
+
+    def _current_keys(self, now: datetime) -> Tuple[str, str]:
+        """(ngày, buổi) theo giờ địa phương của now; sang ngày mới thì bỏ tập đã điểm danh của ngày cũ"""
+        day = now.strftime('%Y-%m-%d')
+        with self._lock:
+            if day != self._day:
+                self._marked.clear()
+                self._day = day
+        return day, session_of(now)
+
+    def is_marked(self, class_id: str, student_id: str) -> bool:
+        day, session = self._current_keys(local_now())
+        return (student_id, class_id, session, day) in self._marked
+
+    async def mark(self, class_id: str, student_ids: Sequence[str]) -> List[str]:
+        """Điểm danh có mặt cho các học sinh; trả về những học sinh vừa được ghi mới"""
+        # Một now duy nhất: ngày/buổi và thời gian lưu không lệch nhau quanh nửa đêm
+        now = local_now()
+        day, session = self._current_keys(now)
+        pending = []
+        for student_id in dict.fromkeys(student_ids):
+            key = (student_id, class_id, session, day)
+            if key in self._marked:
+                self._stats['skipped'] += 1
+                continue
+            pending.append(student_id)
+        if not pending:
+            return []
+
+        operations = [
+            UpdateOne(
+                {'student_id': student_id, 'class_id': class_id, 'session': session, 'day': day},
+                # datetime có múi giờ được pymongo lưu theo UTC như các bản ghi khác
+                {'$setOnInsert': {'time': now, 'status': self.status}},
+                upsert=True
+            )
+            for student_id in pending
+        ]
+        try:
+            result = await self.collection.bulk_write(operations, ordered=False)
+            upserted = result.upserted_ids
+        except BulkWriteError as e:
+            # Process khác vừa ghi cùng khoá: coi như đã điểm danh, lỗi khác thì báo lên
+            errors = e.details.get('writeErrors', [])
+            if any(error.get('code') != DUPLICATE_KEY_ERROR for error in errors):
+                raise
+            upserted = {item['index']: item['_id'] for item in e.details.get('upserted', [])}
+        self._stats['bulk_writes'] += 1
+
+        with self._lock:
+            if self._day == day:
+                self._marked.update((student_id, class_id, session, day) for student_id in pending)
+        inserted = [pending[index] for index in sorted(upserted)]
+        self._stats['inserted'] += len(inserted)
+        self._stats['existing'] += len(pending) - len(inserted)
+        return inserted
+
+    def metrics(self) -> Dict:
+        stats = dict(self._stats)
+        stats['marked_in_memory'] = len(self._marked)
+        return stats
@@ -0,0 +1,197 @@
+import asyncio
+import bisect
+import functools
+import os
+import time
+from typing import Callable, Dict, List, Optional, Sequence
+
+
+class Histogram:
+    """Histogram đơn giản theo các mốc cố định (đếm số quan sát <= mỗi mốc)"""
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = list(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # ô cuối: lớn hơn mốc lớn nhất
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        """Ước lượng phân vị bằng mốc trên của ô chứa phân vị đó"""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= target:
+                return float(bound)
+        return self.max
+
+    def snapshot(self) -> Dict:
+        labels = [f"le_{b:g}" for b in self.buckets] + ["inf"]
+        return {
+            'buckets': dict(zip(labels, self.counts)),
+            'count': self.count,
+            'avg': self.total / self.count if self.count else 0.0,
+            'p50': self.quantile(0.5),
+            'p99': self.quantile(0.99),
+            'max': self.max,
+        }
+
+
+class BatcherUnavailable(RuntimeError):
+    """Worker của batcher đã dừng trước khi chạy xong phần tử"""
+
+
+class MicroBatcher:
+    """Gom các request đang chờ thành batch rồi chạy model một lần cho cả batch
+
+    Một batch được chạy khi đủ max_batch phần tử hoặc phần tử đầu tiên đã chờ max_wait_ms.
+    run_batch(list phần tử) -> list/mảng kết quả cùng thứ tự, chạy trong executor.
+    timeout_ms chỉ giới hạn thời gian chờ trong hàng đợi: phần tử đã vào một batch đang chạy
+    luôn nhận kết quả của batch đó.
+    """
+
+    def __init__(self, run_batch: Callable[[List], Sequence], max_batch: int = 32,
+                 max_wait_ms: float = 5.0, timeout_ms: float = 2000.0, executor=None):
+        self.run_batch = run_batch
+        self.max_batch = max_batch
+        self.max_wait_ms = max_wait_ms
+        self.timeout_ms = timeout_ms
+        self.executor = executor
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self.batch_sizes = Histogram([1, 2, 4, 8, 16, 32, 64, 128])
+        self.queue_wait_ms = Histogram([1, 2, 5, 10, 20, 50, 100, 200, 500, 1000])
+        self.batch_ms = Histogram([1, 2, 5, 10, 20, 50, 100, 200, 500, 1000])
+        self._stats = {'batches': 0, 'items': 0, 'timeouts': 0, 'errors': 0}
+
+    @classmethod
+    def from_env(cls, run_batch: Callable[[List], Sequence], executor=None) -> "MicroBatcher":
+        """Tạo batcher theo biến môi trường EMBED_BATCH_MAX, EMBED_BATCH_WAIT_MS, EMBED_QUEUE_TIMEOUT_MS"""
+        return cls(
+            run_batch,
+            max_batch=int(os.getenv('EMBED_BATCH_MAX', '32')),
+            max_wait_ms=float(os.getenv('EMBED_BATCH_WAIT_MS', '5')),
+            # EMBED_REQUEST_TIMEOUT_MS: tên cũ, vẫn được đọc nếu chưa đặt tên mới
+            timeout_ms=float(os.getenv('EMBED_QUEUE_TIMEOUT_MS', os.getenv('EMBED_REQUEST_TIMEOUT_MS', '2000'))),
+            executor=executor
+        )
+
+    def _ensure_worker(self):
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+            # Worker dừng (lỗi hoặc bị huỷ): báo lỗi cho các phần tử còn trong hàng đợi của nó
+            self._worker.add_done_callback(functools.partial(self._fail_queued, self._queue))
+
+    @staticmethod
+    def _fail_queued(queue: asyncio.Queue, worker: asyncio.Task):
+        while not queue.empty():
+            _, future, _, timer = queue.get_nowait()
+            if timer is not None:
+                timer.cancel()
+            if not future.done():
+                future.set_exception(BatcherUnavailable("micro-batcher đã dừng"))
+
+    def _expire(self, future: asyncio.Future):
+        """Hết thời gian chờ trong hàng đợi mà chưa vào batch nào"""
+        if not future.done():
+            self._stats['timeouts'] += 1
+            future.set_exception(asyncio.TimeoutError())
+
+    async def submit(self, item, timeout_ms: float = None):
+        """Gửi một phần tử và chờ kết quả
+
+        asyncio.TimeoutError nếu chờ trong hàng đợi quá timeout_ms, BatcherUnavailable nếu worker
+        dừng trước khi chạy xong phần tử.
+        """
+        self._ensure_worker()
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        timeout_ms = timeout_ms if timeout_ms is not None else self.timeout_ms
+        timer = loop.call_later(timeout_ms / 1000, self._expire, future) if timeout_ms else None
+        await self._queue.put((item, future, time.monotonic(), timer))
+        try:
+            return await future
+        finally:
+            if timer is not None:
+                timer.cancel()
+
+    async def submit_many(self, items: Sequence, timeout_ms: float = None) -> List:
+        """Gửi nhiều phần tử (ví dụ mọi khuôn mặt trong một ảnh), có thể rơi vào cùng một batch"""
+        return list(await asyncio.gather(*[self.submit(item, timeout_ms) for item in items]))
+
+    async def _collect(self) -> List:
+        """Chờ phần tử đầu tiên rồi gom thêm đến khi đầy batch hoặc hết max_wait_ms"""
+        batch = [await self._queue.get()]
+        deadline = batch[0][2] + self.max_wait_ms / 1000
+        # Lấy ngay các phần tử đã xếp hàng trong lúc batch trước đang chạy
+        while len(batch) < self.max_batch and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout=remaining))
+            except asyncio.TimeoutError:
+                break
+        # Bỏ các request đã huỷ hoặc quá hạn trong lúc chờ; phần còn lại không còn bị tính hạn chờ
+        batch = [entry for entry in batch if not entry[1].done()]
+        for _, _, _, timer in batch:
+            if timer is not None:
+                timer.cancel()
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        batch = []
+        try:
+            while True:
+                batch = await self._collect()
+                if not batch:
+                    continue
+                started = time.monotonic()
+                for _, _, enqueued, _ in batch:
+                    self.queue_wait_ms.observe((started - enqueued) * 1000)
+                self.batch_sizes.observe(len(batch))
+                try:
+                    results = await loop.run_in_executor(self.executor, self.run_batch,
+                                                         [item for item, _, _, _ in batch])
+                except Exception as e:
+                    self._stats['errors'] += 1
+                    for _, future, _, _ in batch:
+                        if not future.done():
+                            future.set_exception(e)
+                    continue
+                self.batch_ms.observe((time.monotonic() - started) * 1000)
+                self._stats['batches'] += 1
+                self._stats['items'] += len(batch)
+                for (_, future, _, _), result in zip(batch, results):
+                    if not future.done():
+                        future.set_result(result)
+        finally:
+            # Worker bị huỷ giữa chừng: batch đang chạy không còn ai trả kết quả
+            for _, future, _, _ in batch:
+                if not future.done():
+                    future.set_exception(BatcherUnavailable("micro-batcher đã dừng"))
+
+    def metrics(self) -> Dict:
+        """Số liệu batcher: số batch, histogram kích thước batch, thời gian chờ và thời gian chạy"""
+        stats = dict(self._stats)
+        stats['avg_batch_size'] = stats['items'] / stats['batches'] if stats['batches'] else 0.0
+        stats['queued'] = self._queue.qsize() if self._queue is not None else 0
+        stats['max_batch'] = self.max_batch
+        stats['max_wait_ms'] = self.max_wait_ms
+        stats['batch_size'] = self.batch_sizes.snapshot()
+        stats['queue_wait_ms'] = self.queue_wait_ms.snapshot()
+        stats['batch_ms'] = self.batch_ms.snapshot()
+        return stats
@@ -0,0 +1,53 @@
+from typing import Iterable, Iterator, List, Sequence
+
+# Số dòng mỗi lệnh INSERT nhiều dòng / mỗi lần executemany
+DEFAULT_CHUNK_SIZE = 1000
+
+
+def chunked(items: Iterable, size: int = DEFAULT_CHUNK_SIZE) -> Iterator[List]:
+    """Chia một iterable thành các list tối đa size phần tử"""
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def build_multi_insert(table: str, columns: Sequence[str], row_count: int, on_duplicate: str = None) -> str:
+    """INSERT INTO table (cols) VALUES (%s, ...), (%s, ...) ... [ON DUPLICATE KEY UPDATE ...]"""
+    row = '(' + ', '.join(['%s'] * len(columns)) + ')'
+    query = f"INSERT INTO {table} ({', '.join(columns)}) VALUES " + ', '.join([row] * row_count)
+    if on_duplicate:
+        query += f" ON DUPLICATE KEY UPDATE {on_duplicate}"
+    return query
+
+
+def flatten_rows(rows: Sequence[Sequence]) -> tuple:
+    """Nối tham số của các dòng thành một tuple cho lệnh INSERT nhiều dòng"""
+    return tuple(value for row in rows for value in row)
+
+
+def insert_rows(cursor, table: str, columns: Sequence[str], rows: Sequence[Sequence],
+                chunk_size: int = DEFAULT_CHUNK_SIZE, on_duplicate: str = None) -> int:
+    """Chèn nhiều dòng bằng các lệnh INSERT nhiều dòng trên cursor có sẵn (trong transaction)
+
+    Trả về tổng số dòng bị ảnh hưởng.
+    """
+    affected = 0
+    for chunk in chunked(rows, chunk_size):
+        cursor.execute(build_multi_insert(table, columns, len(chunk), on_duplicate), flatten_rows(chunk))
+        affected += cursor.rowcount
+    return affected
+
+
+async def insert_rows_async(cursor, table: str, columns: Sequence[str], rows: Sequence[Sequence],
+                            chunk_size: int = DEFAULT_CHUNK_SIZE, on_duplicate: str = None) -> int:
+    """Như insert_rows cho cursor aiomysql"""
+    affected = 0
+    for chunk in chunked(rows, chunk_size):
+        await cursor.execute(build_multi_insert(table, columns, len(chunk), on_duplicate), flatten_rows(chunk))
+        affected += cursor.rowcount
+    return affected
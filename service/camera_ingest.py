@@ -0,0 +1,429 @@
+import os
+import threading
+import time
+import urllib.request
+from datetime import datetime
+from typing import Callable, Dict, Iterator, List, Optional, Set, Tuple
+from urllib.parse import urlparse
+
+import cv2
+import numpy as np
+
+from service.attendance import AttendanceRepository
+from service.attendance_marker import session_of
+from service.cameras import CamerasRepository
+from service.face_embeddings import FaceEmbeddingsRepository
+from service.face_engine import detect_and_embed_filtered, detect_faces, embed_crops
+from service.face_quality import FaceQualityFilter
+from service.face_tracker import FaceTracker
+from service.gallery import ClassGallery, build_template_gallery, templates_to_load
+from service.image_decode import decode_image
+
+# Số frame xử lý mỗi giây cho camera không đặt sample_fps
+CAMERA_SAMPLE_FPS = float(os.getenv('CAMERA_SAMPLE_FPS', '1'))
+CAMERA_RECOGNITION_THRESHOLD = float(os.getenv('CAMERA_RECOGNITION_THRESHOLD', '0.7'))
+# Số giây chờ trước khi mở lại nguồn bị mất kết nối
+CAMERA_RECONNECT_S = float(os.getenv('CAMERA_RECONNECT_S', '5'))
+# Nạp lại gallery của lớp sau số giây này (để nhận học sinh mới ghi danh)
+CAMERA_GALLERY_REFRESH_S = float(os.getenv('CAMERA_GALLERY_REFRESH_S', '300'))
+SNAPSHOT_TIMEOUT_S = 5
+
+SNAPSHOT_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+
+def is_snapshot_url(url: str) -> bool:
+    """URL http(s) trả về một ảnh mỗi lần gọi (khác với stream MJPEG)"""
+    parsed = urlparse(url)
+    if parsed.scheme not in ('http', 'https'):
+        return False
+    path = parsed.path.lower()
+    return path.endswith(SNAPSHOT_EXTENSIONS) or 'snapshot' in path
+
+
+class VideoSource:
+    """Nguồn RTSP / MJPEG / file video đọc bằng cv2.VideoCapture
+
+    Stream trực tiếp: grab() liên tục để bộ đệm không bị trễ, chỉ retrieve() (giải mã ra
+    mảng BGR) frame đến lượt lấy mẫu. File video: lấy mẫu theo thời gian trong video và chạy
+    nhanh nhất có thể (dùng làm nguồn thay thế khi kiểm thử).
+    """
+
+    def __init__(self, url: str, loop: bool = False):
+        self.url = url
+        self.is_file = os.path.isfile(url)
+        self.loop = loop
+        self._cap = None
+
+    def open(self):
+        cap = cv2.VideoCapture(self.url)
+        if not cap.isOpened():
+            raise ConnectionError(f"Không mở được nguồn video {self.url}")
+        if not self.is_file:
+            cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        self._cap = cap
+
+    def close(self):
+        if self._cap is not None:
+            self._cap.release()
+            self._cap = None
+
+    def frames(self, sample_fps: float, stop: threading.Event) -> Iterator[np.ndarray]:
+        if self._cap is None:
+            self.open()
+        cap = self._cap
+        if self.is_file:
+            video_fps = cap.get(cv2.CAP_PROP_FPS) or sample_fps
+            step = max(int(round(video_fps / sample_fps)), 1)
+            index = 0
+            while not stop.is_set():
+                if not cap.grab():
+                    if not self.loop:
+                        return
+                    cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                    index = 0
+                    continue
+                if index % step == 0:
+                    ok, frame = cap.retrieve()
+                    if ok:
+                        yield frame
+                index += 1
+            return
+
+        interval = 1.0 / sample_fps
+        last = 0.0
+        while not stop.is_set():
+            if not cap.grab():
+                raise ConnectionError(f"Mất kết nối nguồn video {self.url}")
+            now = time.monotonic()
+            if now - last < interval:
+                continue
+            ok, frame = cap.retrieve()
+            if not ok:
+                continue
+            last = now
+            yield frame
+
+
+class SnapshotSource:
+    """Nguồn HTTP trả về một ảnh JPEG mỗi lần gọi"""
+
+    def __init__(self, url: str):
+        self.url = url
+
+    def open(self):
+        pass
+
+    def close(self):
+        pass
+
+    def frames(self, sample_fps: float, stop: threading.Event) -> Iterator[np.ndarray]:
+        interval = 1.0 / sample_fps
+        while not stop.is_set():
+            started = time.monotonic()
+            try:
+                with urllib.request.urlopen(self.url, timeout=SNAPSHOT_TIMEOUT_S) as response:
+                    content = response.read()
+            except OSError as e:
+                raise ConnectionError(f"Không lấy được ảnh từ {self.url}: {e}")
+            img, _ = decode_image(content)
+            yield img
+            stop.wait(max(interval - (time.monotonic() - started), 0))
+
+
+def open_source(url: str, loop: bool = False):
+    """Chọn loại nguồn theo URL: ảnh snapshot HTTP hoặc VideoCapture (RTSP, MJPEG, file)"""
+    if is_snapshot_url(url):
+        return SnapshotSource(url)
+    return VideoSource(url, loop=loop)
+
+
+class FrameRecognizer:
+    """Nhận diện trên frame BGR đã giải mã: detect + embedding, ghép với gallery của lớp
+
+    Gallery nhiều ảnh mẫu (GALLERY_MODE) được nạp từ face_embeddings theo lớp và nạp lại sau
+    CAMERA_GALLERY_REFRESH_S giây.
+    """
+
+    def __init__(self, profile, threshold: float = CAMERA_RECOGNITION_THRESHOLD,
+                 gallery_refresh_s: float = CAMERA_GALLERY_REFRESH_S):
+        self.profile = profile
+        self.threshold = threshold
+        self.gallery_refresh_s = gallery_refresh_s
+        self._galleries: Dict[int, Tuple[float, ClassGallery]] = {}
+        self._lock = threading.Lock()
+
+    def gallery(self, class_id: int) -> ClassGallery:
+        cached = self._galleries.get(class_id)
+        if cached is not None and time.monotonic() - cached[0] < self.gallery_refresh_s:
+            return cached[1]
+        with self._lock:
+            cached = self._galleries.get(class_id)
+            if cached is not None and time.monotonic() - cached[0] < self.gallery_refresh_s:
+                return cached[1]
+            rows = FaceEmbeddingsRepository.get_embedding_templates_by_class(class_id, templates_to_load())
+            gallery = build_template_gallery(rows)
+            self._galleries[class_id] = (time.monotonic(), gallery)
+        return gallery
+
+    def invalidate(self, class_id: int = None):
+        with self._lock:
+            if class_id is None:
+                self._galleries.clear()
+            else:
+                self._galleries.pop(class_id, None)
+
+    def recognize(self, frame: np.ndarray, class_id: int, quality: FaceQualityFilter) -> Tuple[int, List[Dict]]:
+        """Trả về (số khuôn mặt đạt chất lượng, các học sinh khớp)"""
+        gallery = self.gallery(class_id)
+        embeddings, bboxes, _ = detect_and_embed_filtered(self.profile.model, frame, quality,
+                                                          det_size=self.profile.det_size)
+        matches = gallery.match_faces(embeddings, threshold=self.threshold)
+        return len(bboxes), [m for m in matches if m is not None]
+
+    def recognize_tracked(self, frame: np.ndarray, class_id: int, tracker: FaceTracker,
+                          quality: FaceQualityFilter) -> Tuple[int, List[Dict]]:
+        """Như recognize nhưng qua tracker: chỉ embedding các track cần nhận diện (mới / cần
+        kiểm tra lại) và đạt chất lượng, trả về các học sinh vừa được xác nhận đủ k / n phiếu"""
+        gallery = self.gallery(class_id)
+        model = self.profile.model
+        bboxes, kpss = detect_faces(model, frame, det_size=self.profile.det_size)
+        tracks = tracker.update(bboxes)
+        todo = [i for i, track in enumerate(tracks) if tracker.needs_embedding(track)]
+        if not todo:
+            return len(bboxes), []
+        crops, kept, _ = quality.select(model, frame, bboxes[todo], kpss[todo])
+        embedded = [todo[k] for k in kept]
+        for i in set(todo) - set(embedded):
+            tracker.mark_rejected(tracks[i])
+        if not crops:
+            return len(bboxes), []
+        matches = gallery.match_faces(embed_crops(model, crops), threshold=self.threshold)
+        confirmed = []
+        for i, match in zip(embedded, matches):
+            tracker.mark_embedded(tracks[i])
+            identity = tracker.vote(tracks[i], match)
+            if identity is not None:
+                confirmed.append(identity)
+        return len(bboxes), confirmed
+
+
+class CameraAttendanceWriter:
+    """Ghi điểm danh từ camera: mỗi học sinh một bản ghi cho mỗi (lớp, buổi, ngày)
+
+    Unique key uniq_attendance_student_class_session_day trên DB chặn bản ghi trùng (kể cả khi
+    khởi động lại hay nhiều process cùng ghi); tập "đã điểm danh" trong bộ nhớ chỉ để các frame
+    lặp lại không phải chạm DB.
+    """
+
+    def __init__(self, status: str = 'present'):
+        self.status = status
+        self._marked: Set[Tuple[int, int, str]] = set()
+        self._day = None
+        self._lock = threading.Lock()
+
+    def mark(self, camera_id: int, class_id: int, matches: List[Dict]) -> List[int]:
+        """Ghi các học sinh chưa được điểm danh; trả về student_id vừa ghi"""
+        now = datetime.now()
+        session = session_of(now)
+        with self._lock:
+            if now.date() != self._day:
+                self._marked.clear()
+                self._day = now.date()
+            pending = {}
+            for match in matches:
+                key = (class_id, match['student_id'], session)
+                if key not in self._marked:
+                    pending.setdefault(match['student_id'], match)
+            if not pending:
+                return []
+            records = [
+                {
+                    'student_id': student_id,
+                    'class_id': class_id,
+                    'session': session,
+                    'status': self.status,
+                    'method': 'face_recognition',
+                    'camera_id': camera_id,
+                    'note': f"score={match['score']:.3f}",
+                    'timestamp': now
+                }
+                for student_id, match in pending.items()
+            ]
+            created = AttendanceRepository.create_once(records)
+            if created is None:
+                return []
+            # Cả học sinh đã có bản ghi trên DB cũng coi như đã điểm danh
+            self._marked.update((class_id, student_id, session) for student_id in pending)
+        return [record['student_id'] for record in created]
+
+
+class CameraWorker(threading.Thread):
+    """Thread đọc một camera: lấy mẫu frame, nhận diện, ghi điểm danh; tự kết nối lại khi lỗi"""
+
+    def __init__(self, camera: Dict, recognizer: FrameRecognizer, writer: CameraAttendanceWriter,
+                 sample_fps: float = None, loop: bool = False,
+                 on_frame: Callable[[Dict, np.ndarray], bool] = None, tracker: FaceTracker = None):
+        super().__init__(name=f"camera-{camera['camera_id']}", daemon=True)
+        self.camera = camera
+        self.recognizer = recognizer
+        self.writer = writer
+        self.sample_fps = sample_fps or camera.get('sample_fps') or CAMERA_SAMPLE_FPS
+        self.source = open_source(camera['stream_url'], loop=loop)
+        # Bước lọc trước khi nhận diện: trả về False để bỏ qua frame; nếu có on_frame.reset(camera)
+        # thì được gọi mỗi lần nguồn được mở (lại)
+        self.on_frame = on_frame
+        # Theo dõi khuôn mặt giữa các frame (None: nhận diện mọi khuôn mặt ở mọi frame)
+        self.tracker = tracker
+        # Bộ lọc chất lượng riêng mỗi camera để bộ đếm phản ánh vị trí đặt camera
+        self.quality = FaceQualityFilter.from_env()
+        self._stop_event = threading.Event()
+        # Nguồn file đã đọc hết (không chạy lại)
+        self.finished = False
+        self._stats = {
+            'frames': 0,
+            'skipped': 0,
+            'faces': 0,
+            'matched': 0,
+            'marked': 0,
+            'errors': 0,
+            'reconnects': 0,
+            'total_ms': 0.0,
+            'last_frame_at': None,
+            'last_error': None,
+        }
+
+    def stop(self):
+        self._stop_event.set()
+
+    def process(self, frame: np.ndarray):
+        """Nhận diện một frame và ghi điểm danh"""
+        if self.on_frame is not None and not self.on_frame(self.camera, frame):
+            self._stats['skipped'] += 1
+            return
+        started = time.monotonic()
+        if self.tracker is not None:
+            faces, matches = self.recognizer.recognize_tracked(frame, self.camera['class_id'], self.tracker,
+                                                               self.quality)
+        else:
+            faces, matches = self.recognizer.recognize(frame, self.camera['class_id'], self.quality)
+        marked = self.writer.mark(self.camera['camera_id'], self.camera['class_id'], matches) if matches else []
+        self._stats['frames'] += 1
+        self._stats['faces'] += faces
+        self._stats['matched'] += len(matches)
+        self._stats['marked'] += len(marked)
+        self._stats['total_ms'] += (time.monotonic() - started) * 1000
+        self._stats['last_frame_at'] = datetime.now().isoformat(timespec='seconds')
+
+    def run(self):
+        while not self._stop_event.is_set():
+            reset = getattr(self.on_frame, 'reset', None)
+            if reset is not None:
+                reset(self.camera)
+            try:
+                for frame in self.source.frames(self.sample_fps, self._stop_event):
+                    self.process(frame)
+                if isinstance(self.source, VideoSource) and self.source.is_file:
+                    self.finished = True
+                    break
+            except Exception as e:
+                self._stats['errors'] += 1
+                self._stats['last_error'] = str(e)
+                print(f"✗ Camera {self.camera['camera_id']}: {e}")
+            finally:
+                self.source.close()
+            if self._stop_event.wait(CAMERA_RECONNECT_S):
+                break
+            self._stats['reconnects'] += 1
+
+    def metrics(self) -> Dict:
+        stats = dict(self._stats)
+        stats['avg_ms'] = round(stats.pop('total_ms') / stats['frames'], 2) if stats['frames'] else 0.0
+        # Ước lượng thời gian detect + embedding tiết kiệm được nhờ bước lọc frame
+        stats['saved_ms_est'] = round(stats['skipped'] * stats['avg_ms'], 1)
+        stats['sample_fps'] = self.sample_fps
+        stats['alive'] = self.is_alive()
+        if self.tracker is not None:
+            stats['tracking'] = self.tracker.metrics()
+        stats['quality'] = self.quality.metrics()
+        return stats
+
+
+class CameraIngestionService:
+    """Chạy một CameraWorker cho mỗi camera có stream_url và class_id trong bảng cameras
+
+    sources: thay nguồn của camera theo camera_id (ví dụ file video khi kiểm thử).
+    """
+
+    def __init__(self, recognizer: FrameRecognizer, writer: CameraAttendanceWriter = None,
+                 sample_fps: float = None, sources: Dict[int, str] = None, loop: bool = False,
+                 on_frame: Callable[[Dict, np.ndarray], bool] = None, tracking: bool = True):
+        self.recognizer = recognizer
+        self.writer = writer or CameraAttendanceWriter()
+        self.sample_fps = sample_fps
+        self.sources = sources or {}
+        self.loop = loop
+        self.on_frame = on_frame
+        self.tracking = tracking
+        self.workers: Dict[int, CameraWorker] = {}
+
+    def load_cameras(self) -> List[Dict]:
+        cameras = {c['camera_id']: c for c in CamerasRepository.get_stream_cameras()}
+        for camera_id, url in self.sources.items():
+            camera = cameras.get(camera_id) or CamerasRepository.get_camera_by_id(camera_id)
+            if camera is None:
+                print(f"✗ Không có camera {camera_id}")
+                continue
+            cameras[camera_id] = dict(camera, stream_url=url)
+        usable = []
+        for camera in cameras.values():
+            if not camera.get('class_id'):
+                print(f"⚠ Camera {camera['camera_id']} chưa gán class_id, bỏ qua")
+                continue
+            usable.append(camera)
+        return usable
+
+    def sync(self):
+        """Khởi động camera mới, dừng camera bị xoá hoặc đổi nguồn / lớp"""
+        cameras = {c['camera_id']: c for c in self.load_cameras()}
+        for camera_id, worker in list(self.workers.items()):
+            camera = cameras.get(camera_id)
+            changed = camera is None or any(
+                camera.get(key) != worker.camera.get(key) for key in ('stream_url', 'class_id', 'sample_fps')
+            )
+            if changed:
+                worker.stop()
+                del self.workers[camera_id]
+        for camera_id, camera in cameras.items():
+            worker = self.workers.get(camera_id)
+            if worker is not None and (worker.is_alive() or worker.finished):
+                # Cấu hình không cần mở lại nguồn (ví dụ motion_threshold) có hiệu lực ngay
+                worker.camera = camera
+                continue
+            worker = CameraWorker(camera, self.recognizer, self.writer, sample_fps=self.sample_fps,
+                                  loop=self.loop, on_frame=self.on_frame,
+                                  tracker=FaceTracker() if self.tracking else None)
+            self.workers[camera_id] = worker
+            worker.start()
+            print(f"✓ Camera {camera_id} ({camera.get('camera_name')}) -> lớp {camera['class_id']}")
+
+    def run(self, refresh_s: float = 60, stop: threading.Event = None):
+        """Chạy tới khi stop được set (hoặc mọi nguồn file đã đọc xong), đọc lại bảng cameras định kỳ"""
+        stop = stop or threading.Event()
+        self.sync()
+        next_sync = time.monotonic() + refresh_s
+        while not stop.wait(1):
+            if self.workers and all(worker.finished for worker in self.workers.values()):
+                break
+            if time.monotonic() >= next_sync:
+                self.sync()
+                next_sync = time.monotonic() + refresh_s
+        self.stop()
+
+    def stop(self, timeout: float = 5):
+        for worker in self.workers.values():
+            worker.stop()
+        for worker in self.workers.values():
+            worker.join(timeout)
+
+    def metrics(self) -> Dict[int, Dict]:
+        return {camera_id: worker.metrics() for camera_id, worker in self.workers.items()}
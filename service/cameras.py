@@ -1,5 +1,117 @@
 from service.db_connection import db
+from service.async_db_connection import async_db
+from service.queries import like_params, update_query
 from typing import List, Dict, Optional
+from urllib.parse import urlsplit, urlunsplit
+
+# Câu query dùng chung cho CamerasRepository và AsyncCamerasRepository
+CAMERA_COLUMNS = """
+        camera_id,
+        camera_name,
+        location,
+        ip_address,
+        stream_url,
+        class_id,
+        sample_fps,
+        motion_threshold
+"""
+
+ALL_CAMERAS_QUERY = f"""
+    SELECT {CAMERA_COLUMNS}
+    FROM cameras
+    ORDER BY camera_name
+"""
+
+CAMERA_BY_ID_QUERY = f"""
+    SELECT {CAMERA_COLUMNS}
+    FROM cameras
+    WHERE camera_id = %s
+"""
+
+STREAM_CAMERAS_QUERY = f"""
+    SELECT {CAMERA_COLUMNS}
+    FROM cameras
+    WHERE stream_url IS NOT NULL AND stream_url <> ''
+    ORDER BY camera_id
+"""
+
+CAMERAS_BY_LOCATION_QUERY = f"""
+    SELECT {CAMERA_COLUMNS}
+    FROM cameras
+    WHERE location LIKE %s
+    ORDER BY camera_name
+"""
+
+SEARCH_CAMERAS_QUERY = f"""
+    SELECT {CAMERA_COLUMNS}
+    FROM cameras
+    WHERE camera_name LIKE %s OR location LIKE %s OR ip_address LIKE %s
+    ORDER BY camera_name
+"""
+
+CREATE_CAMERA_QUERY = """
+    INSERT INTO cameras
+    (camera_name, location, ip_address, stream_url, class_id, sample_fps, motion_threshold)
+    VALUES (%s, %s, %s, %s, %s, %s, %s)
+"""
+
+DELETE_CAMERA_QUERY = "DELETE FROM cameras WHERE camera_id = %s"
+
+CAMERA_STATISTICS_QUERY = """
+    SELECT 
+        c.camera_id,
+        c.camera_name,
+        c.location,
+        COUNT(a.attendance_id) as total_attendance_records
+    FROM cameras c
+    LEFT JOIN attendance a ON c.camera_id = a.camera_id
+    WHERE c.camera_id = %s
+    GROUP BY c.camera_id, c.camera_name, c.location
+"""
+
+
+def redact_stream_url(url: Optional[str]) -> Optional[str]:
+    """Bỏ user:password@ và query string (thường chứa mật khẩu / token) khỏi stream_url trả về client"""
+    if not url:
+        return url
+    parts = urlsplit(url)
+    if not parts.netloc:
+        return url
+    host = parts.netloc.rpartition('@')[2]
+    return urlunsplit((parts.scheme, host, parts.path, '', ''))
+
+
+def redact_cameras(cameras: List[Dict]) -> List[Dict]:
+    """Ẩn thông tin đăng nhập trong stream_url; chỉ dịch vụ đọc camera (get_stream_cameras) cần URL đầy đủ"""
+    for camera in cameras:
+        camera['stream_url'] = redact_stream_url(camera.get('stream_url'))
+    return cameras
+
+
+def update_camera_query(camera_id: int, camera_name: str = None, location: str = None,
+                        ip_address: str = None, stream_url: str = None, class_id: int = None,
+                        sample_fps: float = None, motion_threshold: float = None):
+    """Câu UPDATE cho các trường được truyền, None nếu không có gì để cập nhật
+
+    motion_threshold = 0 là giá trị hợp lệ (tắt lọc chuyển động) nên vẫn được ghi.
+    """
+    return update_query('cameras', 'camera_id', camera_id, {
+        'camera_name': camera_name,
+        'location': location,
+        'ip_address': ip_address,
+        'stream_url': stream_url,
+        'class_id': class_id,
+        'sample_fps': sample_fps,
+        'motion_threshold': motion_threshold,
+    }, keep_falsy=('motion_threshold',))
+
+
+def camera_statistics(camera_id: int, results: List[Dict]) -> Dict:
+    """Dòng thống kê camera, hoặc số 0 nếu camera không tồn tại"""
+    return results[0] if results else {
+        'camera_id': camera_id,
+        'total_attendance_records': 0
+    }
 
 class CamerasRepository:
     """Repository để trích xuất và quản lý dữ liệu camera"""
@@ -7,77 +119,42 @@ class CamerasRepository:
     @staticmethod
     def get_all_cameras() -> List[Dict]:
         """Lấy tất cả camera"""
-        query = """
-            SELECT 
-                camera_id,
-                camera_name,
-                location,
-                ip_address
-            FROM cameras
-            ORDER BY camera_name
-        """
-        return db.execute_query(query)
+        return redact_cameras(db.execute_query(ALL_CAMERAS_QUERY))
     
     @staticmethod
     def get_camera_by_id(camera_id: int) -> Optional[Dict]:
         """Lấy camera theo ID"""
-        query = """
-            SELECT 
-                camera_id,
-                camera_name,
-                location,
-                ip_address
-            FROM cameras
-            WHERE camera_id = %s
-        """
-        results = db.execute_query(query, (camera_id,))
+        results = redact_cameras(db.execute_query(CAMERA_BY_ID_QUERY, (camera_id,)))
         return results[0] if results else None
     
+    @staticmethod
+    def get_stream_cameras() -> List[Dict]:
+        """Lấy các camera có nguồn stream, stream_url đầy đủ (chỉ dùng cho dịch vụ đọc camera, không trả ra API)"""
+        return db.execute_query(STREAM_CAMERAS_QUERY)
+    
     @staticmethod
     def get_cameras_by_location(location: str) -> List[Dict]:
         """Lấy camera theo vị trí"""
-        query = """
-            SELECT 
-                camera_id,
-                camera_name,
-                location,
-                ip_address
-            FROM cameras
-            WHERE location LIKE %s
-            ORDER BY camera_name
-        """
-        search_pattern = f"%{location}%"
-        return db.execute_query(query, (search_pattern,))
+        return redact_cameras(db.execute_query(CAMERAS_BY_LOCATION_QUERY, like_params(location, 1)))
     
     @staticmethod
     def search_cameras(keyword: str) -> List[Dict]:
         """Tìm kiếm camera theo tên hoặc vị trí"""
-        query = """
-            SELECT 
-                camera_id,
-                camera_name,
-                location,
-                ip_address
-            FROM cameras
-            WHERE camera_name LIKE %s OR location LIKE %s OR ip_address LIKE %s
-            ORDER BY camera_name
-        """
-        search_pattern = f"%{keyword}%"
-        return db.execute_query(query, (search_pattern, search_pattern, search_pattern))
+        return redact_cameras(db.execute_query(SEARCH_CAMERAS_QUERY, like_params(keyword, 3)))
     
     @staticmethod
     def create_camera(
         camera_name: str,
         location: str = None,
-        ip_address: str = None
+        ip_address: str = None,
+        stream_url: str = None,
+        class_id: int = None,
+        sample_fps: float = None,
+        motion_threshold: float = None
     ) -> int:
         """Tạo camera mới"""
-        query = """
-            INSERT INTO cameras (camera_name, location, ip_address)
-            VALUES (%s, %s, %s)
-        """
-        params = (camera_name, location, ip_address)
-        _, last_id = db.execute_update(query, params)
+        params = (camera_name, location, ip_address, stream_url, class_id, sample_fps, motion_threshold)
+        _, last_id = db.execute_update(CREATE_CAMERA_QUERY, params)
         return last_id
     
     @staticmethod
@@ -85,54 +162,101 @@ class CamerasRepository:
         camera_id: int,
         camera_name: str = None,
         location: str = None,
-        ip_address: str = None
+        ip_address: str = None,
+        stream_url: str = None,
+        class_id: int = None,
+        sample_fps: float = None,
+        motion_threshold: float = None
     ) -> bool:
         """Cập nhật thông tin camera"""
-        updates = []
-        params = []
-        
-        if camera_name:
-            updates.append("camera_name = %s")
-            params.append(camera_name)
-        if location:
-            updates.append("location = %s")
-            params.append(location)
-        if ip_address:
-            updates.append("ip_address = %s")
-            params.append(ip_address)
-        
-        if not updates:
+        update = update_camera_query(camera_id, camera_name, location, ip_address, stream_url,
+                                     class_id, sample_fps, motion_threshold)
+        if update is None:
             return False
-        
-        params.append(camera_id)
-        query = f"UPDATE cameras SET {', '.join(updates)} WHERE camera_id = %s"
-        affected_rows, _ = db.execute_update(query, tuple(params))
+        affected_rows, _ = db.execute_update(*update)
         return affected_rows > 0
     
     @staticmethod
     def delete_camera(camera_id: int) -> bool:
         """Xóa camera"""
-        query = "DELETE FROM cameras WHERE camera_id = %s"
-        affected_rows, _ = db.execute_update(query, (camera_id,))
+        affected_rows, _ = db.execute_update(DELETE_CAMERA_QUERY, (camera_id,))
         return affected_rows > 0
     
     @staticmethod
     def get_camera_statistics(camera_id: int) -> Dict:
         """Lấy thống kê camera (số lần điểm danh qua camera này)"""
-        query = """
-            SELECT 
-                c.camera_id,
-                c.camera_name,
-                c.location,
-                COUNT(a.attendance_id) as total_attendance_records
-            FROM cameras c
-            LEFT JOIN attendance a ON c.camera_id = a.camera_id
-            WHERE c.camera_id = %s
-            GROUP BY c.camera_id, c.camera_name, c.location
-        """
-        results = db.execute_query(query, (camera_id,))
-        return results[0] if results else {
-            'camera_id': camera_id,
-            'total_attendance_records': 0
-        }
+        return camera_statistics(camera_id, db.execute_query(CAMERA_STATISTICS_QUERY, (camera_id,)))
 
+class AsyncCamerasRepository:
+    """Repository để trích xuất và quản lý dữ liệu camera (bất đồng bộ, dùng cho các endpoint async)"""
+    
+    @staticmethod
+    async def get_all_cameras() -> List[Dict]:
+        """Lấy tất cả camera"""
+        return redact_cameras(await async_db.execute_query(ALL_CAMERAS_QUERY))
+    
+    @staticmethod
+    async def get_camera_by_id(camera_id: int) -> Optional[Dict]:
+        """Lấy camera theo ID"""
+        results = redact_cameras(await async_db.execute_query(CAMERA_BY_ID_QUERY, (camera_id,)))
+        return results[0] if results else None
+    
+    @staticmethod
+    async def get_stream_cameras() -> List[Dict]:
+        """Lấy các camera có nguồn stream, stream_url đầy đủ (chỉ dùng cho dịch vụ đọc camera, không trả ra API)"""
+        return await async_db.execute_query(STREAM_CAMERAS_QUERY)
+    
+    @staticmethod
+    async def get_cameras_by_location(location: str) -> List[Dict]:
+        """Lấy camera theo vị trí"""
+        return redact_cameras(await async_db.execute_query(CAMERAS_BY_LOCATION_QUERY, like_params(location, 1)))
+    
+    @staticmethod
+    async def search_cameras(keyword: str) -> List[Dict]:
+        """Tìm kiếm camera theo tên hoặc vị trí"""
+        return redact_cameras(await async_db.execute_query(SEARCH_CAMERAS_QUERY, like_params(keyword, 3)))
+    
+    @staticmethod
+    async def create_camera(
+        camera_name: str,
+        location: str = None,
+        ip_address: str = None,
+        stream_url: str = None,
+        class_id: int = None,
+        sample_fps: float = None,
+        motion_threshold: float = None
+    ) -> int:
+        """Tạo camera mới"""
+        params = (camera_name, location, ip_address, stream_url, class_id, sample_fps, motion_threshold)
+        _, last_id = await async_db.execute_update(CREATE_CAMERA_QUERY, params)
+        return last_id
+    
+    @staticmethod
+    async def update_camera(
+        camera_id: int,
+        camera_name: str = None,
+        location: str = None,
+        ip_address: str = None,
+        stream_url: str = None,
+        class_id: int = None,
+        sample_fps: float = None,
+        motion_threshold: float = None
+    ) -> bool:
+        """Cập nhật thông tin camera"""
+        update = update_camera_query(camera_id, camera_name, location, ip_address, stream_url,
+                                     class_id, sample_fps, motion_threshold)
+        if update is None:
+            return False
+        affected_rows, _ = await async_db.execute_update(*update)
+        return affected_rows > 0
+    
+    @staticmethod
+    async def delete_camera(camera_id: int) -> bool:
+        """Xóa camera"""
+        affected_rows, _ = await async_db.execute_update(DELETE_CAMERA_QUERY, (camera_id,))
+        return affected_rows > 0
+    
+    @staticmethod
+    async def get_camera_statistics(camera_id: int) -> Dict:
+        """Lấy thống kê camera (số lần điểm danh qua camera này)"""
+        return camera_statistics(camera_id, await async_db.execute_query(CAMERA_STATISTICS_QUERY, (camera_id,)))
@@ -1,92 +1,140 @@
 from service.db_connection import db
+from service.async_db_connection import async_db
+from service.queries import like_params, update_query
 from typing import List, Dict, Optional
 
+# Câu query dùng chung cho ClassesRepository và AsyncClassesRepository
+ALL_CLASSES_QUERY = """
+    SELECT 
+        c.class_id,
+        c.class_name,
+        c.teacher_id,
+        t.full_name as teacher_name,
+        t.email as teacher_email
+    FROM classes c
+    JOIN teachers t ON c.teacher_id = t.teacher_id
+    ORDER BY c.class_name
+"""
+
+CLASS_BY_ID_QUERY = """
+    SELECT 
+        c.class_id,
+        c.class_name,
+        c.teacher_id,
+        t.full_name as teacher_name,
+        t.email as teacher_email,
+        t.phone as teacher_phone
+    FROM classes c
+    JOIN teachers t ON c.teacher_id = t.teacher_id
+    WHERE c.class_id = %s
+"""
+
+CLASSES_BY_TEACHER_QUERY = """
+    SELECT 
+        c.class_id,
+        c.class_name,
+        c.teacher_id,
+        t.full_name as teacher_name
+    FROM classes c
+    JOIN teachers t ON c.teacher_id = t.teacher_id
+    WHERE c.teacher_id = %s
+    ORDER BY c.class_name
+"""
+
+SEARCH_CLASSES_QUERY = """
+    SELECT 
+        c.class_id,
+        c.class_name,
+        c.teacher_id,
+        t.full_name as teacher_name
+    FROM classes c
+    JOIN teachers t ON c.teacher_id = t.teacher_id
+    WHERE c.class_name LIKE %s OR t.full_name LIKE %s
+    ORDER BY c.class_name
+"""
+
+CLASS_STUDENTS_QUERY = """
+    SELECT 
+        s.student_id,
+        s.full_name,
+        s.date_of_birth,
+        s.gender,
+        s.student_code,
+        s.avatar_url
+    FROM students s
+    WHERE s.class_id = %s
+    ORDER BY s.full_name
+"""
+
+CREATE_CLASS_QUERY = """
+    INSERT INTO classes (class_name, teacher_id)
+    VALUES (%s, %s)
+"""
+
+DELETE_CLASS_QUERY = "DELETE FROM classes WHERE class_id = %s"
+
+CLASS_STATISTICS_QUERY = """
+    SELECT 
+        c.class_id,
+        c.class_name,
+        COUNT(DISTINCT s.student_id) as total_students,
+        COUNT(DISTINCT a.attendance_id) as total_attendance_records
+    FROM classes c
+    LEFT JOIN students s ON c.class_id = s.class_id
+    LEFT JOIN attendance a ON c.class_id = a.class_id
+    WHERE c.class_id = %s
+    GROUP BY c.class_id, c.class_name
+"""
+
+def update_class_query(class_id: int, class_name: str = None, teacher_id: int = None):
+    """Câu UPDATE cho các trường được truyền, None nếu không có gì để cập nhật"""
+    return update_query('classes', 'class_id', class_id, {
+        'class_name': class_name,
+        'teacher_id': teacher_id,
+    })
+
+def with_students(class_info: Dict, students: List[Dict]) -> Dict:
+    """Gắn danh sách học sinh vào thông tin lớp"""
+    class_info['students'] = students
+    class_info['student_count'] = len(students)
+    return class_info
+
+def class_statistics(class_id: int, results: List[Dict]) -> Dict:
+    """Dòng thống kê lớp, hoặc số 0 nếu lớp không tồn tại"""
+    return results[0] if results else {
+        'class_id': class_id,
+        'total_students': 0,
+        'total_attendance_records': 0
+    }
+
 class ClassesRepository:
     """Repository để trích xuất và quản lý dữ liệu lớp học"""
     
     @staticmethod
     def get_all_classes() -> List[Dict]:
         """Lấy tất cả lớp học"""
-        query = """
-            SELECT 
-                c.class_id,
-                c.class_name,
-                c.teacher_id,
-                t.full_name as teacher_name,
-                t.email as teacher_email
-            FROM classes c
-            JOIN teachers t ON c.teacher_id = t.teacher_id
-            ORDER BY c.class_name
-        """
-        return db.execute_query(query)
+        return db.execute_query(ALL_CLASSES_QUERY)
     
     @staticmethod
     def get_class_by_id(class_id: int) -> Optional[Dict]:
         """Lấy lớp học theo ID"""
-        query = """
-            SELECT 
-                c.class_id,
-                c.class_name,
-                c.teacher_id,
-                t.full_name as teacher_name,
-                t.email as teacher_email,
-                t.phone as teacher_phone
-            FROM classes c
-            JOIN teachers t ON c.teacher_id = t.teacher_id
-            WHERE c.class_id = %s
-        """
-        results = db.execute_query(query, (class_id,))
+        results = db.execute_query(CLASS_BY_ID_QUERY, (class_id,))
         return results[0] if results else None
     
     @staticmethod
     def get_classes_by_teacher(teacher_id: int) -> List[Dict]:
         """Lấy tất cả lớp học của một giáo viên"""
-        query = """
-            SELECT 
-                c.class_id,
-                c.class_name,
-                c.teacher_id,
-                t.full_name as teacher_name
-            FROM classes c
-            JOIN teachers t ON c.teacher_id = t.teacher_id
-            WHERE c.teacher_id = %s
-            ORDER BY c.class_name
-        """
-        return db.execute_query(query, (teacher_id,))
+        return db.execute_query(CLASSES_BY_TEACHER_QUERY, (teacher_id,))
     
     @staticmethod
     def search_classes(keyword: str) -> List[Dict]:
         """Tìm kiếm lớp học theo tên lớp hoặc tên giáo viên"""
-        query = """
-            SELECT 
-                c.class_id,
-                c.class_name,
-                c.teacher_id,
-                t.full_name as teacher_name
-            FROM classes c
-            JOIN teachers t ON c.teacher_id = t.teacher_id
-            WHERE c.class_name LIKE %s OR t.full_name LIKE %s
-            ORDER BY c.class_name
-        """
-        search_pattern = f"%{keyword}%"
-        return db.execute_query(query, (search_pattern, search_pattern))
+        return db.execute_query(SEARCH_CLASSES_QUERY, like_params(keyword))
     
     @staticmethod
     def get_class_students(class_id: int) -> List[Dict]:
         """Lấy tất cả học sinh trong một lớp"""
-        query = """
-            SELECT 
-                s.student_id,
-                s.full_name,
-                s.date_of_birth,
-                s.gender,
-                s.student_code,
-                s.avatar_url
-            FROM students s
-            WHERE s.class_id = %s
-            ORDER BY s.full_name
-        """
-        return db.execute_query(query, (class_id,))
+        return db.execute_query(CLASS_STUDENTS_QUERY, (class_id,))
     
     @staticmethod
     def get_class_with_students(class_id: int) -> Optional[Dict]:
@@ -94,21 +142,12 @@ class ClassesRepository:
         class_info = ClassesRepository.get_class_by_id(class_id)
         if not class_info:
             return None
-        
-        students = ClassesRepository.get_class_students(class_id)
-        class_info['students'] = students
-        class_info['student_count'] = len(students)
-        return class_info
+        return with_students(class_info, ClassesRepository.get_class_students(class_id))
     
     @staticmethod
     def create_class(class_name: str, teacher_id: int) -> int:
         """Tạo lớp học mới"""
-        query = """
-            INSERT INTO classes (class_name, teacher_id)
-            VALUES (%s, %s)
-        """
-        params = (class_name, teacher_id)
-        _, last_id = db.execute_update(query, params)
+        _, last_id = db.execute_update(CREATE_CLASS_QUERY, (class_name, teacher_id))
         return last_id
     
     @staticmethod
@@ -118,50 +157,86 @@ class ClassesRepository:
         teacher_id: int = None
     ) -> bool:
         """Cập nhật thông tin lớp học"""
-        updates = []
-        params = []
-        
-        if class_name:
-            updates.append("class_name = %s")
-            params.append(class_name)
-        if teacher_id:
-            updates.append("teacher_id = %s")
-            params.append(teacher_id)
-        
-        if not updates:
+        update = update_class_query(class_id, class_name, teacher_id)
+        if update is None:
             return False
-        
-        params.append(class_id)
-        query = f"UPDATE classes SET {', '.join(updates)} WHERE class_id = %s"
-        affected_rows, _ = db.execute_update(query, tuple(params))
+        affected_rows, _ = db.execute_update(*update)
         return affected_rows > 0
     
     @staticmethod
     def delete_class(class_id: int) -> bool:
         """Xóa lớp học"""
-        query = "DELETE FROM classes WHERE class_id = %s"
-        affected_rows, _ = db.execute_update(query, (class_id,))
+        affected_rows, _ = db.execute_update(DELETE_CLASS_QUERY, (class_id,))
         return affected_rows > 0
     
     @staticmethod
     def get_class_statistics(class_id: int) -> Dict:
         """Lấy thống kê lớp học (số học sinh, số điểm danh)"""
-        query = """
-            SELECT 
-                c.class_id,
-                c.class_name,
-                COUNT(DISTINCT s.student_id) as total_students,
-                COUNT(DISTINCT a.attendance_id) as total_attendance_records
-            FROM classes c
-            LEFT JOIN students s ON c.class_id = s.class_id
-            LEFT JOIN attendance a ON c.class_id = a.class_id
-            WHERE c.class_id = %s
-            GROUP BY c.class_id, c.class_name
-        """
-        results = db.execute_query(query, (class_id,))
-        return results[0] if results else {
-            'class_id': class_id,
-            'total_students': 0,
-            'total_attendance_records': 0
-        }
+        return class_statistics(class_id, db.execute_query(CLASS_STATISTICS_QUERY, (class_id,)))
 
+class AsyncClassesRepository:
+    """Repository để trích xuất và quản lý dữ liệu lớp học (bất đồng bộ, dùng cho các endpoint async)"""
+    
+    @staticmethod
+    async def get_all_classes() -> List[Dict]:
+        """Lấy tất cả lớp học"""
+        return await async_db.execute_query(ALL_CLASSES_QUERY)
+    
+    @staticmethod
+    async def get_class_by_id(class_id: int) -> Optional[Dict]:
+        """Lấy lớp học theo ID"""
+        results = await async_db.execute_query(CLASS_BY_ID_QUERY, (class_id,))
+        return results[0] if results else None
+    
+    @staticmethod
+    async def get_classes_by_teacher(teacher_id: int) -> List[Dict]:
+        """Lấy tất cả lớp học của một giáo viên"""
+        return await async_db.execute_query(CLASSES_BY_TEACHER_QUERY, (teacher_id,))
+    
+    @staticmethod
+    async def search_classes(keyword: str) -> List[Dict]:
+        """Tìm kiếm lớp học theo tên lớp hoặc tên giáo viên"""
+        return await async_db.execute_query(SEARCH_CLASSES_QUERY, like_params(keyword))
+    
+    @staticmethod
+    async def get_class_students(class_id: int) -> List[Dict]:
+        """Lấy tất cả học sinh trong một lớp"""
+        return await async_db.execute_query(CLASS_STUDENTS_QUERY, (class_id,))
+    
+    @staticmethod
+    async def get_class_with_students(class_id: int) -> Optional[Dict]:
+        """Lấy thông tin lớp học kèm danh sách học sinh"""
+        class_info = await AsyncClassesRepository.get_class_by_id(class_id)
+        if not class_info:
+            return None
+        return with_students(class_info, await AsyncClassesRepository.get_class_students(class_id))
+    
+    @staticmethod
+    async def create_class(class_name: str, teacher_id: int) -> int:
+        """Tạo lớp học mới"""
+        _, last_id = await async_db.execute_update(CREATE_CLASS_QUERY, (class_name, teacher_id))
+        return last_id
+    
+    @staticmethod
+    async def update_class(
+        class_id: int,
+        class_name: str = None,
+        teacher_id: int = None
+    ) -> bool:
+        """Cập nhật thông tin lớp học"""
+        update = update_class_query(class_id, class_name, teacher_id)
+        if update is None:
+            return False
+        affected_rows, _ = await async_db.execute_update(*update)
+        return affected_rows > 0
+    
+    @staticmethod
+    async def delete_class(class_id: int) -> bool:
+        """Xóa lớp học"""
+        affected_rows, _ = await async_db.execute_update(DELETE_CLASS_QUERY, (class_id,))
+        return affected_rows > 0
+    
+    @staticmethod
+    async def get_class_statistics(class_id: int) -> Dict:
+        """Lấy thống kê lớp học (số học sinh, số điểm danh)"""
+        return class_statistics(class_id, await async_db.execute_query(CLASS_STATISTICS_QUERY, (class_id,)))
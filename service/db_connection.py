@@ -1,17 +1,154 @@
 import mysql.connector
 from mysql.connector import Error
+from mysql.connector.errors import PoolError
 import os
-from typing import Optional
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional, Sequence
 from dotenv import load_dotenv
 
+from service.bulk import DEFAULT_CHUNK_SIZE, chunked, insert_rows
+
 # Load biến môi trường từ file .env
 load_dotenv()
 
+class ConnectionPool:
+    """Pool kết nối MySQL: checkout theo từng lần gọi, có timeout và health-check định kỳ"""
+    
+    def __init__(self, config: Dict, size: int = 5, timeout: float = 10.0, health_check_interval: float = 30.0):
+        self.config = config
+        self.size = size
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        # LIFO để ưu tiên kết nối vừa dùng (còn "nóng", ít cần ping)
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._closed = False
+        self._stats = {
+            'in_use': 0,
+            'checkouts': 0,
+            'waits': 0,
+            'total_wait_ms': 0.0,
+            'max_wait_ms': 0.0,
+            'timeouts': 0,
+            'reconnects': 0,
+        }
+    
+    def _new_connection(self):
+        """Mở kết nối mới (được gọi khi pool chưa đủ size)"""
+        try:
+            return mysql.connector.connect(**self.config)
+        except Error:
+            with self._lock:
+                self._created -= 1
+            raise
+    
+    def acquire(self):
+        """Lấy một kết nối ra khỏi pool, chờ tối đa self.timeout giây"""
+        if self._closed:
+            raise PoolError("Pool đã đóng")
+        
+        start = time.monotonic()
+        try:
+            conn, last_used = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                can_create = self._created < self.size
+                if can_create:
+                    self._created += 1
+            if can_create:
+                conn, last_used = self._new_connection(), time.monotonic()
+            else:
+                with self._lock:
+                    self._stats['waits'] += 1
+                try:
+                    conn, last_used = self._idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    with self._lock:
+                        self._stats['timeouts'] += 1
+                    raise PoolError(f"Hết thời gian chờ kết nối từ pool ({self.timeout}s)")
+        
+        # Chỉ ping server khi kết nối đã rảnh lâu hơn health_check_interval
+        if time.monotonic() - last_used > self.health_check_interval and not conn.is_connected():
+            try:
+                conn.reconnect(attempts=2, delay=0)
+            except Error:
+                with self._lock:
+                    self._created -= 1
+                raise
+            with self._lock:
+                self._stats['reconnects'] += 1
+        
+        wait_ms = (time.monotonic() - start) * 1000
+        with self._lock:
+            self._stats['in_use'] += 1
+            self._stats['checkouts'] += 1
+            self._stats['total_wait_ms'] += wait_ms
+            self._stats['max_wait_ms'] = max(self._stats['max_wait_ms'], wait_ms)
+        return conn
+    
+    def release(self, conn, broken: bool = False):
+        """Trả kết nối về pool (đóng hẳn nếu kết nối bị lỗi)"""
+        with self._lock:
+            self._stats['in_use'] -= 1
+        
+        if not broken and not self._closed:
+            try:
+                # Kết thúc transaction còn mở để lần sau không đọc snapshot cũ
+                if conn.in_transaction:
+                    conn.rollback()
+                self._idle.put((conn, time.monotonic()))
+                return
+            except Error:
+                pass
+        
+        with self._lock:
+            self._created -= 1
+        try:
+            conn.close()
+        except Error:
+            pass
+    
+    def close(self):
+        """Đóng tất cả kết nối đang rảnh"""
+        self._closed = True
+        while True:
+            try:
+                conn, _ = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            with self._lock:
+                self._created -= 1
+            try:
+                conn.close()
+            except Error:
+                pass
+    
+    def metrics(self) -> Dict:
+        """Số liệu của pool: kết nối đang dùng, thời gian chờ, số lần reconnect..."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['size'] = self.size
+            stats['open'] = self._created
+        stats['idle'] = self._idle.qsize()
+        stats['avg_wait_ms'] = stats['total_wait_ms'] / stats['checkouts'] if stats['checkouts'] else 0.0
+        return stats
+
 class DatabaseConnection:
-    """Quản lý kết nối MySQL database"""
+    """Quản lý kết nối MySQL database
+    
+    Mặc định dùng pool (DB_POOL_SIZE > 0): mỗi query checkout một kết nối riêng
+    nên nhiều worker có thể chạy song song. DB_POOL_SIZE=0 dùng một kết nối duy nhất như cũ.
+    """
     
     def __init__(self):
         self.connection: Optional[mysql.connector.MySQLConnection] = None
+        self.pool: Optional[ConnectionPool] = None
+        # Pool được tạo lazily từ checkout() ở nhiều thread, khóa để chỉ tạo một lần
+        self._connect_lock = threading.Lock()
         self.config = {
             'host': os.getenv('DB_HOST', 'localhost'),
             'database': os.getenv('DB_NAME', 'ai_attendance'),
@@ -20,10 +157,32 @@ class DatabaseConnection:
             'charset': 'utf8mb4',
             'collation': 'utf8mb4_unicode_ci'
         }
+        self.pool_size = int(os.getenv('DB_POOL_SIZE', '5'))
+        self.pool_timeout = float(os.getenv('DB_POOL_TIMEOUT', '10'))
+        self.pool_health_check_interval = float(os.getenv('DB_POOL_HEALTH_CHECK_INTERVAL', '30'))
+    
+    @property
+    def pooled(self) -> bool:
+        return self.pool_size > 0
     
     def connect(self):
         """Tạo kết nối đến database"""
         try:
+            if self.pooled:
+                with self._connect_lock:
+                    if self.pool is None:
+                        self.pool = ConnectionPool(
+                            self.config,
+                            size=self.pool_size,
+                            timeout=self.pool_timeout,
+                            health_check_interval=self.pool_health_check_interval
+                        )
+                # Mở sẵn một kết nối để kiểm tra cấu hình
+                conn = self.pool.acquire()
+                self.pool.release(conn)
+                print(f"Kết nối thành công đến database: {self.config['database']} (pool {self.pool_size})")
+                return True
+            
             self.connection = mysql.connector.connect(**self.config)
             if self.connection.is_connected():
                 print(f"Kết nối thành công đến database: {self.config['database']}")
@@ -34,24 +193,79 @@ class DatabaseConnection:
     
     def disconnect(self):
         """Đóng kết nối database"""
+        with self._connect_lock:
+            pool, self.pool = self.pool, None
+        if pool:
+            pool.close()
+            print("Đã đóng pool kết nối database")
         if self.connection and self.connection.is_connected():
             self.connection.close()
             print("Đã đóng kết nối database")
     
+    def is_connected(self) -> bool:
+        """Kiểm tra database còn kết nối được không"""
+        try:
+            with self.checkout() as conn:
+                return conn.is_connected()
+        except Error:
+            return False
+    
     def get_connection(self):
-        """Lấy connection object"""
+        """Lấy connection object (chế độ một kết nối)"""
         if not self.connection or not self.connection.is_connected():
             self.connect()
         return self.connection
     
+    @contextmanager
+    def checkout(self):
+        """Mượn một kết nối cho một lần gọi, tự trả về pool khi xong"""
+        if not self.pooled:
+            yield self.get_connection()
+            return
+        
+        if self.pool is None:
+            self.connect()
+        conn = self.pool.acquire()
+        broken = False
+        try:
+            yield conn
+        except Error as e:
+            # Lỗi mất kết nối thì bỏ kết nối này khỏi pool
+            broken = isinstance(e, (mysql.connector.errors.OperationalError, mysql.connector.errors.InterfaceError))
+            raise
+        finally:
+            self.pool.release(conn, broken=broken)
+    
+    @contextmanager
+    def transaction(self):
+        """Chạy nhiều câu lệnh trong một transaction trên cùng một kết nối
+        
+        Yield cursor (dictionary); commit khi khối lệnh kết thúc, rollback nếu có lỗi.
+        """
+        with self.checkout() as conn:
+            cursor = conn.cursor(dictionary=True)
+            try:
+                yield cursor
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+            finally:
+                cursor.close()
+    
+    def pool_metrics(self) -> Dict:
+        """Số liệu pool kết nối (rỗng nếu không dùng pool)"""
+        return self.pool.metrics() if self.pool else {}
+    
     def execute_query(self, query: str, params: tuple = None):
         """Thực thi query SELECT và trả về kết quả"""
         try:
-            cursor = self.get_connection().cursor(dictionary=True)
-            cursor.execute(query, params)
-            results = cursor.fetchall()
-            cursor.close()
-            return results
+            with self.checkout() as conn:
+                cursor = conn.cursor(dictionary=True)
+                cursor.execute(query, params)
+                results = cursor.fetchall()
+                cursor.close()
+                return results
         except Error as e:
             print(f"Lỗi thực thi query: {e}")
             return []
@@ -59,19 +273,63 @@ class DatabaseConnection:
     def execute_update(self, query: str, params: tuple = None):
         """Thực thi query INSERT/UPDATE/DELETE"""
         try:
-            cursor = self.get_connection().cursor()
-            cursor.execute(query, params)
-            self.connection.commit()
-            affected_rows = cursor.rowcount
-            last_id = cursor.lastrowid
-            cursor.close()
-            return affected_rows, last_id
+            with self.checkout() as conn:
+                cursor = conn.cursor()
+                try:
+                    cursor.execute(query, params)
+                    conn.commit()
+                except Error:
+                    conn.rollback()
+                    raise
+                affected_rows = cursor.rowcount
+                last_id = cursor.lastrowid
+                cursor.close()
+                return affected_rows, last_id
         except Error as e:
-            if self.connection:
-                self.connection.rollback()
             print(f"Lỗi thực thi update: {e}")
             return 0, None
+    
+    def execute_many(self, query: str, params_seq: Sequence, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                     atomic: bool = True) -> int:
+        """Thực thi một câu lệnh với nhiều bộ tham số (executemany theo từng chunk)
+        
+        atomic=True: mọi chunk trong một transaction (lỗi thì rollback tất cả);
+        atomic=False: commit sau mỗi chunk. Trả về tổng số dòng đã commit: lỗi giữa chừng
+        thì với atomic=True là 0, với atomic=False là số dòng của các chunk đã commit trước đó.
+        """
+        committed = 0
+        try:
+            with self.checkout() as conn:
+                cursor = conn.cursor()
+                affected = 0
+                try:
+                    for chunk in chunked(params_seq, chunk_size):
+                        cursor.executemany(query, chunk)
+                        affected += cursor.rowcount
+                        if not atomic:
+                            conn.commit()
+                            committed = affected
+                    conn.commit()
+                    committed = affected
+                except Error:
+                    conn.rollback()
+                    raise
+                finally:
+                    cursor.close()
+                return committed
+        except Error as e:
+            print(f"Lỗi thực thi executemany (đã commit {committed} dòng): {e}")
+            return committed
+    
+    def insert_many(self, table: str, columns: Sequence[str], rows: Sequence[Sequence],
+                    chunk_size: int = DEFAULT_CHUNK_SIZE, on_duplicate: str = None) -> int:
+        """Chèn nhiều dòng bằng INSERT nhiều dòng trong một transaction; trả về số dòng (0 nếu lỗi)"""
+        try:
+            with self.transaction() as cursor:
+                return insert_rows(cursor, table, columns, rows, chunk_size, on_duplicate)
+        except Error as e:
+            print(f"Lỗi chèn nhiều dòng vào {table}: {e}")
+            return 0
 
 # Singleton instance
 db = DatabaseConnection()
-
@@ -0,0 +1,61 @@
+import os
+import numpy as np
+from typing import Optional, Tuple
+
+# Các kiểu lưu trữ embedding trong cột face_embeddings.embedding_blob (little-endian)
+EMBEDDING_DTYPES = {
+    'float32': np.dtype('<f4'),
+    'float16': np.dtype('<f2'),
+    'int8': np.dtype('i1'),
+}
+
+# Kiểu mặc định khi ghi embedding mới
+DEFAULT_EMBEDDING_DTYPE = os.getenv('EMBEDDING_DTYPE', 'float32')
+
+
+def encode_embedding(embedding, dtype: str = None) -> Tuple[bytes, str, Optional[float]]:
+    """Mã hoá embedding sang bytes: trả về (blob, dtype, scale)
+
+    int8 dùng lượng tử hoá đối xứng theo từng vector, scale = max|x| / 127.
+    """
+    dtype = dtype or DEFAULT_EMBEDDING_DTYPE
+    if dtype not in EMBEDDING_DTYPES:
+        raise ValueError(f"Kiểu embedding không hỗ trợ: {dtype}")
+
+    vector = np.asarray(embedding, dtype=np.float32).ravel()
+    scale = None
+    if dtype == 'int8':
+        max_abs = float(np.max(np.abs(vector))) if vector.size else 0.0
+        scale = max_abs / 127.0 if max_abs > 0 else 1.0
+        vector = np.clip(np.rint(vector / scale), -127, 127)
+
+    return vector.astype(EMBEDDING_DTYPES[dtype]).tobytes(), dtype, scale
+
+
+def decode_embedding(blob, dtype: str = 'float32', scale: float = None) -> Optional[np.ndarray]:
+    """Giải mã bytes sang vector float32
+
+    Với float32 đây là view trực tiếp trên buffer (np.frombuffer, không copy);
+    float16/int8 cần một lần chuyển kiểu sang float32.
+    """
+    if blob is None:
+        return None
+    vector = np.frombuffer(blob, dtype=EMBEDDING_DTYPES[dtype or 'float32'])
+    if dtype == 'float16':
+        return vector.astype(np.float32)
+    if dtype == 'int8':
+        return vector.astype(np.float32) * np.float32(scale or 1.0)
+    return vector
+
+
+def decode_embedding_rows(rows):
+    """Giải mã cột embedding_blob của các bản ghi thành khoá 'embedding' (ndarray float32)"""
+    for row in rows:
+        blob = row.pop('embedding_blob', None)
+        dtype = row.pop('embedding_dtype', 'float32')
+        scale = row.pop('embedding_scale', None)
+        try:
+            row['embedding'] = decode_embedding(blob, dtype, scale)
+        except (ValueError, KeyError):
+            row['embedding'] = None
+    return rows
@@ -0,0 +1,61 @@
+import csv
+import io
+import json
+import zlib
+from datetime import date, datetime
+from decimal import Decimal
+from typing import AsyncIterator, Dict, List, Sequence
+
+# Các định dạng xuất hỗ trợ: media type tương ứng
+EXPORT_MEDIA_TYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv; charset=utf-8',
+}
+
+
+def _json_default(value):
+    """Chuyển các kiểu MySQL trả về sang JSON"""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (bytes, bytearray)):
+        return None
+    return str(value)
+
+
+async def ndjson_chunks(batches: AsyncIterator[List[Dict]]) -> AsyncIterator[bytes]:
+    """Mỗi lô bản ghi thành một khối NDJSON (một dòng JSON mỗi bản ghi)"""
+    async for rows in batches:
+        lines = [json.dumps(row, ensure_ascii=False, default=_json_default) for row in rows]
+        yield ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+async def csv_chunks(batches: AsyncIterator[List[Dict]], columns: Sequence[str]) -> AsyncIterator[bytes]:
+    """Mỗi lô bản ghi thành một khối CSV; dòng tiêu đề đi kèm khối đầu tiên"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    # BOM để Excel nhận đúng UTF-8
+    buffer.write('\ufeff')
+    writer.writerow(columns)
+    async for rows in batches:
+        for row in rows:
+            writer.writerow([
+                value.isoformat() if isinstance(value, (datetime, date)) else value
+                for value in (row.get(column) for column in columns)
+            ])
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate(0)
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+async def gzip_chunks(chunks: AsyncIterator[bytes], level: int = 6) -> AsyncIterator[bytes]:
+    """Nén gzip dạng stream, không giữ toàn bộ dữ liệu trong bộ nhớ"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    async for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
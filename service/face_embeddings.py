@@ -1,229 +1,459 @@
 from service.db_connection import db
-from typing import List, Dict, Optional
-import json
+from service.async_db_connection import async_db
+from service.embedding_codec import encode_embedding, decode_embedding_rows
+from service.pagination import parse_fields, decode_cursor, clamp_limit, build_select, build_page
+from service.bulk import DEFAULT_CHUNK_SIZE
+from typing import List, Dict, Optional, Tuple
 from datetime import datetime
 
+# Các trường cho phép chọn qua fields= khi phân trang: (biểu thức SQL, bảng cần JOIN)
+EMBEDDING_PAGE_FIELDS = {
+    'embedding_id': ('e.embedding_id', None),
+    'student_id': ('e.student_id', None),
+    'image_url': ('e.image_url', None),
+    'created_at': ('e.created_at', None),
+    'student_name': ('s.full_name', 'students'),
+    'student_code': ('s.student_code', 'students'),
+    'embedding': ('e.embedding_blob AS embedding_blob, e.embedding_dtype AS embedding_dtype, '
+                  'e.embedding_scale AS embedding_scale', None),
+}
+
+# Mặc định không trả vector embedding (client chỉ hiển thị metadata)
+EMBEDDING_PAGE_DEFAULT_FIELDS = (
+    'embedding_id', 'student_id', 'image_url', 'created_at', 'student_name', 'student_code'
+)
+
+EMBEDDING_INSERT_COLUMNS = ('student_id', 'embedding_blob', 'embedding_dtype', 'embedding_scale', 'image_url')
+
+
+def embedding_rows(embeddings: List[Dict], dtype: str = None) -> List[tuple]:
+    """Mã hoá embedding và dựng tham số INSERT theo EMBEDDING_INSERT_COLUMNS"""
+    rows = []
+    for item in embeddings:
+        blob, item_dtype, scale = encode_embedding(item['embedding'], dtype)
+        rows.append((item['student_id'], blob, item_dtype, scale, item.get('image_url')))
+    return rows
+
+# Tối đa max_templates embedding mới nhất của mỗi học sinh (gallery nhiều ảnh mẫu). ROW_NUMBER()
+# (MySQL 8) đọc mỗi học sinh một lần theo index (student_id, embedding_id) thay vì truy vấn con đếm
+# bản ghi mới hơn cho từng dòng (O(n²) theo số embedding của một học sinh)
+def templates_query(where: str = "") -> str:
+    """SELECT ảnh mẫu mới nhất của mỗi học sinh; where lọc học sinh trước khi đánh số"""
+    return f"""
+    SELECT 
+        ranked.embedding_id,
+        ranked.student_id,
+        ranked.embedding_blob,
+        ranked.embedding_dtype,
+        ranked.embedding_scale,
+        ranked.student_name,
+        ranked.student_code,
+        ranked.class_id
+    FROM (
+        SELECT 
+            e.embedding_id,
+            e.student_id,
+            e.embedding_blob,
+            e.embedding_dtype,
+            e.embedding_scale,
+            s.full_name as student_name,
+            s.student_code,
+            s.class_id,
+            ROW_NUMBER() OVER (PARTITION BY e.student_id ORDER BY e.embedding_id DESC) AS rn
+        FROM face_embeddings e
+        JOIN students s ON e.student_id = s.student_id
+        {where}
+    ) ranked
+    WHERE ranked.rn <= %s
+    ORDER BY ranked.student_id, ranked.embedding_id DESC
+"""
+
+
+CLASS_TEMPLATES_QUERY = templates_query("WHERE s.class_id = %s")
+ALL_TEMPLATES_QUERY = templates_query()
+
+# embedding_id mới nhất của từng học sinh (đối chiếu vector index với database)
+LATEST_EMBEDDING_IDS_QUERY = """
+    SELECT student_id, MAX(embedding_id) AS embedding_id
+    FROM face_embeddings
+    GROUP BY student_id
+"""
+
+
+# Cột của một embedding kèm thông tin học sinh (danh sách, chi tiết)
+EMBEDDING_DETAIL_COLUMNS = """
+        e.embedding_id,
+        e.student_id,
+        e.embedding_blob,
+        e.embedding_dtype,
+        e.embedding_scale,
+        e.image_url,
+        e.created_at,
+        s.full_name as student_name,
+        s.student_code
+"""
+
+ALL_EMBEDDINGS_QUERY = f"""
+    SELECT {EMBEDDING_DETAIL_COLUMNS}
+    FROM face_embeddings e
+    JOIN students s ON e.student_id = s.student_id
+    ORDER BY e.created_at DESC
+"""
+
+EMBEDDING_BY_ID_QUERY = f"""
+    SELECT {EMBEDDING_DETAIL_COLUMNS}
+    FROM face_embeddings e
+    JOIN students s ON e.student_id = s.student_id
+    WHERE e.embedding_id = %s
+"""
+
+EMBEDDINGS_BY_STUDENT_QUERY = f"""
+    SELECT {EMBEDDING_DETAIL_COLUMNS}
+    FROM face_embeddings e
+    JOIN students s ON e.student_id = s.student_id
+    WHERE e.student_id = %s
+    ORDER BY e.created_at DESC
+"""
+
+LATEST_EMBEDDING_BY_STUDENT_QUERY = EMBEDDINGS_BY_STUDENT_QUERY + "    LIMIT 1\n"
+
+CREATE_EMBEDDING_QUERY = """
+    INSERT INTO face_embeddings
+    (student_id, embedding_blob, embedding_dtype, embedding_scale, image_url)
+    VALUES (%s, %s, %s, %s, %s)
+"""
+
+DELETE_EMBEDDING_QUERY = "DELETE FROM face_embeddings WHERE embedding_id = %s"
+
+# Embedding mới nhất của mỗi học sinh để nhận diện
+RECOGNITION_EMBEDDINGS_QUERY = """
+    SELECT 
+        e.embedding_id,
+        e.student_id,
+        e.embedding_blob,
+        e.embedding_dtype,
+        e.embedding_scale,
+        s.full_name as student_name,
+        s.student_code,
+        s.class_id
+    FROM face_embeddings e
+    JOIN students s ON e.student_id = s.student_id
+    WHERE e.embedding_id IN (
+        SELECT MAX(embedding_id)
+        FROM face_embeddings
+        GROUP BY student_id
+    )
+"""
+
+CLASS_EMBEDDINGS_QUERY = """
+    SELECT 
+        e.embedding_id,
+        e.student_id,
+        e.embedding_blob,
+        e.embedding_dtype,
+        e.embedding_scale,
+        e.image_url,
+        e.created_at,
+        s.full_name as student_name,
+        s.student_code,
+        s.class_id
+    FROM face_embeddings e
+    JOIN students s ON e.student_id = s.student_id
+    WHERE s.class_id = %s
+    AND e.embedding_id IN (
+        SELECT MAX(embedding_id)
+        FROM face_embeddings fe
+        JOIN students st ON fe.student_id = st.student_id
+        WHERE st.class_id = %s
+        GROUP BY fe.student_id
+    )
+    ORDER BY s.full_name
+"""
+
+
+def embeddings_by_ids_query(count: int) -> str:
+    """SELECT các embedding theo danh sách embedding_id (count tham số)"""
+    return f"""
+        SELECT 
+            e.embedding_id,
+            e.student_id,
+            e.embedding_blob,
+            e.embedding_dtype,
+            e.embedding_scale
+        FROM face_embeddings e
+        WHERE e.embedding_id IN ({', '.join(['%s'] * count)})
+    """
+
+
+def build_embeddings_page_query(limit: int, cursor: str = None, fields=None):
+    """Dựng query keyset theo embedding_id giảm dần"""
+    fields = parse_fields(fields, EMBEDDING_PAGE_FIELDS, EMBEDDING_PAGE_DEFAULT_FIELDS)
+    key_fields = ('embedding_id',)
+    columns, joins = build_select(fields, key_fields, EMBEDDING_PAGE_FIELDS)
+    join_sql = "JOIN students s ON e.student_id = s.student_id" if 'students' in joins else ""
+
+    where = ""
+    params = []
+    if cursor:
+        (last_id,) = decode_cursor(cursor, 1)
+        where = "WHERE e.embedding_id < %s"
+        params = [last_id]
+    params.append(limit + 1)
+
+    query = f"""
+        SELECT 
+            {columns}
+        FROM face_embeddings e
+        {join_sql}
+        {where}
+        ORDER BY e.embedding_id DESC
+        LIMIT %s
+    """
+    return query, tuple(params), fields, key_fields
+
+def embeddings_page(results: List[Dict], limit: int, fields, key_fields) -> Dict:
+    """Giải mã embedding (nếu được chọn) rồi cắt thành trang"""
+    if 'embedding' in fields:
+        decode_embedding_rows(results)
+    return build_page(results, limit, key_fields, fields)
+
+def first_embedding(results: List[Dict]) -> Optional[Dict]:
+    """Dòng đầu tiên đã giải mã embedding, None nếu không có"""
+    if results:
+        return decode_embedding_rows(results)[0]
+    return None
+
+def update_embedding_query(embedding_id: int, embedding: List[float] = None, image_url: str = None,
+                           dtype: str = None) -> Optional[Tuple[str, Tuple]]:
+    """Câu UPDATE cho các trường được truyền, None nếu không có gì để cập nhật"""
+    updates = []
+    params = []
+    
+    if embedding is not None:
+        blob, dtype, scale = encode_embedding(embedding, dtype)
+        updates.append("embedding_blob = %s")
+        updates.append("embedding_dtype = %s")
+        updates.append("embedding_scale = %s")
+        params.extend([blob, dtype, scale])
+    if image_url:
+        updates.append("image_url = %s")
+        params.append(image_url)
+    
+    if not updates:
+        return None
+    
+    params.append(embedding_id)
+    return f"UPDATE face_embeddings SET {', '.join(updates)} WHERE embedding_id = %s", tuple(params)
+
 class FaceEmbeddingsRepository:
     """Repository để trích xuất và quản lý dữ liệu face embeddings"""
     
     @staticmethod
     def get_all_embeddings() -> List[Dict]:
         """Lấy tất cả embeddings"""
-        query = """
-            SELECT 
-                e.embedding_id,
-                e.student_id,
-                e.embedding_json,
-                e.image_url,
-                e.created_at,
-                s.full_name as student_name,
-                s.student_code
-            FROM face_embeddings e
-            JOIN students s ON e.student_id = s.student_id
-            ORDER BY e.created_at DESC
-        """
-        results = db.execute_query(query)
-        # Parse JSON embedding
-        for result in results:
-            if result.get('embedding_json'):
-                try:
-                    result['embedding'] = json.loads(result['embedding_json'])
-                except:
-                    result['embedding'] = None
-        return results
+        # Giải mã embedding nhị phân
+        return decode_embedding_rows(db.execute_query(ALL_EMBEDDINGS_QUERY))
+    
+    @staticmethod
+    def get_embeddings_page(limit: int = None, cursor: str = None, fields=None) -> Dict:
+        """Lấy embeddings theo trang (keyset), trả về {'items', 'next_cursor'}"""
+        limit = clamp_limit(limit)
+        query, params, fields, key_fields = build_embeddings_page_query(limit, cursor, fields)
+        return embeddings_page(db.execute_query(query, params), limit, fields, key_fields)
     
     @staticmethod
     def get_embedding_by_id(embedding_id: int) -> Optional[Dict]:
         """Lấy embedding theo ID"""
-        query = """
-            SELECT 
-                e.embedding_id,
-                e.student_id,
-                e.embedding_json,
-                e.image_url,
-                e.created_at,
-                s.full_name as student_name,
-                s.student_code
-            FROM face_embeddings e
-            JOIN students s ON e.student_id = s.student_id
-            WHERE e.embedding_id = %s
-        """
-        results = db.execute_query(query, (embedding_id,))
-        if results:
-            result = results[0]
-            if result.get('embedding_json'):
-                try:
-                    result['embedding'] = json.loads(result['embedding_json'])
-                except:
-                    result['embedding'] = None
-            return result
-        return None
+        return first_embedding(db.execute_query(EMBEDDING_BY_ID_QUERY, (embedding_id,)))
     
     @staticmethod
     def get_embeddings_by_student(student_id: int) -> List[Dict]:
         """Lấy tất cả embeddings của một học sinh"""
-        query = """
-            SELECT 
-                e.embedding_id,
-                e.student_id,
-                e.embedding_json,
-                e.image_url,
-                e.created_at,
-                s.full_name as student_name,
-                s.student_code
-            FROM face_embeddings e
-            JOIN students s ON e.student_id = s.student_id
-            WHERE e.student_id = %s
-            ORDER BY e.created_at DESC
-        """
-        results = db.execute_query(query, (student_id,))
-        # Parse JSON embedding
-        for result in results:
-            if result.get('embedding_json'):
-                try:
-                    result['embedding'] = json.loads(result['embedding_json'])
-                except:
-                    result['embedding'] = None
-        return results
+        return decode_embedding_rows(db.execute_query(EMBEDDINGS_BY_STUDENT_QUERY, (student_id,)))
     
     @staticmethod
     def get_latest_embedding_by_student(student_id: int) -> Optional[Dict]:
         """Lấy embedding mới nhất của một học sinh"""
-        query = """
-            SELECT 
-                e.embedding_id,
-                e.student_id,
-                e.embedding_json,
-                e.image_url,
-                e.created_at,
-                s.full_name as student_name,
-                s.student_code
-            FROM face_embeddings e
-            JOIN students s ON e.student_id = s.student_id
-            WHERE e.student_id = %s
-            ORDER BY e.created_at DESC
-            LIMIT 1
-        """
-        results = db.execute_query(query, (student_id,))
-        if results:
-            result = results[0]
-            if result.get('embedding_json'):
-                try:
-                    result['embedding'] = json.loads(result['embedding_json'])
-                except:
-                    result['embedding'] = None
-            return result
-        return None
+        return first_embedding(db.execute_query(LATEST_EMBEDDING_BY_STUDENT_QUERY, (student_id,)))
     
     @staticmethod
     def create_embedding(
         student_id: int,
         embedding: List[float],
-        image_url: str = None
+        image_url: str = None,
+        dtype: str = None
     ) -> int:
         """Tạo embedding mới"""
-        embedding_json = json.dumps(embedding)
-        query = """
-            INSERT INTO face_embeddings (student_id, embedding_json, image_url)
-            VALUES (%s, %s, %s)
-        """
-        params = (student_id, embedding_json, image_url)
-        _, last_id = db.execute_update(query, params)
+        _, last_id = db.execute_update(CREATE_EMBEDDING_QUERY, embedding_rows(
+            [{'student_id': student_id, 'embedding': embedding, 'image_url': image_url}], dtype)[0])
         return last_id
     
+    @staticmethod
+    def create_many(embeddings: List[Dict], dtype: str = None, chunk_size: int = DEFAULT_CHUNK_SIZE) -> int:
+        """Tạo nhiều embedding ({'student_id', 'embedding', 'image_url'}) bằng INSERT nhiều dòng"""
+        return db.insert_many('face_embeddings', EMBEDDING_INSERT_COLUMNS,
+                              embedding_rows(embeddings, dtype), chunk_size)
+    
     @staticmethod
     def update_embedding(
         embedding_id: int,
         embedding: List[float] = None,
-        image_url: str = None
+        image_url: str = None,
+        dtype: str = None
     ) -> bool:
         """Cập nhật embedding"""
-        updates = []
-        params = []
-        
-        if embedding:
-            embedding_json = json.dumps(embedding)
-            updates.append("embedding_json = %s")
-            params.append(embedding_json)
-        if image_url:
-            updates.append("image_url = %s")
-            params.append(image_url)
-        
-        if not updates:
+        update = update_embedding_query(embedding_id, embedding, image_url, dtype)
+        if update is None:
             return False
-        
-        params.append(embedding_id)
-        query = f"UPDATE face_embeddings SET {', '.join(updates)} WHERE embedding_id = %s"
-        affected_rows, _ = db.execute_update(query, tuple(params))
+        affected_rows, _ = db.execute_update(*update)
         return affected_rows > 0
     
     @staticmethod
     def delete_embedding(embedding_id: int) -> bool:
         """Xóa embedding"""
-        query = "DELETE FROM face_embeddings WHERE embedding_id = %s"
-        affected_rows, _ = db.execute_update(query, (embedding_id,))
+        affected_rows, _ = db.execute_update(DELETE_EMBEDDING_QUERY, (embedding_id,))
         return affected_rows > 0
     
     @staticmethod
     def get_all_embeddings_for_recognition() -> List[Dict]:
         """Lấy tất cả embeddings để nhận diện (chỉ lấy embedding mới nhất của mỗi học sinh)"""
-        query = """
-            SELECT 
-                e.student_id,
-                e.embedding_json,
-                s.full_name as student_name,
-                s.student_code,
-                s.class_id
-            FROM face_embeddings e
-            JOIN students s ON e.student_id = s.student_id
-            WHERE e.embedding_id IN (
-                SELECT MAX(embedding_id)
-                FROM face_embeddings
-                GROUP BY student_id
-            )
+        return decode_embedding_rows(db.execute_query(RECOGNITION_EMBEDDINGS_QUERY))
+    
+    @staticmethod
+    def get_latest_embedding_ids() -> Dict[int, int]:
+        """{student_id: embedding_id mới nhất} của mọi học sinh (không đọc blob, dùng để đối chiếu index)
+
+        Lỗi database được raise (không trả về rỗng) để bên gọi không hiểu nhầm là đã xoá hết.
         """
-        results = db.execute_query(query)
-        # Parse JSON embedding
-        for result in results:
-            if result.get('embedding_json'):
-                try:
-                    result['embedding'] = json.loads(result['embedding_json'])
-                except:
-                    result['embedding'] = None
-        return results
+        with db.transaction() as cursor:
+            cursor.execute(LATEST_EMBEDDING_IDS_QUERY)
+            return {row['student_id']: row['embedding_id'] for row in cursor.fetchall()}
+    
+    @staticmethod
+    def get_embeddings_by_ids(embedding_ids: List[int]) -> List[Dict]:
+        """Lấy các embedding theo danh sách embedding_id (lỗi database được raise)"""
+        if not embedding_ids:
+            return []
+        with db.transaction() as cursor:
+            cursor.execute(embeddings_by_ids_query(len(embedding_ids)), tuple(embedding_ids))
+            return decode_embedding_rows(cursor.fetchall())
     
     @staticmethod
     def get_embeddings_by_class(class_id: int) -> List[Dict]:
         """Lấy tất cả embeddings của học sinh trong một lớp"""
-        query = """
-            SELECT 
-                e.embedding_id,
-                e.student_id,
-                e.embedding_json,
-                e.image_url,
-                e.created_at,
-                s.full_name as student_name,
-                s.student_code,
-                s.class_id
-            FROM face_embeddings e
-            JOIN students s ON e.student_id = s.student_id
-            WHERE s.class_id = %s
-            AND e.embedding_id IN (
-                SELECT MAX(embedding_id)
-                FROM face_embeddings fe
-                JOIN students st ON fe.student_id = st.student_id
-                WHERE st.class_id = %s
-                GROUP BY fe.student_id
-            )
-            ORDER BY s.full_name
-        """
-        results = db.execute_query(query, (class_id, class_id))
-        # Parse JSON embedding
-        for result in results:
-            if result.get('embedding_json'):
-                try:
-                    result['embedding'] = json.loads(result['embedding_json'])
-                except:
-                    result['embedding'] = None
-        return results
+        return decode_embedding_rows(db.execute_query(CLASS_EMBEDDINGS_QUERY, (class_id, class_id)))
+    
+    @staticmethod
+    def get_embedding_templates_by_class(class_id: int, max_templates: int) -> List[Dict]:
+        """Lấy tối đa max_templates embedding mới nhất của mỗi học sinh trong lớp (mới nhất trước)"""
+        return decode_embedding_rows(db.execute_query(CLASS_TEMPLATES_QUERY, (class_id, max_templates)))
+    
+    @staticmethod
+    def get_all_embedding_templates(max_templates: int) -> List[Dict]:
+        """Lấy tối đa max_templates embedding mới nhất của mỗi học sinh toàn trường"""
+        return decode_embedding_rows(db.execute_query(ALL_TEMPLATES_QUERY, (max_templates,)))
 
+class AsyncFaceEmbeddingsRepository:
+    """Repository để trích xuất và quản lý dữ liệu face embeddings (bất đồng bộ, dùng cho các endpoint async)"""
+    
+    @staticmethod
+    async def get_all_embeddings() -> List[Dict]:
+        """Lấy tất cả embeddings"""
+        # Giải mã embedding nhị phân
+        return decode_embedding_rows(await async_db.execute_query(ALL_EMBEDDINGS_QUERY))
+    
+    @staticmethod
+    async def get_embeddings_page(limit: int = None, cursor: str = None, fields=None) -> Dict:
+        """Lấy embeddings theo trang (keyset), trả về {'items', 'next_cursor'}"""
+        limit = clamp_limit(limit)
+        query, params, fields, key_fields = build_embeddings_page_query(limit, cursor, fields)
+        return embeddings_page(await async_db.execute_query(query, params), limit, fields, key_fields)
+    
+    @staticmethod
+    async def get_embedding_by_id(embedding_id: int) -> Optional[Dict]:
+        """Lấy embedding theo ID"""
+        return first_embedding(await async_db.execute_query(EMBEDDING_BY_ID_QUERY, (embedding_id,)))
+    
+    @staticmethod
+    async def get_embeddings_by_student(student_id: int) -> List[Dict]:
+        """Lấy tất cả embeddings của một học sinh"""
+        return decode_embedding_rows(await async_db.execute_query(EMBEDDINGS_BY_STUDENT_QUERY, (student_id,)))
+    
+    @staticmethod
+    async def get_latest_embedding_by_student(student_id: int) -> Optional[Dict]:
+        """Lấy embedding mới nhất của một học sinh"""
+        return first_embedding(await async_db.execute_query(LATEST_EMBEDDING_BY_STUDENT_QUERY, (student_id,)))
+    
+    @staticmethod
+    async def create_embedding(
+        student_id: int,
+        embedding: List[float],
+        image_url: str = None,
+        dtype: str = None
+    ) -> int:
+        """Tạo embedding mới"""
+        _, last_id = await async_db.execute_update(CREATE_EMBEDDING_QUERY, embedding_rows(
+            [{'student_id': student_id, 'embedding': embedding, 'image_url': image_url}], dtype)[0])
+        return last_id
+    
+    @staticmethod
+    async def create_many(embeddings: List[Dict], dtype: str = None, chunk_size: int = DEFAULT_CHUNK_SIZE) -> int:
+        """Tạo nhiều embedding ({'student_id', 'embedding', 'image_url'}) bằng INSERT nhiều dòng"""
+        return await async_db.insert_many('face_embeddings', EMBEDDING_INSERT_COLUMNS,
+                                          embedding_rows(embeddings, dtype), chunk_size)
+    
+    @staticmethod
+    async def update_embedding(
+        embedding_id: int,
+        embedding: List[float] = None,
+        image_url: str = None,
+        dtype: str = None
+    ) -> bool:
+        """Cập nhật embedding"""
+        update = update_embedding_query(embedding_id, embedding, image_url, dtype)
+        if update is None:
+            return False
+        affected_rows, _ = await async_db.execute_update(*update)
+        return affected_rows > 0
+    
+    @staticmethod
+    async def delete_embedding(embedding_id: int) -> bool:
+        """Xóa embedding"""
+        affected_rows, _ = await async_db.execute_update(DELETE_EMBEDDING_QUERY, (embedding_id,))
+        return affected_rows > 0
+    
+    @staticmethod
+    async def get_all_embeddings_for_recognition() -> List[Dict]:
+        """Lấy tất cả embeddings để nhận diện (chỉ lấy embedding mới nhất của mỗi học sinh)"""
+        return decode_embedding_rows(await async_db.execute_query(RECOGNITION_EMBEDDINGS_QUERY))
+    
+    @staticmethod
+    async def get_latest_embedding_ids() -> Dict[int, int]:
+        """{student_id: embedding_id mới nhất} của mọi học sinh (lỗi database được raise)"""
+        async with async_db.transaction() as cursor:
+            await cursor.execute(LATEST_EMBEDDING_IDS_QUERY)
+            return {row['student_id']: row['embedding_id'] for row in await cursor.fetchall()}
+    
+    @staticmethod
+    async def get_embeddings_by_ids(embedding_ids: List[int]) -> List[Dict]:
+        """Lấy các embedding theo danh sách embedding_id (lỗi database được raise)"""
+        if not embedding_ids:
+            return []
+        async with async_db.transaction() as cursor:
+            await cursor.execute(embeddings_by_ids_query(len(embedding_ids)), tuple(embedding_ids))
+            return decode_embedding_rows(await cursor.fetchall())
+    
+    @staticmethod
+    async def get_embeddings_by_class(class_id: int) -> List[Dict]:
+        """Lấy tất cả embeddings của học sinh trong một lớp"""
+        return decode_embedding_rows(await async_db.execute_query(CLASS_EMBEDDINGS_QUERY, (class_id, class_id)))
+    
+    @staticmethod
+    async def get_embedding_templates_by_class(class_id: int, max_templates: int) -> List[Dict]:
+        """Lấy tối đa max_templates embedding mới nhất của mỗi học sinh trong lớp (mới nhất trước)"""
+        return decode_embedding_rows(await async_db.execute_query(CLASS_TEMPLATES_QUERY, (class_id, max_templates)))
+    
+    @staticmethod
+    async def get_all_embedding_templates(max_templates: int) -> List[Dict]:
+        """Lấy tối đa max_templates embedding mới nhất của mỗi học sinh toàn trường"""
+        return decode_embedding_rows(await async_db.execute_query(ALL_TEMPLATES_QUERY, (max_templates,)))
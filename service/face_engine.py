@@ -0,0 +1,83 @@
+import numpy as np
+from typing import Dict, List, Tuple
+from insightface.utils import face_align
+
+
+def detect_faces(model, img_bgr: np.ndarray, max_num: int = 0,
+                 det_size: Tuple[int, int] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """Chỉ chạy detector, trả về (bboxes kèm det_score, landmarks 5 điểm)
+
+    det_size: kích thước đầu vào detector cho lần gọi này (mặc định theo lúc prepare).
+    """
+    bboxes, kpss = model.det_model.detect(img_bgr, input_size=det_size, max_num=max_num, metric='default')
+    if kpss is None:
+        kpss = np.empty((0, 5, 2), dtype=np.float32)
+    return bboxes, kpss
+
+
+def align_faces(model, img_bgr: np.ndarray, kpss: np.ndarray) -> List[np.ndarray]:
+    """Cắt và căn chỉnh khuôn mặt theo landmarks về kích thước đầu vào của model recognition"""
+    image_size = model.models['recognition'].input_size[0]
+    return [face_align.norm_crop(img_bgr, landmark=kps, image_size=image_size) for kps in kpss]
+
+
+def embed_crops(model, crops: List[np.ndarray]) -> np.ndarray:
+    """Embedding nhiều khuôn mặt đã căn chỉnh trong một lần chạy ONNX"""
+    rec_model = model.models['recognition']
+    if not crops:
+        return np.empty((0, rec_model.output_shape[1]), dtype=np.float32)
+    return np.asarray(rec_model.get_feat(crops), dtype=np.float32)
+
+
+def detect_and_embed(model, img_bgr: np.ndarray, first_only: bool = False,
+                     det_size: Tuple[int, int] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """Phát hiện + căn chỉnh + embedding trên một ảnh: trả về (embeddings, bboxes kèm det_score)
+
+    first_only: chỉ embedding khuôn mặt có điểm phát hiện cao nhất (bboxes vẫn đủ).
+    """
+    bboxes, kpss = detect_faces(model, img_bgr, det_size=det_size)
+    if first_only:
+        kpss = kpss[:1]
+    return embed_crops(model, align_faces(model, img_bgr, kpss)), bboxes
+
+
+def detect_and_embed_filtered(model, img_bgr: np.ndarray, quality, first_only: bool = False,
+                              det_size: Tuple[int, int] = None) -> Tuple[np.ndarray, np.ndarray, List[str]]:
+    """Như detect_and_embed nhưng bỏ các khuôn mặt không đạt FaceQualityFilter trước khi embedding
+
+    Trả về (embeddings, bboxes của các mặt được giữ, lý do loại các mặt còn lại).
+    first_only: chỉ xét khuôn mặt có điểm phát hiện cao nhất.
+    """
+    bboxes, kpss = detect_faces(model, img_bgr, det_size=det_size)
+    if first_only:
+        bboxes, kpss = bboxes[:1], kpss[:1]
+    crops, kept, rejected = quality.select(model, img_bgr, bboxes, kpss)
+    return embed_crops(model, crops), bboxes[kept], rejected
+
+
+def limit_session_threads(model, threads: int):
+    """Tạo lại ONNX session của từng model con với số thread intra-op cố định
+
+    FaceAnalysis (insightface 0.7.x) chỉ chuyển providers / provider_options xuống
+    InferenceSession, tham số sess_options bị bỏ qua, nên phải dựng lại session sau khi nạp.
+    Session cũ (thread pool mặc định) được giải phóng ngay khi bị thay.
+    """
+    import onnxruntime
+
+    options = onnxruntime.SessionOptions()
+    options.intra_op_num_threads = threads
+    options.inter_op_num_threads = 1
+    for sub_model in model.models.values():
+        providers = sub_model.session.get_providers()
+        sub_model.session = None
+        sub_model.session = onnxruntime.InferenceSession(sub_model.model_file, sess_options=options,
+                                                         providers=providers)
+    actual = session_threads(model)
+    if any(value != threads for value in actual.values()):
+        raise RuntimeError(f"Không đặt được số thread ONNX Runtime = {threads}: {actual}")
+
+
+def session_threads(model) -> Dict[str, int]:
+    """Số thread intra-op thực tế của session từng model con (đọc lại từ ONNX Runtime)"""
+    return {name: sub_model.session.get_session_options().intra_op_num_threads
+            for name, sub_model in model.models.items()}
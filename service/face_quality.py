@@ -0,0 +1,173 @@
+import os
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+# Lý do loại khuôn mặt (khoá của bộ đếm) và thông báo tương ứng
+REJECT_MESSAGES = {
+    'low_score': "điểm phát hiện khuôn mặt thấp",
+    'too_small': "khuôn mặt quá nhỏ",
+    'pose': "khuôn mặt nghiêng hoặc quay quá nhiều",
+    'blurry': "ảnh khuôn mặt bị mờ",
+}
+
+# Ngưỡng mặc định khi nhận diện (camera, ảnh upload) và khi ghi danh (chặt hơn)
+RECOGNITION_DEFAULTS = {
+    'min_score': 0.5,
+    'min_size': 40,
+    'min_sharpness': 30.0,
+    'max_yaw': 45.0,
+    'max_pitch': 40.0,
+    'max_roll': 45.0,
+}
+ENROLL_DEFAULTS = {
+    'min_score': 0.7,
+    'min_size': 80,
+    'min_sharpness': 60.0,
+    'max_yaw': 25.0,
+    'max_pitch': 25.0,
+    'max_roll': 30.0,
+}
+
+# Vị trí dọc của mũi giữa đường mắt và đường miệng trên mặt nhìn thẳng (theo template căn chỉnh ArcFace)
+FRONTAL_NOSE_RATIO = 0.5
+
+
+def pose_angles(kps: np.ndarray) -> Tuple[float, float, float]:
+    """Ước lượng (yaw, pitch, roll) theo độ từ 5 landmark (mắt trái, mắt phải, mũi, 2 khoé miệng)
+
+    Chỉ là ước lượng hình học (không giải PnP), đủ để loại mặt quay ngang / cúi quá nhiều.
+    """
+    kps = np.asarray(kps, dtype=np.float64)
+    left_eye, right_eye = kps[0], kps[1]
+    dx, dy = right_eye - left_eye
+    roll = np.degrees(np.arctan2(dy, dx))
+
+    # Xoay về đường mắt nằm ngang, gốc toạ độ ở giữa hai mắt
+    angle = -np.radians(roll)
+    rotation = np.array([[np.cos(angle), -np.sin(angle)], [np.sin(angle), np.cos(angle)]])
+    points = (kps - (left_eye + right_eye) / 2) @ rotation.T
+    half_eye = (points[1, 0] - points[0, 0]) / 2
+    if half_eye <= 0:
+        return 90.0, 0.0, float(roll)
+
+    nose = points[2]
+    mouth_y = (points[3, 1] + points[4, 1]) / 2
+    yaw = np.degrees(np.arcsin(np.clip(nose[0] / half_eye, -1, 1)))
+    nose_ratio = nose[1] / mouth_y if mouth_y > 0 else 0.0
+    pitch = np.degrees(np.arcsin(np.clip((nose_ratio - FRONTAL_NOSE_RATIO) / FRONTAL_NOSE_RATIO, -1, 1)))
+    return float(yaw), float(pitch), float(roll)
+
+
+def sharpness(crop: np.ndarray) -> float:
+    """Độ nét: phương sai Laplacian trên ảnh xám của khuôn mặt đã căn chỉnh"""
+    gray = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY) if crop.ndim == 3 else crop
+    return float(cv2.Laplacian(gray, cv2.CV_64F).var())
+
+
+class FaceQualityFilter:
+    """Loại khuôn mặt không dùng được trước khi chạy model recognition
+
+    Kiểm tra theo thứ tự rẻ trước: điểm detector, kích thước, góc mặt (từ landmark) trước khi
+    căn chỉnh; độ nét (Laplacian) trên ảnh đã căn chỉnh. Đếm số mặt bị loại theo từng lý do.
+    """
+
+    def __init__(self, min_score: float = 0.5, min_size: float = 40, min_sharpness: float = 30.0,
+                 max_yaw: float = 45.0, max_pitch: float = 40.0, max_roll: float = 45.0,
+                 enabled: bool = True):
+        self.min_score = min_score
+        self.min_size = min_size
+        self.min_sharpness = min_sharpness
+        self.max_yaw = max_yaw
+        self.max_pitch = max_pitch
+        self.max_roll = max_roll
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._stats = {'checked': 0, 'passed': 0}
+        self._rejected = {reason: 0 for reason in REJECT_MESSAGES}
+
+    @classmethod
+    def from_env(cls, prefix: str = 'FACE_QUALITY', defaults: Dict = None) -> "FaceQualityFilter":
+        """Ngưỡng từ biến môi trường <prefix>_MIN_SCORE, _MIN_SIZE, _MIN_SHARPNESS, _MAX_YAW,
+        _MAX_PITCH, _MAX_ROLL; <prefix>_ENABLED=0 tắt lọc"""
+        options = dict(defaults or RECOGNITION_DEFAULTS)
+        for key in options:
+            value = os.getenv(f"{prefix}_{key.upper()}")
+            if value:
+                options[key] = float(value)
+        return cls(enabled=os.getenv(f"{prefix}_ENABLED", '1') == '1', **options)
+
+    @classmethod
+    def for_enrollment(cls) -> "FaceQualityFilter":
+        """Bộ lọc chặt hơn cho ảnh ghi danh (biến môi trường ENROLL_QUALITY_*)"""
+        return cls.from_env('ENROLL_QUALITY', ENROLL_DEFAULTS)
+
+    def check(self, bbox: np.ndarray, kps: np.ndarray) -> Optional[str]:
+        """Lý do loại theo detection (chưa căn chỉnh), None nếu đạt"""
+        if len(bbox) > 4 and bbox[4] < self.min_score:
+            return 'low_score'
+        if min(bbox[2] - bbox[0], bbox[3] - bbox[1]) < self.min_size:
+            return 'too_small'
+        yaw, pitch, roll = pose_angles(kps)
+        if abs(yaw) > self.max_yaw or abs(pitch) > self.max_pitch or abs(roll) > self.max_roll:
+            return 'pose'
+        return None
+
+    def check_crop(self, crop: np.ndarray) -> Optional[str]:
+        """Lý do loại theo ảnh đã căn chỉnh, None nếu đạt"""
+        if sharpness(crop) < self.min_sharpness:
+            return 'blurry'
+        return None
+
+    def select(self, model, img_bgr: np.ndarray, bboxes: np.ndarray,
+               kpss: np.ndarray) -> Tuple[List[np.ndarray], List[int], List[str]]:
+        """Lọc các detection: trả về (ảnh mặt đã căn chỉnh, chỉ số detection giữ lại, lý do loại)"""
+        from service.face_engine import align_faces
+
+        if not self.enabled:
+            kept = list(range(len(kpss)))
+            return align_faces(model, img_bgr, kpss), kept, []
+
+        rejected = []
+        candidates = []
+        for i, (bbox, kps) in enumerate(zip(bboxes, kpss)):
+            reason = self.check(bbox, kps)
+            if reason is None:
+                candidates.append(i)
+            else:
+                rejected.append(reason)
+
+        crops, kept = [], []
+        for i, crop in zip(candidates, align_faces(model, img_bgr, kpss[candidates])):
+            reason = self.check_crop(crop)
+            if reason is None:
+                crops.append(crop)
+                kept.append(i)
+            else:
+                rejected.append(reason)
+        self.record(len(kept), rejected)
+        return crops, kept, rejected
+
+    def record(self, passed: int, rejected: Sequence[str]):
+        """Cộng bộ đếm (dùng cả cho kết quả lọc trả về từ inference worker)"""
+        with self._lock:
+            self._stats['checked'] += passed + len(rejected)
+            self._stats['passed'] += passed
+            for reason in rejected:
+                self._rejected[reason] += 1
+
+    def metrics(self) -> Dict:
+        stats = dict(self._stats)
+        stats['rejected'] = dict(self._rejected)
+        stats['pass_rate'] = round(stats['passed'] / stats['checked'], 3) if stats['checked'] else None
+        stats['enabled'] = self.enabled
+        return stats
+
+
+def reject_message(rejected: Sequence[str]) -> str:
+    """Thông báo cho người dùng từ danh sách lý do loại (lý do đầu tiên)"""
+    if not rejected:
+        return "Không tìm thấy mặt trong ảnh"
+    return f"Ảnh không đạt chất lượng: {REJECT_MESSAGES[rejected[0]]}"
@@ -0,0 +1,230 @@
+import os
+import time
+from collections import Counter, deque
+from typing import Dict, List, Optional
+
+import numpy as np
+
+# Ghép detection với track khi IoU với vị trí dự đoán >= ngưỡng này
+TRACK_IOU_THRESHOLD = float(os.getenv('TRACK_IOU_THRESHOLD', '0.3'))
+# Bỏ track sau số frame liên tiếp không thấy
+TRACK_MAX_MISSES = int(os.getenv('TRACK_MAX_MISSES', '5'))
+# Cần TRACK_VOTE_K trong TRACK_VOTE_N lần nhận diện gần nhất cùng một học sinh mới xác nhận
+TRACK_VOTE_K = int(os.getenv('TRACK_VOTE_K', '3'))
+TRACK_VOTE_N = int(os.getenv('TRACK_VOTE_N', '5'))
+# Track đã xác nhận chỉ embedding lại sau số frame này, hoặc khi chất lượng mặt tăng theo hệ số này
+TRACK_REVERIFY_FRAMES = int(os.getenv('TRACK_REVERIFY_FRAMES', '30'))
+TRACK_QUALITY_GAIN = float(os.getenv('TRACK_QUALITY_GAIN', '1.25'))
+
+
+def iou_matrix(boxes_a: np.ndarray, boxes_b: np.ndarray) -> np.ndarray:
+    """IoU từng cặp giữa hai tập bbox (x1, y1, x2, y2)"""
+    if len(boxes_a) == 0 or len(boxes_b) == 0:
+        return np.zeros((len(boxes_a), len(boxes_b)), dtype=np.float32)
+    a = boxes_a[:, None, :4]
+    b = boxes_b[None, :, :4]
+    width = np.clip(np.minimum(a[..., 2], b[..., 2]) - np.maximum(a[..., 0], b[..., 0]), 0, None)
+    height = np.clip(np.minimum(a[..., 3], b[..., 3]) - np.maximum(a[..., 1], b[..., 1]), 0, None)
+    inter = width * height
+    area_a = (a[..., 2] - a[..., 0]) * (a[..., 3] - a[..., 1])
+    area_b = (b[..., 2] - b[..., 0]) * (b[..., 3] - b[..., 1])
+    return inter / np.maximum(area_a + area_b - inter, 1e-6)
+
+
+def face_quality(bbox: np.ndarray) -> float:
+    """Điểm chất lượng thô của một detection: det_score x cạnh ngắn của bbox"""
+    score = float(bbox[4]) if len(bbox) > 4 else 1.0
+    return score * float(min(bbox[2] - bbox[0], bbox[3] - bbox[1]))
+
+
+class KalmanBox:
+    """Bộ lọc Kalman vận tốc không đổi cho một bbox, trạng thái (cx, cy, diện tích, tỉ lệ, vx, vy, va) như SORT"""
+
+    F = np.eye(7)
+    F[0, 4] = F[1, 5] = F[2, 6] = 1
+    H = np.eye(4, 7)
+
+    def __init__(self, bbox: np.ndarray):
+        self.x = np.zeros(7)
+        self.x[:4] = self.to_z(bbox)
+        self.P = np.diag([10, 10, 10, 10, 1e4, 1e4, 1e4]).astype(float)
+        self.Q = np.diag([1, 1, 1, 1e-2, 1e-2, 1e-2, 1e-4])
+        self.R = np.diag([1, 1, 10, 10]).astype(float)
+
+    @staticmethod
+    def to_z(bbox) -> np.ndarray:
+        width, height = bbox[2] - bbox[0], bbox[3] - bbox[1]
+        return np.array([bbox[0] + width / 2, bbox[1] + height / 2, width * height, width / max(height, 1e-6)])
+
+    def box(self) -> np.ndarray:
+        area, ratio = max(self.x[2], 1e-6), max(self.x[3], 1e-6)
+        width = np.sqrt(area * ratio)
+        height = area / width
+        return np.array([self.x[0] - width / 2, self.x[1] - height / 2, self.x[0] + width / 2, self.x[1] + height / 2])
+
+    def predict(self) -> np.ndarray:
+        # Diện tích không được âm
+        if self.x[2] + self.x[6] <= 0:
+            self.x[6] = 0
+        self.x = self.F @ self.x
+        self.P = self.F @ self.P @ self.F.T + self.Q
+        return self.box()
+
+    def update(self, bbox: np.ndarray):
+        y = self.to_z(bbox) - self.H @ self.x
+        S = self.H @ self.P @ self.H.T + self.R
+        K = self.P @ self.H.T @ np.linalg.inv(S)
+        self.x = self.x + K @ y
+        self.P = (np.eye(7) - K @ self.H) @ self.P
+
+
+class Track:
+    """Một khuôn mặt được theo dõi qua nhiều frame cùng các lần bỏ phiếu danh tính"""
+
+    def __init__(self, track_id: int, bbox: np.ndarray, vote_n: int):
+        self.track_id = track_id
+        self.kalman = KalmanBox(bbox)
+        self.bbox = bbox
+        self.hits = 1
+        self.misses = 0
+        self.votes = deque(maxlen=vote_n)
+        # Lần khớp điểm cao nhất của từng học sinh
+        self.best_matches: Dict = {}
+        self.identity: Optional[Dict] = None
+        self.best_quality = 0.0
+        self.last_embedded = None
+
+    def leading_vote(self):
+        """(student_id, số phiếu) được nhiều phiếu nhất trong các lần gần đây (bỏ phiếu 'không khớp')"""
+        counts = Counter(vote for vote in self.votes if vote is not None)
+        return counts.most_common(1)[0] if counts else (None, 0)
+
+
+class FaceTracker:
+    """Theo dõi khuôn mặt kiểu SORT (Kalman + ghép IoU) giữa bước detect và bước embedding
+
+    - Track chưa xác nhận được embedding mỗi frame cho tới khi đủ TRACK_VOTE_K / TRACK_VOTE_N phiếu.
+    - Track đã xác nhận (hoặc đã đủ TRACK_VOTE_N phiếu mà không khớp ai, ví dụ người lạ) bỏ qua
+      embedding, chỉ kiểm tra lại sau TRACK_REVERIFY_FRAMES frame hoặc khi mặt rõ hơn hẳn
+      (chất lượng tăng TRACK_QUALITY_GAIN lần).
+    """
+
+    def __init__(self, iou_threshold: float = TRACK_IOU_THRESHOLD, max_misses: int = TRACK_MAX_MISSES,
+                 vote_k: int = TRACK_VOTE_K, vote_n: int = TRACK_VOTE_N,
+                 reverify_frames: int = TRACK_REVERIFY_FRAMES, quality_gain: float = TRACK_QUALITY_GAIN):
+        if not 0 < vote_k <= vote_n:
+            raise ValueError(f"Cần 0 < TRACK_VOTE_K <= TRACK_VOTE_N (đang là {vote_k}, {vote_n})")
+        self.iou_threshold = iou_threshold
+        self.max_misses = max_misses
+        self.vote_k = vote_k
+        self.vote_n = vote_n
+        self.reverify_frames = reverify_frames
+        self.quality_gain = quality_gain
+        self.tracks: List[Track] = []
+        self._next_id = 1
+        self._frame = 0
+        self._started = time.monotonic()
+        self._stats = {
+            'frames': 0,
+            'detections': 0,
+            'embedded': 0,
+            'reused': 0,
+            'quality_rejected': 0,
+            'tracks_started': 0,
+            'tracks_confirmed': 0,
+            'reverified': 0,
+            'identity_changes': 0,
+        }
+
+    def update(self, bboxes: np.ndarray) -> List[Track]:
+        """Cập nhật các track với detection của frame mới; trả về track tương ứng từng detection"""
+        self._frame += 1
+        self._stats['frames'] += 1
+        self._stats['detections'] += len(bboxes)
+        predicted = np.array([track.kalman.predict() for track in self.tracks]).reshape(-1, 4)
+        ious = iou_matrix(np.asarray(bboxes, dtype=np.float32).reshape(-1, 5)[:, :4], predicted)
+
+        assigned: List[Optional[Track]] = [None] * len(bboxes)
+        used = set()
+        # Ghép tham lam theo IoU giảm dần
+        det_idx, track_idx = np.nonzero(ious >= self.iou_threshold)
+        for d, t in sorted(zip(det_idx, track_idx), key=lambda pair: -ious[pair[0], pair[1]]):
+            if assigned[d] is not None or t in used:
+                continue
+            used.add(t)
+            track = self.tracks[t]
+            track.kalman.update(bboxes[d])
+            track.bbox = bboxes[d]
+            track.hits += 1
+            track.misses = 0
+            assigned[d] = track
+
+        for t, track in enumerate(self.tracks):
+            if t not in used:
+                track.misses += 1
+        self.tracks = [track for track in self.tracks if track.misses <= self.max_misses]
+
+        for d, bbox in enumerate(bboxes):
+            if assigned[d] is None:
+                track = Track(self._next_id, bbox, self.vote_n)
+                self._next_id += 1
+                self._stats['tracks_started'] += 1
+                self.tracks.append(track)
+                assigned[d] = track
+        return assigned
+
+    def needs_embedding(self, track: Track) -> bool:
+        """Track có cần chạy model recognition ở frame này không
+
+        Chỉ quyết định; track được tính là đã embedding khi gọi mark_embedded (sau khi mặt qua
+        bộ lọc chất lượng và có embedding thật), hoặc mark_rejected nếu mặt bị loại.
+        """
+        if track.identity is None and len(track.votes) < self.vote_n:
+            needed = True
+        elif track.last_embedded is None or self._frame - track.last_embedded >= self.reverify_frames:
+            needed = True
+        else:
+            needed = face_quality(track.bbox) >= track.best_quality * self.quality_gain
+        if not needed:
+            self._stats['reused'] += 1
+        return needed
+
+    def mark_embedded(self, track: Track):
+        """Ghi nhận track vừa có embedding ở frame này"""
+        if track.identity is not None:
+            self._stats['reverified'] += 1
+        self._stats['embedded'] += 1
+        track.last_embedded = self._frame
+        track.best_quality = max(track.best_quality, face_quality(track.bbox))
+
+    def mark_rejected(self, track: Track):
+        """Track cần embedding nhưng mặt bị bộ lọc chất lượng loại: thử lại ở frame sau"""
+        self._stats['quality_rejected'] += 1
+
+    def vote(self, track: Track, match: Optional[Dict]) -> Optional[Dict]:
+        """Ghi một phiếu nhận diện cho track; trả về danh tính khi vừa được xác nhận (hoặc đổi)"""
+        student_id = match['student_id'] if match is not None else None
+        track.votes.append(student_id)
+        best = track.best_matches.get(student_id)
+        if match is not None and (best is None or match['score'] > best['score']):
+            track.best_matches[student_id] = match
+        leader, count = track.leading_vote()
+        if count < self.vote_k:
+            return None
+        if track.identity is not None and track.identity['student_id'] == leader:
+            return None
+        if track.identity is None:
+            self._stats['tracks_confirmed'] += 1
+        else:
+            self._stats['identity_changes'] += 1
+        track.identity = dict(track.best_matches[leader], track_id=track.track_id)
+        return track.identity
+
+    def metrics(self) -> Dict:
+        stats = dict(self._stats)
+        minutes = max((time.monotonic() - self._started) / 60, 1e-6)
+        stats['active_tracks'] = len(self.tracks)
+        stats['embeds_per_min'] = round(stats['embedded'] / minutes, 1)
+        looked = stats['embedded'] + stats['reused'] + stats['quality_rejected']
+        stats['reuse_ratio'] = round(stats['reused'] / looked, 3) if looked else 0.0
+        return stats
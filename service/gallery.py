@@ -0,0 +1,331 @@
+import os
+import threading
+import numpy as np
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence
+
+# single: một embedding mới nhất / học sinh; latest: tối đa GALLERY_MAX_TEMPLATES embedding mới nhất;
+# cluster: phân cụm tối đa GALLERY_CLUSTER_SOURCE embedding mới nhất thành GALLERY_MAX_TEMPLATES ảnh mẫu
+GALLERY_MODE = os.getenv('GALLERY_MODE', 'latest')
+GALLERY_MAX_TEMPLATES = int(os.getenv('GALLERY_MAX_TEMPLATES', '5'))
+GALLERY_CLUSTER_SOURCE = int(os.getenv('GALLERY_CLUSTER_SOURCE', '50'))
+# max: điểm của học sinh là điểm ảnh mẫu giống nhất; mean: trung bình các ảnh mẫu
+GALLERY_POOLING = os.getenv('GALLERY_POOLING', 'max')
+# Giới hạn bộ nhớ ma trận ảnh mẫu của một lớp (MB); vượt thì giảm số ảnh mẫu mỗi học sinh
+GALLERY_MAX_CLASS_MB = float(os.getenv('GALLERY_MAX_CLASS_MB', '32'))
+
+GALLERY_MODES = ('single', 'latest', 'cluster')
+GALLERY_POOLINGS = ('max', 'mean')
+
+
+class ClassGallery:
+    """Ma trận embedding đã chuẩn hoá (float32) của toàn bộ học sinh trong một lớp"""
+
+    def __init__(self, student_ids: Sequence[str], names: Sequence[str], embeddings):
+        self.student_ids: List[str] = list(student_ids)
+        self.names: List[str] = list(names)
+        matrix = np.asarray(embeddings, dtype=np.float32)
+        if matrix.size == 0:
+            matrix = np.empty((0, 0), dtype=np.float32)
+        self.matrix = normalize_rows(matrix)
+
+    def __len__(self):
+        return len(self.student_ids)
+
+    def student_scores(self, queries: np.ndarray) -> np.ndarray:
+        """Điểm cosine của từng khuôn mặt với từng học sinh, dạng (số mặt, số học sinh)"""
+        return normalize_rows(queries) @ self.matrix.T
+
+    def search(self, query, top_k: int = 5, threshold: float = 0.0) -> List[Dict]:
+        """Chấm điểm cosine một embedding với cả lớp bằng một phép nhân ma trận - vector"""
+        if len(self) == 0 or top_k < 1:
+            return []
+        scores = self.student_scores(np.asarray(query, dtype=np.float32).reshape(1, -1))[0]
+
+        k = min(top_k, len(scores))
+        # argpartition O(n) rồi chỉ sắp xếp k phần tử tốt nhất
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+
+        return [
+            {
+                "student_id": self.student_ids[i],
+                "name": self.names[i],
+                "score": float(scores[i])
+            }
+            for i in top
+            if scores[i] >= threshold
+        ]
+
+    def match_faces(self, queries, threshold: float = 0.0) -> List[Optional[Dict]]:
+        """Ghép nhiều khuôn mặt với lớp trong một bước, mỗi học sinh nhận tối đa một mặt
+
+        Trả về danh sách cùng độ dài với queries, phần tử None nếu mặt không khớp ai.
+        """
+        queries = np.asarray(queries, dtype=np.float32)
+        if queries.ndim == 1:
+            queries = queries.reshape(1, -1)
+        matches: List[Optional[Dict]] = [None] * len(queries)
+        if len(self) == 0 or len(queries) == 0:
+            return matches
+
+        scores = self.student_scores(queries)  # (số mặt, số học sinh)
+
+        # Ghép tham lam: duyệt các cặp (mặt, học sinh) theo điểm giảm dần
+        face_idx, student_idx = np.nonzero(scores >= threshold)
+        order = np.argsort(-scores[face_idx, student_idx], kind="stable")
+        used_students = set()
+        for f, s in zip(face_idx[order], student_idx[order]):
+            if matches[f] is not None or s in used_students:
+                continue
+            used_students.add(s)
+            matches[f] = {
+                "student_id": self.student_ids[s],
+                "name": self.names[s],
+                "score": float(scores[f, s])
+            }
+        return matches
+
+    def add(self, student_id: str, name: str, embedding) -> "ClassGallery":
+        """Trả về gallery mới có thêm (hoặc thay thế) một học sinh"""
+        student_ids = list(self.student_ids)
+        names = list(self.names)
+        rows = list(self.matrix) if len(self) else []
+        if student_id in student_ids:
+            idx = student_ids.index(student_id)
+            del student_ids[idx], names[idx], rows[idx]
+        student_ids.append(student_id)
+        names.append(name)
+        rows.append(np.asarray(embedding, dtype=np.float32))
+        return ClassGallery(student_ids, names, rows)
+
+    def remove(self, student_id: str) -> "ClassGallery":
+        """Trả về gallery mới không còn học sinh student_id"""
+        keep = [i for i, sid in enumerate(self.student_ids) if sid != student_id]
+        return ClassGallery(
+            [self.student_ids[i] for i in keep],
+            [self.names[i] for i in keep],
+            self.matrix[keep] if keep else []
+        )
+
+
+class TemplateGallery(ClassGallery):
+    """Gallery nhiều ảnh mẫu mỗi học sinh
+
+    Mọi ảnh mẫu của lớp nằm liền nhau trong một ma trận (các ảnh mẫu của cùng học sinh đứng
+    cạnh nhau), nên chấm điểm là một phép nhân ma trận rồi gộp max / mean theo từng đoạn
+    bằng reduceat.
+    """
+
+    def __init__(self, student_ids: Sequence, names: Sequence[str], templates: Sequence,
+                 pooling: str = GALLERY_POOLING, max_templates: int = GALLERY_MAX_TEMPLATES):
+        if pooling not in GALLERY_POOLINGS:
+            raise ValueError(f"GALLERY_POOLING không hỗ trợ: {pooling} (chọn {', '.join(GALLERY_POOLINGS)})")
+        self.pooling = pooling
+        self.max_templates = max_templates
+        self.student_ids = []
+        self.names = []
+        self.templates: List[np.ndarray] = []
+        for student_id, name, student_templates in zip(student_ids, names, templates):
+            student_templates = np.asarray(student_templates, dtype=np.float32)
+            student_templates = student_templates.reshape(-1, student_templates.shape[-1])[:max_templates]
+            if len(student_templates) == 0:
+                continue
+            self.student_ids.append(student_id)
+            self.names.append(name)
+            self.templates.append(normalize_rows(student_templates))
+
+        if self.templates:
+            self.matrix = np.ascontiguousarray(np.concatenate(self.templates))
+        else:
+            self.matrix = np.empty((0, 0), dtype=np.float32)
+        self.counts = np.array([len(t) for t in self.templates], dtype=np.int64)
+        self.starts = np.concatenate(([0], np.cumsum(self.counts)[:-1])) if len(self.counts) else self.counts
+
+    @property
+    def nbytes(self) -> int:
+        return self.matrix.nbytes
+
+    def student_scores(self, queries: np.ndarray) -> np.ndarray:
+        scores = normalize_rows(queries) @ self.matrix.T  # (số mặt, số ảnh mẫu)
+        if self.pooling == 'max':
+            return np.maximum.reduceat(scores, self.starts, axis=1)
+        return np.add.reduceat(scores, self.starts, axis=1) / self.counts
+
+    def add(self, student_id, name: str, embedding) -> "TemplateGallery":
+        """Trả về gallery mới có thêm một ảnh mẫu (mới nhất trước, bỏ ảnh cũ nhất nếu quá max_templates)"""
+        student_ids, names, templates = list(self.student_ids), list(self.names), list(self.templates)
+        new = np.asarray(embedding, dtype=np.float32).reshape(1, -1)
+        if student_id in student_ids:
+            idx = student_ids.index(student_id)
+            names[idx] = name
+            templates[idx] = np.concatenate([new, templates[idx]])
+        else:
+            student_ids.append(student_id)
+            names.append(name)
+            templates.append(new)
+        return TemplateGallery(student_ids, names, templates, self.pooling, self.max_templates)
+
+    def remove(self, student_id) -> "TemplateGallery":
+        keep = [i for i, sid in enumerate(self.student_ids) if sid != student_id]
+        return TemplateGallery(
+            [self.student_ids[i] for i in keep],
+            [self.names[i] for i in keep],
+            [self.templates[i] for i in keep],
+            self.pooling,
+            self.max_templates
+        )
+
+
+def compact_templates(vectors: np.ndarray, k: int, iterations: int = 10) -> np.ndarray:
+    """Gom nhiều embedding của một học sinh thành tối đa k ảnh mẫu (k-means trên mặt cầu)
+
+    Khởi tạo bằng farthest-point từ embedding mới nhất (hàng đầu) nên kết quả ổn định giữa
+    các lần nạp và các góc mặt khác nhau đều có ảnh mẫu riêng.
+    """
+    vectors = normalize_rows(np.asarray(vectors, dtype=np.float32))
+    if len(vectors) <= k:
+        return vectors
+    chosen = [0]
+    closest = vectors @ vectors[0]
+    for _ in range(1, k):
+        chosen.append(int(np.argmin(closest)))
+        closest = np.maximum(closest, vectors @ vectors[chosen[-1]])
+    centroids = vectors[chosen]
+    for _ in range(iterations):
+        labels = np.argmax(vectors @ centroids.T, axis=1)
+        updated = np.stack([
+            vectors[labels == c].sum(axis=0) if np.any(labels == c) else centroids[c]
+            for c in range(k)
+        ])
+        updated = normalize_rows(updated)
+        if np.allclose(updated, centroids, atol=1e-5):
+            break
+        centroids = updated
+    return centroids
+
+
+def templates_to_load(mode: str = GALLERY_MODE, max_templates: int = GALLERY_MAX_TEMPLATES) -> int:
+    """Số embedding mới nhất mỗi học sinh cần đọc từ DB cho chế độ gallery"""
+    if mode not in GALLERY_MODES:
+        raise ValueError(f"GALLERY_MODE không hỗ trợ: {mode} (chọn {', '.join(GALLERY_MODES)})")
+    if mode == 'single':
+        return 1
+    if mode == 'cluster':
+        return max(GALLERY_CLUSTER_SOURCE, max_templates)
+    return max_templates
+
+
+def build_template_gallery(rows: Sequence[Dict], mode: str = GALLERY_MODE,
+                           max_templates: int = GALLERY_MAX_TEMPLATES, pooling: str = GALLERY_POOLING,
+                           max_mb: float = GALLERY_MAX_CLASS_MB) -> TemplateGallery:
+    """Dựng gallery từ các bản ghi face_embeddings (mới nhất trước trong từng học sinh)
+
+    Nếu ma trận ảnh mẫu vượt max_mb thì giảm số ảnh mẫu mỗi học sinh cho vừa (tối thiểu 1).
+    """
+    if mode == 'single':
+        max_templates = 1
+    students: Dict = OrderedDict()
+    for row in rows:
+        if row.get('embedding') is None:
+            continue
+        entry = students.setdefault(row['student_id'], (row.get('student_name'), []))
+        entry[1].append(row['embedding'])
+    if not students:
+        return TemplateGallery([], [], [], pooling, max_templates)
+
+    dim = len(next(iter(students.values()))[1][0])
+    budget = int(max_mb * 1024 * 1024 // (dim * 4 * len(students)))
+    per_student = max(min(max_templates, budget), 1)
+
+    templates = []
+    for _, embeddings in students.values():
+        if mode == 'cluster':
+            templates.append(compact_templates(np.asarray(embeddings), per_student))
+        else:
+            templates.append(np.asarray(embeddings[:per_student]))
+    return TemplateGallery(
+        list(students),
+        [name for name, _ in students.values()],
+        templates,
+        pooling,
+        per_student
+    )
+
+
+class GalleryCache:
+    """Cache gallery theo lớp, giữ trong bộ nhớ giữa các request"""
+
+    def __init__(self):
+        self._galleries: Dict[str, ClassGallery] = {}
+        # Lần nạp đang chạy của mỗi lớp: class_id -> token; bị xoá khi lớp thay đổi giữa chừng
+        self._loads: Dict[str, int] = {}
+        self._load_seq = 0
+        self._lock = threading.Lock()
+
+    def get(self, class_id: str) -> Optional[ClassGallery]:
+        """Lấy gallery của lớp (None nếu chưa nạp)"""
+        return self._galleries.get(class_id)
+
+    def begin_load(self, class_id: str) -> int:
+        """Đánh dấu bắt đầu nạp lớp từ DB; trả về token truyền lại cho put()"""
+        with self._lock:
+            self._load_seq += 1
+            self._loads[class_id] = self._load_seq
+            return self._load_seq
+
+    def end_load(self, class_id: str, token: int):
+        """Bỏ đánh dấu một lần nạp không gọi put() (ví dụ đọc DB lỗi)"""
+        with self._lock:
+            if self._loads.get(class_id) == token:
+                del self._loads[class_id]
+
+    def put(self, class_id: str, gallery: ClassGallery, token: int = None) -> bool:
+        """Lưu gallery của lớp
+
+        Với token từ begin_load(): không lưu (trả về False) nếu lớp đã có ghi danh / xoá học sinh
+        trong lúc nạp, vì ảnh chụp DB đã cũ và add_student() không áp dụng được khi lớp chưa có
+        trong cache.
+        """
+        with self._lock:
+            if token is not None:
+                if self._loads.get(class_id) != token:
+                    return False
+                del self._loads[class_id]
+            self._galleries[class_id] = gallery
+            return True
+
+    def add_student(self, class_id: str, student_id: str, name: str, embedding):
+        """Cập nhật gallery khi ghi danh học sinh (lớp chưa được nạp thì chỉ huỷ lần nạp đang chạy)"""
+        with self._lock:
+            self._loads.pop(class_id, None)
+            gallery = self._galleries.get(class_id)
+            if gallery is not None:
+                self._galleries[class_id] = gallery.add(student_id, name, embedding)
+
+    def remove_student(self, class_id: str, student_id: str):
+        """Cập nhật gallery khi xoá học sinh"""
+        with self._lock:
+            self._loads.pop(class_id, None)
+            gallery = self._galleries.get(class_id)
+            if gallery is not None:
+                self._galleries[class_id] = gallery.remove(student_id)
+
+    def invalidate(self, class_id: str = None):
+        """Xoá cache của một lớp (hoặc toàn bộ) để nạp lại từ DB"""
+        with self._lock:
+            if class_id is None:
+                self._galleries.clear()
+                self._loads.clear()
+            else:
+                self._galleries.pop(class_id, None)
+                self._loads.pop(class_id, None)
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """Chuẩn hoá L2 từng hàng của ma trận"""
+    if matrix.size == 0:
+        return matrix
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
@@ -0,0 +1,96 @@
+import io
+import os
+import numpy as np
+from typing import Optional, Tuple
+
+import cv2
+from PIL import Image, ImageOps
+
+# Không giải mã nhỏ hơn cạnh dài này (mặc định theo kích thước detector); tăng lên nếu
+# mặt trong ảnh nhỏ và cần giữ chi tiết cho bước căn chỉnh
+DECODE_MIN_SIDE = int(os.getenv('IMAGE_DECODE_MIN_SIDE', '0'))
+
+# Hệ số thu nhỏ khi giải mã JPEG (libjpeg giải mã thẳng ở 1/2, 1/4, 1/8 độ phân giải)
+_REDUCED_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+)
+
+EXIF_ORIENTATION_TAG = 0x0112
+
+
+def read_header(img_bytes) -> Tuple[Optional[str], Optional[Tuple[int, int]], int]:
+    """Đọc (định dạng, (rộng, cao), EXIF orientation) từ header, không giải mã điểm ảnh"""
+    try:
+        with Image.open(io.BytesIO(img_bytes)) as img:
+            orientation = 1
+            if img.format == 'JPEG':
+                orientation = img.getexif().get(EXIF_ORIENTATION_TAG, 1)
+            return img.format, img.size, orientation
+    except Exception:
+        return None, None, 1
+
+
+def apply_orientation(img: np.ndarray, orientation: int) -> np.ndarray:
+    """Xoay / lật ảnh theo EXIF orientation (giống PIL.ImageOps.exif_transpose)"""
+    if orientation == 2:
+        return cv2.flip(img, 1)
+    if orientation == 3:
+        return cv2.rotate(img, cv2.ROTATE_180)
+    if orientation == 4:
+        return cv2.flip(img, 0)
+    if orientation == 5:
+        return cv2.transpose(img)
+    if orientation == 6:
+        return cv2.rotate(img, cv2.ROTATE_90_CLOCKWISE)
+    if orientation == 7:
+        return cv2.rotate(cv2.transpose(img), cv2.ROTATE_180)
+    if orientation == 8:
+        return cv2.rotate(img, cv2.ROTATE_90_COUNTERCLOCKWISE)
+    return img
+
+
+def reduction_for(size: Tuple[int, int], min_side: int) -> int:
+    """Hệ số thu nhỏ lớn nhất mà cạnh dài sau khi giải mã vẫn >= min_side"""
+    if not min_side:
+        return 1
+    long_side = max(size)
+    for factor, _ in _REDUCED_FLAGS:
+        if long_side // factor >= min_side:
+            return factor
+    return 1
+
+
+def decode_with_pil(img_bytes) -> np.ndarray:
+    """Đường giải mã cũ qua PIL cho các định dạng OpenCV không đọc được"""
+    img = ImageOps.exif_transpose(Image.open(io.BytesIO(img_bytes))).convert("RGB")
+    return cv2.cvtColor(np.asarray(img), cv2.COLOR_RGB2BGR)
+
+
+def decode_image(img_bytes, min_side: int = None) -> Tuple[np.ndarray, float]:
+    """Giải mã ảnh upload thẳng sang mảng BGR, trả về (ảnh, tỉ lệ so với ảnh gốc)
+
+    Dùng cv2.imdecode trên buffer của bytes (không chép), JPEG lớn hơn nhiều so với
+    min_side được giải mã ở độ phân giải giảm. Tỉ lệ < 1 nghĩa là ảnh đã bị thu nhỏ:
+    chia toạ độ bbox cho tỉ lệ này để về toạ độ ảnh gốc.
+    """
+    min_side = max(min_side or 0, DECODE_MIN_SIDE)
+    fmt, size, orientation = read_header(img_bytes)
+
+    factor, flags = 1, cv2.IMREAD_COLOR
+    if fmt == 'JPEG' and size is not None:
+        factor = reduction_for(size, min_side)
+        flags = dict(_REDUCED_FLAGS).get(factor, cv2.IMREAD_COLOR)
+
+    buf = np.frombuffer(img_bytes, dtype=np.uint8)
+    img = cv2.imdecode(buf, flags | cv2.IMREAD_IGNORE_ORIENTATION)
+    if img is None:
+        return decode_with_pil(img_bytes), 1.0
+
+    img = apply_orientation(img, orientation)
+    if factor == 1 or size is None:
+        return img, 1.0
+    # Tỉ lệ thực tế (libjpeg làm tròn lên khi chia)
+    original_long = max(size)
+    return img, max(img.shape[:2]) / original_long
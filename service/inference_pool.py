@@ -0,0 +1,337 @@
+import itertools
+import multiprocessing as mp
+import os
+import queue
+import threading
+import numpy as np
+from concurrent.futures import Future
+from multiprocessing.connection import wait
+from multiprocessing.shared_memory import SharedMemory
+from typing import Dict, Optional, Sequence, Tuple
+
+
+def _worker_main(worker_id: int, shm_name: str, slot_bytes: int, tasks, results,
+                 model_name: str, det_size: Tuple[int, int], threads: int, cpus: Optional[Sequence[int]]):
+    """Vòng lặp của một worker process: model riêng, đọc frame trực tiếp từ shared memory"""
+    if cpus and hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, cpus)
+
+    import cv2
+    from insightface.app import FaceAnalysis
+    from service.face_engine import detect_and_embed_filtered, limit_session_threads, session_threads
+    from service.face_quality import FaceQualityFilter
+
+    # Worker đã song song ở mức process, OpenCV không cần thêm thread
+    cv2.setNumThreads(1)
+    model = FaceAnalysis(name=model_name, allowed_modules=['detection', 'recognition'],
+                         providers=['CPUExecutionProvider'])
+    # Giới hạn thread ONNX Runtime để N worker không tranh nhau toàn bộ core
+    limit_session_threads(model, threads)
+    model.prepare(ctx_id=-1, det_size=det_size)
+    # Cùng ngưỡng với process chính (đọc từ biến môi trường)
+    quality_filters = {
+        'recognition': FaceQualityFilter.from_env(),
+        'enroll': FaceQualityFilter.for_enrollment(),
+    }
+
+    shm = SharedMemory(name=shm_name)
+    results.send((None, True, (worker_id, session_threads(model))))
+    try:
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+            task_id, slot, shape, first_only, task_det_size, quality = task
+            frame = np.ndarray(shape, dtype=np.uint8, buffer=shm.buf, offset=slot * slot_bytes)
+            try:
+                result = detect_and_embed_filtered(model, frame, quality_filters[quality], first_only, task_det_size)
+                results.send((task_id, True, result))
+            except Exception as e:
+                results.send((task_id, False, repr(e)))
+            finally:
+                del frame
+    finally:
+        shm.close()
+
+
+class InferencePool:
+    """Pool worker process chạy InsightFace, mỗi process một FaceAnalysis riêng
+
+    Frame BGR đã giải mã được chép vào một slot của vùng shared memory; qua queue chỉ gửi
+    (task_id, slot, shape) nên không phải pickle ảnh. Kết quả (embeddings, bboxes, lý do
+    loại khuôn mặt) nhỏ nên trả về qua queue như bình thường.
+
+    Mỗi worker có queue task và pipe kết quả riêng nên biết request nào đang ở worker nào: worker
+    chết thì chỉ các request của nó bị báo lỗi (slot của chúng mới được trả lại), rồi worker được
+    khởi động lại; worker chết đột ngột cũng không giữ lock của kênh dùng chung nào.
+    """
+
+    def __init__(self, num_workers: int, threads_per_worker: int = None, model_name: str = "buffalo_l",
+                 det_size: Tuple[int, int] = (640, 640), slot_mb: int = 12, slots: int = None,
+                 pin_cpus: bool = None):
+        cpu_count = os.cpu_count() or 1
+        self.num_workers = max(int(num_workers), 1)
+        self.threads_per_worker = threads_per_worker or max(cpu_count // self.num_workers, 1)
+        self.model_name = model_name
+        self.det_size = det_size
+        self.slot_bytes = int(slot_mb * 1024 * 1024)
+        self.slots = slots or 2 * self.num_workers
+        if pin_cpus is None:
+            pin_cpus = self.num_workers * self.threads_per_worker <= cpu_count
+        self.pin_cpus = pin_cpus
+
+        self._shm: Optional[SharedMemory] = None
+        self._ctx = None
+        self._processes = []
+        self._tasks = []
+        self._results = []
+        self._stopping = threading.Event()
+        self._collector: Optional[threading.Thread] = None
+        self._free_slots: "queue.Queue[int]" = queue.Queue()
+        # task_id -> (Future, slot, worker_id)
+        self._pending: Dict[int, Tuple[Future, int, int]] = {}
+        self._in_flight = [0] * self.num_workers
+        self._pending_lock = threading.Lock()
+        self._task_ids = itertools.count(1)
+        self._ready = threading.Event()
+        self._ready_workers = set()
+        # Worker chết trước khi nạp xong model (lỗi nạp model): không khởi động lại
+        self._broken_workers = set()
+        self._worker_threads: Dict[int, Dict[str, int]] = {}
+        self._stats = {'submitted': 0, 'completed': 0, 'failed': 0, 'resized': 0, 'restarts': 0}
+
+    @classmethod
+    def from_env(cls, model_name: str = "buffalo_l", det_size: Tuple[int, int] = (640, 640)) -> Optional["InferencePool"]:
+        """Tạo pool theo biến môi trường; None nếu INFERENCE_WORKERS = 0 (chạy trong process chính)"""
+        num_workers = int(os.getenv('INFERENCE_WORKERS', '0'))
+        if num_workers <= 0:
+            return None
+        threads = int(os.getenv('INFERENCE_THREADS_PER_WORKER', '0')) or None
+        return cls(
+            num_workers,
+            threads_per_worker=threads,
+            model_name=model_name,
+            det_size=det_size,
+            slot_mb=int(os.getenv('INFERENCE_SLOT_MB', '12')),
+            slots=int(os.getenv('INFERENCE_SLOTS', '0')) or None
+        )
+
+    def _worker_cpus(self, worker_id: int) -> Optional[Sequence[int]]:
+        """Các core dành riêng cho worker (mỗi worker một dải core liên tiếp)"""
+        if not self.pin_cpus:
+            return None
+        start = worker_id * self.threads_per_worker
+        return list(range(start, start + self.threads_per_worker))
+
+    def _spawn_worker(self, worker_id: int):
+        """Khởi động (hoặc khởi động lại) một worker với queue task và pipe kết quả mới"""
+        tasks = self._ctx.Queue()
+        reader, writer = self._ctx.Pipe(duplex=False)
+        process = self._ctx.Process(
+            target=_worker_main,
+            args=(worker_id, self._shm.name, self.slot_bytes, tasks, writer,
+                  self.model_name, self.det_size, self.threads_per_worker,
+                  self._worker_cpus(worker_id)),
+            daemon=True
+        )
+        process.start()
+        # Chỉ worker giữ đầu ghi: worker chết thì đầu đọc nhận EOF
+        writer.close()
+        if self._results[worker_id] is not None:
+            self._results[worker_id].close()
+        self._tasks[worker_id] = tasks
+        self._results[worker_id] = reader
+        self._processes[worker_id] = process
+
+    def start(self):
+        """Khởi động các worker (spawn, không fork process đang có ONNX session)"""
+        if self._processes:
+            return
+        self._ctx = mp.get_context('spawn')
+        self._shm = SharedMemory(create=True, size=self.slot_bytes * self.slots)
+        for slot in range(self.slots):
+            self._free_slots.put(slot)
+        self._stopping.clear()
+        self._tasks = [None] * self.num_workers
+        self._results = [None] * self.num_workers
+        self._processes = [None] * self.num_workers
+        for worker_id in range(self.num_workers):
+            self._spawn_worker(worker_id)
+        self._collector = threading.Thread(target=self._collect, daemon=True)
+        self._collector.start()
+        print(f"Khởi động {self.num_workers} inference worker ({self.threads_per_worker} thread/worker)")
+
+    def stop(self):
+        """Dừng worker, huỷ các request còn chờ và giải phóng shared memory"""
+        if not self._processes:
+            return
+        # Collector không coi các worker đang thoát là chết bất thường
+        self._stopping.set()
+        with self._pending_lock:
+            for tasks in self._tasks:
+                tasks.put(None)
+        for process in self._processes:
+            process.join(timeout=10)
+            if process.is_alive():
+                process.terminate()
+        self._collector.join(timeout=5)
+        self._processes = []
+        for reader in self._results:
+            reader.close()
+        self._results = []
+
+        with self._pending_lock:
+            pending, self._pending = self._pending, {}
+            self._in_flight = [0] * self.num_workers
+            self._tasks = []
+        for future, _, _ in pending.values():
+            future.set_exception(RuntimeError("Inference pool đã dừng"))
+
+        self._shm.close()
+        self._shm.unlink()
+        self._shm = None
+        self._free_slots = queue.Queue()
+        self._ready.clear()
+        self._ready_workers = set()
+        self._broken_workers = set()
+
+    def is_ready(self) -> bool:
+        """Mọi worker đang sống và đã nạp xong model"""
+        return self._ready.is_set()
+
+    def wait_ready(self, timeout: float = None) -> bool:
+        """Chờ mọi worker nạp xong model"""
+        return self._ready.wait(timeout)
+
+    def _collect(self):
+        """Thread nhận kết quả từ worker, hoàn thành Future và trả slot"""
+        while not self._stopping.is_set():
+            for reader in wait([r for r in self._results if not r.closed], timeout=1.0):
+                self._receive(reader)
+            if not self._stopping.is_set():
+                self._fail_if_worker_died()
+
+    def _receive(self, reader) -> bool:
+        """Đọc và xử lý một message từ pipe của worker; False nếu pipe đã đóng (worker chết)"""
+        try:
+            message = reader.recv()
+        except (EOFError, OSError):
+            return False
+        task_id, ok, payload = message
+        if task_id is None:
+            worker_id, threads = payload
+            self._worker_threads[worker_id] = threads
+            self._ready_workers.add(worker_id)
+            if len(self._ready_workers) == self.num_workers:
+                self._ready.set()
+            return True
+        with self._pending_lock:
+            entry = self._pending.pop(task_id, None)
+            if entry is not None:
+                self._in_flight[entry[2]] -= 1
+        if entry is None:
+            return True
+        future, slot, _ = entry
+        self._free_slots.put(slot)
+        if ok:
+            self._stats['completed'] += 1
+            future.set_result(payload)
+        else:
+            self._stats['failed'] += 1
+            future.set_exception(RuntimeError(payload))
+        return True
+
+    def _fail_if_worker_died(self):
+        """Worker chết giữa chừng: báo lỗi các request của riêng worker đó và khởi động lại nó
+
+        Chỉ trả slot của worker đã chết (không còn ai đọc); slot của worker khác vẫn đang được dùng.
+        Worker chết khi chưa nạp xong model không được khởi động lại, pool báo chưa sẵn sàng.
+        """
+        for worker_id, process in enumerate(self._processes):
+            if worker_id in self._broken_workers or process.is_alive():
+                continue
+            # Kết quả worker đã gửi trước khi chết vẫn hợp lệ
+            reader = self._results[worker_id]
+            while not reader.closed and reader.poll() and self._receive(reader):
+                pass
+            self._ready.clear()
+            loaded = worker_id in self._ready_workers
+            self._ready_workers.discard(worker_id)
+            with self._pending_lock:
+                lost = [task_id for task_id, entry in self._pending.items() if entry[2] == worker_id]
+                failed = [self._pending.pop(task_id) for task_id in lost]
+                self._in_flight[worker_id] = 0
+                if loaded:
+                    self._spawn_worker(worker_id)
+                else:
+                    self._broken_workers.add(worker_id)
+            for future, slot, _ in failed:
+                self._free_slots.put(slot)
+                self._stats['failed'] += 1
+                future.set_exception(RuntimeError("Inference worker đã dừng bất thường"))
+            if loaded:
+                self._stats['restarts'] += 1
+                print(f"⚠️ Inference worker {worker_id} đã dừng (exit {process.exitcode}), "
+                      f"huỷ {len(failed)} request, khởi động lại")
+            else:
+                print(f"✗ Inference worker {worker_id} dừng khi đang nạp model (exit {process.exitcode})")
+
+    def _fit_frame(self, img_bgr: np.ndarray) -> np.ndarray:
+        """Thu nhỏ frame lớn hơn một slot (detector cũng resize về det_size nên không mất độ chính xác đáng kể)"""
+        if img_bgr.nbytes <= self.slot_bytes:
+            return img_bgr
+        import cv2
+        scale = (self.slot_bytes / img_bgr.nbytes) ** 0.5
+        height, width = img_bgr.shape[:2]
+        self._stats['resized'] += 1
+        return cv2.resize(img_bgr, (max(int(width * scale), 1), max(int(height * scale), 1)),
+                          interpolation=cv2.INTER_AREA)
+
+    def submit(self, img_bgr: np.ndarray, first_only: bool = False, timeout: float = None,
+               det_size: Tuple[int, int] = None, quality: str = 'recognition') -> Future:
+        """Gửi một frame BGR (uint8, HxWx3) tới worker; trả về Future của (embeddings, bboxes, lý do loại)
+
+        det_size: kích thước detector riêng cho frame này (mặc định theo pool).
+        quality: bộ lọc chất lượng khuôn mặt trong worker ('recognition' hoặc 'enroll').
+
+        Chặn khi hết slot trống (backpressure) tối đa timeout giây.
+        """
+        if self._shm is None:
+            raise RuntimeError("Inference pool chưa khởi động")
+        frame = np.ascontiguousarray(self._fit_frame(img_bgr), dtype=np.uint8)
+        try:
+            slot = self._free_slots.get(timeout=timeout)
+        except queue.Empty:
+            raise TimeoutError("Không còn slot shared memory trống")
+
+        view = np.ndarray(frame.shape, dtype=np.uint8, buffer=self._shm.buf, offset=slot * self.slot_bytes)
+        np.copyto(view, frame)
+        del view
+
+        future = Future()
+        task_id = next(self._task_ids)
+        with self._pending_lock:
+            workers = [w for w in range(len(self._tasks)) if w not in self._broken_workers]
+            if not workers:
+                self._free_slots.put(slot)
+                raise RuntimeError("Không còn inference worker nào hoạt động")
+            # Worker đang giữ ít request nhất
+            worker_id = min(workers, key=lambda w: self._in_flight[w])
+            self._pending[task_id] = (future, slot, worker_id)
+            self._in_flight[worker_id] += 1
+            self._tasks[worker_id].put((task_id, slot, frame.shape, first_only, det_size, quality))
+        self._stats['submitted'] += 1
+        return future
+
+    def metrics(self) -> Dict:
+        """Số liệu pool: số worker, request đang chờ, slot trống"""
+        stats = dict(self._stats)
+        stats['workers'] = self.num_workers
+        stats['alive'] = sum(1 for p in self._processes if p is not None and p.is_alive())
+        stats['ready'] = len(self._ready_workers)
+        stats['threads_per_worker'] = self.threads_per_worker
+        # Số thread intra-op mà ONNX Runtime thực sự dùng trong từng worker
+        stats['session_threads'] = dict(self._worker_threads)
+        stats['in_flight'] = len(self._pending)
+        stats['free_slots'] = self._free_slots.qsize()
+        return stats
@@ -0,0 +1,129 @@
+import os
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+# Các profile có sẵn: pack model InsightFace, kích thước detector, có nạp model recognition không.
+# Embedding của các pack khác nhau KHÔNG so sánh được với nhau: profile dùng để nhận diện phải
+# cùng pack với profile đã dùng khi đăng ký khuôn mặt.
+MODEL_PROFILES: Dict[str, Dict] = {
+    'accurate': {'pack': 'buffalo_l', 'det_size': 640, 'recognition': True},
+    'balanced': {'pack': 'buffalo_l', 'det_size': 480, 'recognition': True},
+    'fast': {'pack': 'buffalo_l', 'det_size': 320, 'recognition': True},
+    'light': {'pack': 'buffalo_s', 'det_size': 320, 'recognition': True},
+    'antelope': {'pack': 'antelopev2', 'det_size': 640, 'recognition': True},
+    'detect': {'pack': 'buffalo_s', 'det_size': 320, 'recognition': False},
+}
+
+DEFAULT_MODEL_PROFILE = os.getenv('MODEL_PROFILE', 'accurate')
+
+
+class ModelProfile:
+    """Một profile đã nạp: model FaceAnalysis dùng chung theo pack + kích thước detector riêng"""
+
+    def __init__(self, name: str, pack: str, det_size: int, recognition: bool, model):
+        self.name = name
+        self.pack = pack
+        self.det_size: Tuple[int, int] = (det_size, det_size)
+        self.recognition = recognition
+        self.model = model
+
+    def describe(self) -> Dict:
+        return {
+            'name': self.name,
+            'pack': self.pack,
+            'det_size': self.det_size[0],
+            'recognition': self.recognition,
+        }
+
+
+def get_profile_config(name: str) -> Dict:
+    """Cấu hình của profile; ValueError nếu không tồn tại"""
+    if name not in MODEL_PROFILES:
+        raise ValueError(f"Model profile không hỗ trợ: {name} (chọn {', '.join(MODEL_PROFILES)})")
+    return MODEL_PROFILES[name]
+
+
+def check_compatible(name: str, reference: str = None):
+    """ValueError nếu embedding của profile không so sánh được với profile tham chiếu
+    (không có recognition hoặc khác pack)"""
+    config = get_profile_config(name)
+    reference = reference or DEFAULT_MODEL_PROFILE
+    reference_config = get_profile_config(reference)
+    if not config['recognition']:
+        raise ValueError(f"Profile {name} chỉ phát hiện mặt, không tính embedding")
+    if config['pack'] != reference_config['pack']:
+        raise ValueError(f"Profile {name} ({config['pack']}) không cùng model với "
+                         f"embedding đã lưu ({reference_config['pack']})")
+
+
+class ModelRegistry:
+    """Nạp model theo profile khi cần lần đầu và giữ lại để dùng chung
+
+    Mỗi (pack, có recognition) chỉ nạp một lần; các profile khác nhau về det_size dùng
+    chung trọng số vì detector SCRFD nhận kích thước đầu vào ở từng lần gọi.
+    """
+
+    def __init__(self, ctx_id: int = -1, threads: int = None):
+        self.ctx_id = ctx_id
+        # Số thread intra-op của ONNX Runtime (None: mặc định theo số core)
+        self.threads = threads
+        self._models: Dict[Tuple[str, bool], object] = {}
+        self._profiles: Dict[str, ModelProfile] = {}
+        self._status: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+
+    def _load_model(self, pack: str, recognition: bool, det_size: int):
+        from insightface.app import FaceAnalysis
+        from service.face_engine import limit_session_threads
+
+        modules = ['detection', 'recognition'] if recognition else ['detection']
+        model = FaceAnalysis(name=pack, allowed_modules=modules, providers=['CPUExecutionProvider'])
+        if self.threads:
+            # FaceAnalysis bỏ qua sess_options: dựng lại session với số thread cố định (có kiểm tra lại)
+            limit_session_threads(model, self.threads)
+        model.prepare(ctx_id=self.ctx_id, det_size=(det_size, det_size))
+        return model
+
+    def get(self, name: str = None) -> ModelProfile:
+        """Profile đã nạp (nạp model nếu chưa có)"""
+        name = name or DEFAULT_MODEL_PROFILE
+        profile = self._profiles.get(name)
+        if profile is not None:
+            return profile
+
+        from service.face_engine import session_threads
+
+        config = get_profile_config(name)
+        with self._lock:
+            profile = self._profiles.get(name)
+            if profile is None:
+                self._status[name] = {'state': 'loading'}
+                start = time.monotonic()
+                key = (config['pack'], config['recognition'])
+                try:
+                    model = self._models.get(key)
+                    if model is None:
+                        model = self._load_model(config['pack'], config['recognition'], config['det_size'])
+                        self._models[key] = model
+                    threads = session_threads(model)
+                except Exception as e:
+                    self._status[name] = {'state': 'error', 'error': str(e)}
+                    raise
+                profile = ModelProfile(name, config['pack'], config['det_size'], config['recognition'], model)
+                self._profiles[name] = profile
+                self._status[name] = {'state': 'ready', 'load_s': round(time.monotonic() - start, 3),
+                                      'session_threads': threads}
+        return profile
+
+    def status(self) -> Dict[str, Dict]:
+        """Trạng thái nạp của từng profile: loading / ready / error"""
+        return {name: dict(state, **MODEL_PROFILES[name]) for name, state in self._status.items()}
+
+    def loaded(self) -> Dict[str, Dict]:
+        """Các profile đã nạp"""
+        return {name: profile.describe() for name, profile in self._profiles.items()}
+
+    def peek(self, name: str = None) -> Optional[ModelProfile]:
+        """Profile nếu đã nạp, không kích hoạt việc nạp"""
+        return self._profiles.get(name or DEFAULT_MODEL_PROFILE)
@@ -0,0 +1,164 @@
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+import cv2
+import numpy as np
+
+# Cạnh dài của ảnh xám thu nhỏ dùng để so sánh
+MOTION_FRAME_WIDTH = int(os.getenv('MOTION_FRAME_WIDTH', '64'))
+# Chênh lệch mức xám (0-255) để coi một điểm ảnh là thay đổi
+MOTION_PIXEL_DELTA = int(os.getenv('MOTION_PIXEL_DELTA', '25'))
+# Tỉ lệ điểm ảnh thay đổi tối thiểu để chạy detect (camera có thể đặt riêng cameras.motion_threshold)
+MOTION_THRESHOLD = float(os.getenv('MOTION_THRESHOLD', '0.01'))
+# Luôn chạy detect ít nhất một lần sau số giây này kể cả khi cảnh không đổi
+MOTION_MAX_SKIP_S = float(os.getenv('MOTION_MAX_SKIP_S', '30'))
+# 'diff': trừ frame; 'histogram': so histogram từng ô (ít nhạy với nhiễu và thay đổi ánh sáng nhẹ)
+MOTION_METHOD = os.getenv('MOTION_METHOD', 'diff')
+
+HISTOGRAM_GRID = 4
+HISTOGRAM_BINS = 16
+MOTION_METHODS = ('diff', 'histogram')
+
+
+def small_gray(frame: np.ndarray, width: int = MOTION_FRAME_WIDTH) -> np.ndarray:
+    """Ảnh xám thu nhỏ (cạnh dài = width), làm mờ nhẹ để bớt nhiễu cảm biến"""
+    height, frame_width = frame.shape[:2]
+    scale = width / max(height, frame_width)
+    size = (max(int(frame_width * scale), 1), max(int(height * scale), 1))
+    small = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+    if small.ndim == 3:
+        small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+    return cv2.GaussianBlur(small, (3, 3), 0)
+
+
+def changed_ratio(reference: np.ndarray, current: np.ndarray, pixel_delta: int = MOTION_PIXEL_DELTA) -> float:
+    """Tỉ lệ điểm ảnh chênh lệch hơn pixel_delta"""
+    return float(np.count_nonzero(cv2.absdiff(reference, current) > pixel_delta)) / current.size
+
+
+def block_histograms(gray: np.ndarray, grid: int = HISTOGRAM_GRID, bins: int = HISTOGRAM_BINS) -> np.ndarray:
+    """Histogram đã chuẩn hoá của từng ô grid x grid, dạng (grid*grid, bins)"""
+    height, width = gray.shape
+    hists = []
+    for row in range(grid):
+        for col in range(grid):
+            block = gray[row * height // grid:(row + 1) * height // grid,
+                         col * width // grid:(col + 1) * width // grid]
+            hist = np.bincount((block // (256 // bins)).ravel(), minlength=bins).astype(np.float32)
+            hists.append(hist / max(block.size, 1))
+    return np.stack(hists)
+
+
+def histogram_change(reference: np.ndarray, current: np.ndarray) -> float:
+    """Tỉ lệ ô có histogram khác nhau đáng kể (khoảng cách L1 / 2 > 0.25)"""
+    distances = np.abs(reference - current).sum(axis=1) / 2
+    return float(np.count_nonzero(distances > 0.25)) / len(distances)
+
+
+class MotionGate:
+    """Bỏ qua detect khi cảnh không đổi so với frame được xử lý gần nhất
+
+    Frame tham chiếu chỉ được cập nhật khi frame được cho qua, nên cảnh thay đổi chậm dần
+    vẫn bị phát hiện khi chênh lệch cộng dồn đủ lớn.
+    """
+
+    def __init__(self, threshold: float = MOTION_THRESHOLD, pixel_delta: int = MOTION_PIXEL_DELTA,
+                 max_skip_s: float = MOTION_MAX_SKIP_S, method: str = MOTION_METHOD,
+                 width: int = MOTION_FRAME_WIDTH):
+        if method not in MOTION_METHODS:
+            raise ValueError(f"MOTION_METHOD không hỗ trợ: {method} (chọn {', '.join(MOTION_METHODS)})")
+        self.threshold = threshold
+        self.pixel_delta = pixel_delta
+        self.max_skip_s = max_skip_s
+        self.method = method
+        self.width = width
+        self._reference: Optional[np.ndarray] = None
+        self._reference_at = 0.0
+        self._stats = {'frames': 0, 'passed': 0, 'skipped': 0, 'forced': 0, 'gate_ms': 0.0}
+
+    def _signature(self, frame: np.ndarray) -> np.ndarray:
+        gray = small_gray(frame, self.width)
+        return block_histograms(gray) if self.method == 'histogram' else gray
+
+    def _change(self, signature: np.ndarray) -> float:
+        if self.method == 'histogram':
+            return histogram_change(self._reference, signature)
+        return changed_ratio(self._reference, signature, self.pixel_delta)
+
+    def should_process(self, frame: np.ndarray) -> bool:
+        """True nếu frame cần chạy detect (cảnh đổi, frame đầu tiên hoặc quá max_skip_s)"""
+        started = time.monotonic()
+        self._stats['frames'] += 1
+        if self.threshold <= 0:
+            self._stats['passed'] += 1
+            return True
+
+        signature = self._signature(frame)
+        now = time.monotonic()
+        if self._reference is None or self._reference.shape != signature.shape:
+            process = True
+        elif now - self._reference_at >= self.max_skip_s:
+            process = True
+            self._stats['forced'] += 1
+        else:
+            process = self._change(signature) >= self.threshold
+
+        if process:
+            self._reference = signature
+            self._reference_at = now
+            self._stats['passed'] += 1
+        else:
+            self._stats['skipped'] += 1
+        self._stats['gate_ms'] += (time.monotonic() - started) * 1000
+        return process
+
+    def reset(self):
+        """Bỏ frame tham chiếu (ví dụ sau khi nguồn kết nối lại)"""
+        self._reference = None
+
+    def metrics(self) -> Dict:
+        stats = dict(self._stats)
+        frames = stats['frames']
+        stats['avg_gate_ms'] = round(stats.pop('gate_ms') / frames, 3) if frames else 0.0
+        stats['skip_ratio'] = round(stats['skipped'] / frames, 3) if frames else 0.0
+        stats['threshold'] = self.threshold
+        stats['method'] = self.method
+        return stats
+
+
+class CameraMotionGates:
+    """Một MotionGate cho mỗi camera, ngưỡng lấy từ cameras.motion_threshold (NULL: mặc định)
+
+    Dùng làm bước lọc on_frame của CameraWorker; motion_threshold = 0 tắt lọc cho camera đó.
+    """
+
+    def __init__(self, **defaults):
+        self.defaults = defaults
+        self._gates: Dict[int, MotionGate] = {}
+        self._lock = threading.Lock()
+
+    def gate(self, camera: Dict) -> MotionGate:
+        camera_id = camera['camera_id']
+        threshold = camera.get('motion_threshold')
+        gate = self._gates.get(camera_id)
+        if gate is None:
+            with self._lock:
+                gate = self._gates.get(camera_id)
+                if gate is None:
+                    gate = MotionGate(**self.defaults)
+                    self._gates[camera_id] = gate
+        # Ngưỡng riêng của camera, NULL thì về mặc định (đổi trong DB thì có hiệu lực ở lần đọc lại bảng cameras)
+        gate.threshold = threshold if threshold is not None else self.defaults.get('threshold', MOTION_THRESHOLD)
+        return gate
+
+    def __call__(self, camera: Dict, frame: np.ndarray) -> bool:
+        return self.gate(camera).should_process(frame)
+
+    def reset(self, camera: Dict):
+        """Bỏ frame tham chiếu của camera khi nguồn vừa mở lại (frame cũ trước lúc mất kết nối không còn đúng)"""
+        self.gate(camera).reset()
+
+    def metrics(self) -> Dict[int, Dict]:
+        return {camera_id: gate.metrics() for camera_id, gate in self._gates.items()}
@@ -0,0 +1,102 @@
+import base64
+import json
+from datetime import date, datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# Giới hạn số bản ghi mỗi trang
+DEFAULT_PAGE_LIMIT = 100
+MAX_PAGE_LIMIT = 1000
+
+
+def encode_cursor(values: Sequence) -> str:
+    """Mã hoá giá trị khoá của bản ghi cuối trang thành cursor base64 (opaque với client)"""
+    payload = []
+    for value in values:
+        if isinstance(value, datetime):
+            payload.append({'dt': value.isoformat()})
+        elif isinstance(value, date):
+            payload.append({'d': value.isoformat()})
+        else:
+            payload.append(value)
+    raw = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: str, size: int) -> List:
+    """Giải mã cursor; ValueError nếu cursor không hợp lệ"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        payload = json.loads(raw)
+    except (ValueError, TypeError):
+        raise ValueError("cursor không hợp lệ")
+    if not isinstance(payload, list) or len(payload) != size:
+        raise ValueError("cursor không hợp lệ")
+
+    values = []
+    for value in payload:
+        if isinstance(value, dict) and 'dt' in value:
+            value = datetime.fromisoformat(value['dt'])
+        elif isinstance(value, dict) and 'd' in value:
+            value = date.fromisoformat(value['d'])
+        values.append(value)
+    return values
+
+
+def parse_fields(fields, allowed: Dict, default: Sequence[str]) -> List[str]:
+    """Chuẩn hoá tham số fields= (chuỗi phân tách bởi dấu phẩy hoặc list)
+
+    ValueError nếu có trường không được phép.
+    """
+    if not fields:
+        return list(default)
+    if isinstance(fields, str):
+        fields = fields.split(',')
+    requested = [f.strip() for f in fields if f.strip()]
+    unknown = [f for f in requested if f not in allowed]
+    if unknown:
+        raise ValueError(f"Trường không hợp lệ: {', '.join(unknown)}")
+    # Giữ thứ tự, bỏ trùng
+    return list(dict.fromkeys(requested))
+
+
+def clamp_limit(limit: Optional[int]) -> int:
+    """Giới hạn limit trong khoảng [1, MAX_PAGE_LIMIT]"""
+    if not limit:
+        return DEFAULT_PAGE_LIMIT
+    return max(1, min(int(limit), MAX_PAGE_LIMIT))
+
+
+def build_page(rows: List[Dict], limit: int, key_fields: Sequence[str], fields: Sequence[str]) -> Dict:
+    """Cắt kết quả (đã lấy limit + 1 dòng) thành một trang kèm next_cursor
+
+    Các cột khoá chỉ dùng để tạo cursor sẽ bị bỏ nếu client không yêu cầu.
+    """
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    next_cursor = None
+    if has_more and rows:
+        next_cursor = encode_cursor([rows[-1][key] for key in key_fields])
+
+    extra = [key for key in key_fields if key not in fields]
+    if extra:
+        for row in rows:
+            for key in extra:
+                row.pop(key, None)
+    return {'items': rows, 'next_cursor': next_cursor}
+
+
+def build_select(fields: Sequence[str], key_fields: Sequence[str], allowed: Dict) -> Tuple[str, set]:
+    """Dựng danh sách cột SELECT và tập bảng cần JOIN từ các trường được chọn
+
+    allowed: {tên trường: (biểu thức SQL, bảng cần JOIN hoặc None)}
+    Trả về (chuỗi cột, tập bảng cần JOIN).
+    """
+    columns = []
+    joins = set()
+    for name in list(dict.fromkeys(list(key_fields) + list(fields))):
+        expr, join = allowed[name]
+        # Biểu thức đã tự đặt alias (nhiều cột cho một trường) thì giữ nguyên
+        columns.append(expr if ' AS ' in expr else f"{expr} AS {name}")
+        if join:
+            joins.add(join)
+    return ',\n                '.join(columns), joins
@@ -0,0 +1,29 @@
+from typing import Dict, Optional, Sequence, Tuple
+
+# Các hàm dựng query dùng chung cho repository đồng bộ và Async*Repository
+
+
+def like_params(keyword: str, count: int = 2) -> Tuple:
+    """Tham số LIKE '%keyword%' lặp lại cho count cột được tìm"""
+    search_pattern = f"%{keyword}%"
+    return (search_pattern,) * count
+
+
+def update_query(table: str, key_column: str, key, values: Dict,
+                 keep_falsy: Sequence[str] = ()) -> Optional[Tuple[str, Tuple]]:
+    """Câu UPDATE cho các trường có giá trị trong values (theo thứ tự), None nếu không có gì để cập nhật
+
+    Trường rỗng / 0 bị bỏ qua, trừ các cột trong keep_falsy (chỉ bỏ qua khi là None).
+    """
+    updates = []
+    params = []
+    for column, value in values.items():
+        if value or (value is not None and column in keep_falsy):
+            updates.append(f"{column} = %s")
+            params.append(value)
+
+    if not updates:
+        return None
+
+    params.append(key)
+    return f"UPDATE {table} SET {', '.join(updates)} WHERE {key_column} = %s", tuple(params)
@@ -0,0 +1,148 @@
+import hashlib
+import io
+import os
+import threading
+import time
+import numpy as np
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional, Tuple
+
+# Giá trị đặt vào cache khi ảnh không có khuôn mặt (phân biệt với "chưa có trong cache")
+NO_FACE = object()
+
+
+def content_hash(content: bytes) -> str:
+    """Hash nội dung file upload"""
+    return hashlib.sha256(content).hexdigest()
+
+
+def dhash(gray: np.ndarray) -> int:
+    """Difference hash 64 bit của ảnh xám: so sánh từng cặp điểm ảnh kề nhau trên ảnh 9x8"""
+    import cv2
+    small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int(np.packbits(bits).view('>u8')[0])
+
+
+def perceptual_hash(content: bytes) -> Optional[int]:
+    """dHash của ảnh upload; giải mã ở độ phân giải 1/8 nên rẻ hơn nhiều so với chạy model"""
+    try:
+        import cv2
+        gray = cv2.imdecode(np.frombuffer(content, dtype=np.uint8), cv2.IMREAD_REDUCED_GRAYSCALE_8)
+        if gray is None:
+            from PIL import Image
+            gray = np.asarray(Image.open(io.BytesIO(content)).convert("L"))
+        return dhash(gray)
+    except Exception as e:
+        print("Lỗi perceptual_hash:", e)
+        return None
+
+
+def _value_bytes(value) -> int:
+    """Ước lượng bộ nhớ của một kết quả (embeddings, bboxes)"""
+    if value is NO_FACE:
+        return 64
+    embeddings, bboxes = value
+    return int(np.asarray(embeddings).nbytes) + 64 * len(bboxes) + 128
+
+
+class RecognitionCache:
+    """Cache LRU + TTL kết quả detect + embedding theo ảnh upload
+
+    Khoá chính là sha256 của file. Nếu bật near-duplicate (phash_distance > 0), ảnh khác
+    byte nhưng có dHash cách nhau không quá phash_distance bit (trong cùng scope, ví dụ
+    cùng lớp/camera) dùng lại kết quả của ảnh trước.
+    """
+
+    def __init__(self, max_entries: int = 512, max_bytes: int = 64 * 1024 * 1024,
+                 ttl_s: float = 30.0, phash_distance: int = 0):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_s = ttl_s
+        self.phash_distance = phash_distance
+        # key -> (value, thời điểm hết hạn, số byte, scope, dhash)
+        self._entries: "OrderedDict[Tuple, Tuple]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'near_hits': 0, 'misses': 0, 'evictions': 0, 'expired': 0}
+
+    @classmethod
+    def from_env(cls) -> Optional["RecognitionCache"]:
+        """Tạo cache theo biến môi trường; None nếu RECOGNITION_CACHE_SIZE = 0"""
+        max_entries = int(os.getenv('RECOGNITION_CACHE_SIZE', '512'))
+        if max_entries <= 0:
+            return None
+        return cls(
+            max_entries=max_entries,
+            max_bytes=int(float(os.getenv('RECOGNITION_CACHE_MB', '64')) * 1024 * 1024),
+            ttl_s=float(os.getenv('RECOGNITION_CACHE_TTL', '30')),
+            phash_distance=int(os.getenv('RECOGNITION_CACHE_PHASH_DISTANCE', '0'))
+        )
+
+    @property
+    def near_duplicates(self) -> bool:
+        return self.phash_distance > 0
+
+    def _drop(self, key):
+        _, _, size, _, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def get(self, key: Tuple, scope: Hashable = None, phash: int = None):
+        """Kết quả đã cache (hoặc NO_FACE); None nếu không có"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[1] > now:
+                    self._entries.move_to_end(key)
+                    self._stats['hits'] += 1
+                    return entry[0]
+                self._drop(key)
+                self._stats['expired'] += 1
+
+            if phash is not None and self.near_duplicates:
+                # Duyệt từ mục mới nhất: frame liền trước thường giống nhất
+                for other_key in reversed(self._entries):
+                    value, expires, _, other_scope, other_phash = self._entries[other_key]
+                    if other_scope != scope or other_phash is None or expires <= now:
+                        continue
+                    if bin(other_phash ^ phash).count('1') <= self.phash_distance:
+                        self._entries.move_to_end(other_key)
+                        self._stats['near_hits'] += 1
+                        return value
+
+            self._stats['misses'] += 1
+            return None
+
+    def put(self, key: Tuple, value, scope: Hashable = None, phash: int = None):
+        """Lưu kết quả, loại bỏ mục cũ nhất khi vượt giới hạn số mục hoặc bộ nhớ"""
+        size = _value_bytes(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (value, time.monotonic() + self.ttl_s, size, scope, phash)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self._stats['evictions'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def metrics(self) -> Dict:
+        """Số liệu cache: hit / near_hit / miss, số mục và bộ nhớ đang dùng"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+            stats['bytes'] = self._bytes
+        lookups = stats['hits'] + stats['near_hits'] + stats['misses']
+        stats['hit_rate'] = (stats['hits'] + stats['near_hits']) / lookups if lookups else 0.0
+        stats['max_entries'] = self.max_entries
+        stats['max_bytes'] = self.max_bytes
+        stats['ttl_s'] = self.ttl_s
+        stats['phash_distance'] = self.phash_distance
+        return stats
@@ -0,0 +1,358 @@
+import csv
+import io
+import os
+import threading
+import time
+import uuid
+import zipfile
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from mysql.connector.errors import DataError, IntegrityError
+from datetime import date
+from typing import Callable, Dict, List, Optional, Sequence
+
+from service.bulk import insert_rows
+from service.db_connection import db
+from service.face_quality import FaceQualityFilter, reject_message
+from service.face_embeddings import EMBEDDING_INSERT_COLUMNS, embedding_rows
+from service.students import STUDENT_INSERT_COLUMNS, student_rows
+
+# Các cột của file CSV danh sách học sinh (photo: tên file ảnh trong zip / thư mục)
+ROSTER_COLUMNS = ('full_name', 'student_code', 'class_id', 'date_of_birth', 'gender', 'photo')
+REQUIRED_COLUMNS = ('full_name', 'student_code', 'class_id', 'photo')
+GENDERS = ('male', 'female', 'other')
+# Độ dài tối đa theo kiểu cột của bảng students
+FIELD_MAX_LENGTHS = {'full_name': 100, 'student_code': 20, 'avatar_url': 255}
+IMPORT_CHUNK_SIZE = 200
+MAX_IMPORT_ERRORS = 1000
+# student_code được dùng làm tên file ảnh nên không được chứa ký tự đường dẫn
+UNSAFE_CODE_PARTS = ('/', '\\', '..', '\0')
+
+def parse_roster(csv_bytes: bytes):
+    """Đọc CSV danh sách học sinh: trả về (các dòng hợp lệ, lỗi từng dòng)
+
+    Mỗi dòng hợp lệ là dict có thêm 'row' (số dòng trong file, tính cả dòng tiêu đề).
+    """
+    text = csv_bytes.decode('utf-8-sig')
+    reader = csv.DictReader(io.StringIO(text))
+    missing = [c for c in REQUIRED_COLUMNS if c not in (reader.fieldnames or [])]
+    if missing:
+        raise ValueError(f"CSV thiếu cột: {', '.join(missing)}")
+
+    rows, errors, seen_codes = [], [], set()
+    for line_no, raw in enumerate(reader, start=2):
+        record = {key: (raw.get(key) or '').strip() for key in ROSTER_COLUMNS}
+        try:
+            for key in REQUIRED_COLUMNS:
+                if not record[key]:
+                    raise ValueError(f"thiếu {key}")
+            for key in ('full_name', 'student_code'):
+                if len(record[key]) > FIELD_MAX_LENGTHS[key]:
+                    raise ValueError(f"{key} dài quá {FIELD_MAX_LENGTHS[key]} ký tự")
+            if any(part in record['student_code'] for part in UNSAFE_CODE_PARTS):
+                raise ValueError(f"student_code chứa ký tự không hợp lệ: {record['student_code']}")
+            if record['student_code'] in seen_codes:
+                raise ValueError("student_code bị trùng trong file")
+            if not record['class_id'].isdigit():
+                raise ValueError(f"class_id không hợp lệ: {record['class_id']}")
+            record['class_id'] = int(record['class_id'])
+            try:
+                record['date_of_birth'] = (date.fromisoformat(record['date_of_birth'])
+                                           if record['date_of_birth'] else None)
+            except ValueError:
+                raise ValueError(f"date_of_birth phải có dạng YYYY-MM-DD: {record['date_of_birth']}")
+            record['gender'] = record['gender'].lower() or None
+            if record['gender'] and record['gender'] not in GENDERS:
+                raise ValueError(f"gender không hợp lệ: {record['gender']}")
+        except ValueError as e:
+            errors.append({'row': line_no, 'student_code': record['student_code'], 'error': str(e)})
+            continue
+        seen_codes.add(record['student_code'])
+        record['row'] = line_no
+        rows.append(record)
+    return rows, errors
+
+
+class PhotoSource:
+    """Đọc ảnh theo tên file từ file zip hoặc thư mục"""
+
+    def __init__(self, zip_bytes: bytes = None, folder: str = None):
+        self.folder = folder
+        self._zip = zipfile.ZipFile(io.BytesIO(zip_bytes)) if zip_bytes is not None else None
+        self._names = {}
+        if self._zip is not None:
+            # Cho phép CSV chỉ ghi tên file dù trong zip có thư mục con
+            for name in self._zip.namelist():
+                self._names.setdefault(name, name)
+                self._names.setdefault(os.path.basename(name), name)
+        self._lock = threading.Lock()
+
+    def read(self, name: str) -> Optional[bytes]:
+        if self._zip is not None:
+            member = self._names.get(name)
+            if member is None:
+                return None
+            # ZipFile không an toàn khi nhiều thread đọc cùng lúc
+            with self._lock:
+                return self._zip.read(member)
+        path = os.path.join(self.folder, name)
+        if not os.path.isfile(path):
+            return None
+        with open(path, 'rb') as f:
+            return f.read()
+
+
+class FaceEmbedder:
+    """Embedding khuôn mặt rõ nhất của nhiều ảnh: detect song song, recognition một batch"""
+
+    def __init__(self, profile, workers: int = 4, quality: FaceQualityFilter = None):
+        self.profile = profile
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        # Ảnh ghi danh kém chất lượng (mờ, nhỏ, nghiêng) bị từ chối thay vì tạo embedding kém
+        self.quality = quality or FaceQualityFilter.for_enrollment()
+
+    def _first_face(self, img_bytes: bytes):
+        from service.face_engine import detect_faces
+        from service.image_decode import decode_image
+
+        try:
+            img_bgr, _ = decode_image(img_bytes, min_side=max(self.profile.det_size))
+            bboxes, kpss = detect_faces(self.profile.model, img_bgr, det_size=self.profile.det_size)
+        except Exception as e:
+            return None, f"không đọc được ảnh: {e}"
+        crops, _, rejected = self.quality.select(self.profile.model, img_bgr, bboxes[:1], kpss[:1])
+        if not crops:
+            return None, reject_message(rejected).lower()
+        return crops[0], None
+
+    def __call__(self, images: Sequence[bytes]):
+        """Trả về danh sách (embedding hoặc None, lỗi hoặc None) cùng thứ tự với images"""
+        from service.face_engine import embed_crops
+
+        aligned = list(self.executor.map(self._first_face, images))
+        crops = [crop for crop, _ in aligned if crop is not None]
+        embeddings = iter(embed_crops(self.profile.model, crops))
+        return [(next(embeddings), None) if crop is not None else (None, error) for crop, error in aligned]
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+
+
+class StudentImporter:
+    """Nhập hàng loạt học sinh kèm ảnh: embedding theo batch, ghi DB theo chunk transaction
+
+    Có thể chạy lại: học sinh có student_code đã tồn tại được bỏ qua, nên một lần nhập bị
+    ngắt giữa chừng chỉ cần chạy lại với cùng file. Mỗi chunk là một transaction (học sinh
+    và embedding cùng commit hoặc cùng rollback); chunk lỗi được ghi lại từng dòng để chỉ
+    dòng gây lỗi bị báo lỗi.
+    """
+
+    def __init__(self, embedder: Callable, photos: PhotoSource, chunk_size: int = IMPORT_CHUNK_SIZE,
+                 image_dir: str = None, dtype: str = None,
+                 progress: Callable[[Dict], None] = None):
+        self.embedder = embedder
+        self.photos = photos
+        self.chunk_size = chunk_size
+        self.image_dir = image_dir
+        self.dtype = dtype
+        self.progress = progress
+        self.state = {
+            'status': 'pending',
+            'total': 0,
+            'processed': 0,
+            'inserted': 0,
+            'skipped': 0,
+            'failed': 0,
+            'errors': [],
+        }
+
+    def _error(self, row: Dict, message: str):
+        self.state['failed'] += 1
+        if len(self.state['errors']) < MAX_IMPORT_ERRORS:
+            self.state['errors'].append({
+                'row': row.get('row'),
+                'student_code': row.get('student_code'),
+                'error': message
+            })
+
+    def _report(self):
+        if self.progress is not None:
+            self.progress(self.state)
+
+    @staticmethod
+    def _existing(query: str, values: Sequence) -> set:
+        """Chạy SELECT một cột với IN (...); lỗi database được raise (không coi là 'không có')"""
+        if not values:
+            return set()
+        placeholders = ', '.join(['%s'] * len(values))
+        with db.transaction() as cursor:
+            cursor.execute(query.format(placeholders=placeholders), tuple(values))
+            return {next(iter(row.values())) for row in cursor.fetchall()}
+
+    @classmethod
+    def existing_codes(cls, codes: Sequence[str]) -> set:
+        """Các student_code đã có trong DB"""
+        return cls._existing("SELECT student_code FROM students WHERE student_code IN ({placeholders})", codes)
+
+    @classmethod
+    def existing_classes(cls, class_ids: Sequence[int]) -> set:
+        """Các class_id có trong bảng classes"""
+        return cls._existing("SELECT class_id FROM classes WHERE class_id IN ({placeholders})", class_ids)
+
+    def _photo_path(self, row: Dict) -> Optional[str]:
+        if not self.image_dir:
+            return None
+        ext = os.path.splitext(row['photo'])[1].lower() or '.jpg'
+        path = os.path.join(self.image_dir, f"{row['student_code']}{ext}")
+        # Chặn ghi ra ngoài thư mục ảnh kể cả khi dòng không đi qua parse_roster
+        root = os.path.realpath(self.image_dir)
+        if os.path.dirname(os.path.realpath(path)) != root:
+            raise ValueError(f"student_code không dùng được làm tên file: {row['student_code']}")
+        return path
+
+    @staticmethod
+    def _remove_photos(rows: List[Dict]):
+        """Xoá ảnh đã lưu của các học sinh không được ghi vào DB"""
+        for row in rows:
+            if row.get('avatar_url'):
+                try:
+                    os.remove(row['avatar_url'])
+                except OSError:
+                    pass
+
+    def _write_chunk(self, ready: List[Dict]):
+        """Ghi học sinh + embedding của một chunk trong một transaction"""
+        with db.transaction() as cursor:
+            insert_rows(cursor, 'students', STUDENT_INSERT_COLUMNS, student_rows(ready))
+            # Lấy lại id theo student_code (id tự tăng của một lệnh nhiều dòng không chắc liên tiếp)
+            codes = [r['student_code'] for r in ready]
+            placeholders = ', '.join(['%s'] * len(codes))
+            cursor.execute(
+                f"SELECT student_id, student_code FROM students WHERE student_code IN ({placeholders})",
+                tuple(codes)
+            )
+            ids = {row['student_code']: row['student_id'] for row in cursor.fetchall()}
+            embeddings = [
+                {'student_id': ids[r['student_code']], 'embedding': r['embedding'], 'image_url': r['avatar_url']}
+                for r in ready
+            ]
+            insert_rows(cursor, 'face_embeddings', EMBEDDING_INSERT_COLUMNS, embedding_rows(embeddings, self.dtype))
+
+    def _import_chunk(self, chunk: List[Dict]):
+        existing = self.existing_codes([r['student_code'] for r in chunk])
+        todo = []
+        for row in chunk:
+            if row['student_code'] in existing:
+                self.state['skipped'] += 1
+                continue
+            content = self.photos.read(row['photo'])
+            if content is None:
+                self._error(row, f"không tìm thấy ảnh {row['photo']}")
+                continue
+            todo.append((row, content))
+
+        ready = []
+        if todo:
+            for (row, content), (embedding, error) in zip(todo, self.embedder([c for _, c in todo])):
+                if embedding is None:
+                    self._error(row, error)
+                    continue
+                try:
+                    avatar_url = self._photo_path(row)
+                except ValueError as e:
+                    self._error(row, str(e))
+                    continue
+                row = dict(row, embedding=np.asarray(embedding, dtype=np.float32), avatar_url=avatar_url)
+                if row['avatar_url'] and len(row['avatar_url']) > FIELD_MAX_LENGTHS['avatar_url']:
+                    self._error(row, f"đường dẫn ảnh dài quá {FIELD_MAX_LENGTHS['avatar_url']} ký tự")
+                    continue
+                try:
+                    if row['avatar_url']:
+                        with open(row['avatar_url'], 'wb') as f:
+                            f.write(content)
+                except OSError as e:
+                    self._error(row, f"không lưu được ảnh: {e}")
+                    continue
+                ready.append(row)
+
+        if ready:
+            try:
+                self._write_chunk(ready)
+                self.state['inserted'] += len(ready)
+            except (IntegrityError, DataError):
+                # Chunk đã rollback vì dữ liệu của một dòng: ghi lại từng dòng để chỉ dòng đó bị báo lỗi
+                for row in ready:
+                    try:
+                        self._write_chunk([row])
+                        self.state['inserted'] += 1
+                    except Exception as e:
+                        self._remove_photos([row])
+                        self._error(row, f"lỗi ghi database: {e}")
+            except Exception as e:
+                # Lỗi kết nối...: cả chunk rollback, ghi lỗi cho từng dòng để chạy lại sau
+                self._remove_photos(ready)
+                for row in ready:
+                    self._error(row, f"lỗi ghi database: {e}")
+        self.state['processed'] += len(chunk)
+
+    def run(self, rows: List[Dict], errors: List[Dict] = None) -> Dict:
+        """Nhập toàn bộ các dòng (đã qua parse_roster), trả về trạng thái cuối"""
+        self.state['status'] = 'running'
+        self.state['total'] = len(rows) + len(errors or [])
+        for error in errors or []:
+            self._error(error, error['error'])
+            self.state['processed'] += 1
+        started = time.monotonic()
+        self._report()
+        try:
+            # Dòng có class_id không tồn tại bị loại trước khi embedding (tránh lỗi khoá ngoại cả chunk)
+            classes = self.existing_classes(sorted({row['class_id'] for row in rows}))
+            valid = []
+            for row in rows:
+                if row['class_id'] in classes:
+                    valid.append(row)
+                else:
+                    self._error(row, f"không có lớp class_id={row['class_id']}")
+                    self.state['processed'] += 1
+            rows = valid
+            for start in range(0, len(rows), self.chunk_size):
+                self._import_chunk(rows[start:start + self.chunk_size])
+                self.state['elapsed_s'] = round(time.monotonic() - started, 2)
+                self._report()
+            self.state['status'] = 'done'
+        except Exception as e:
+            self.state['status'] = 'error'
+            self.state['error'] = str(e)
+        self._report()
+        return self.state
+
+
+class ImportJobs:
+    """Chạy các lần nhập trong nền (một lần một job) và giữ trạng thái để tra cứu tiến độ"""
+
+    def __init__(self, max_jobs: int = 50):
+        self.max_jobs = max_jobs
+        self._jobs: Dict[str, Dict] = {}
+        self._executor = ThreadPoolExecutor(max_workers=1)
+
+    def submit(self, importer: StudentImporter, rows: List[Dict], errors: List[Dict],
+               cleanup: Callable = None) -> str:
+        job_id = uuid.uuid4().hex
+        # Bỏ các job đã xong cũ nhất khi quá nhiều; job đang chờ/chạy luôn được giữ để tra cứu
+        finished = [key for key, state in self._jobs.items() if state['status'] in ('done', 'error')]
+        for key in finished[:max(0, len(self._jobs) - self.max_jobs + 1)]:
+            self._jobs.pop(key)
+        self._jobs[job_id] = importer.state
+
+        def run():
+            try:
+                importer.run(rows, errors)
+            finally:
+                if cleanup is not None:
+                    cleanup()
+
+        self._executor.submit(run)
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        return self._jobs.get(job_id)
@@ -1,121 +1,205 @@
 from service.db_connection import db
+from service.async_db_connection import async_db
+from service.pagination import parse_fields, decode_cursor, clamp_limit, build_select, build_page
+from service.bulk import DEFAULT_CHUNK_SIZE
+from service.queries import like_params, update_query
 from typing import List, Dict, Optional
 from datetime import date
 
+# Các trường cho phép chọn qua fields= khi phân trang: (biểu thức SQL, bảng cần JOIN)
+STUDENT_PAGE_FIELDS = {
+    'student_id': ('s.student_id', None),
+    'full_name': ('s.full_name', None),
+    'date_of_birth': ('s.date_of_birth', None),
+    'gender': ('s.gender', None),
+    'student_code': ('s.student_code', None),
+    'class_id': ('s.class_id', None),
+    'avatar_url': ('s.avatar_url', None),
+    'class_name': ('c.class_name', 'classes'),
+}
+
+STUDENT_PAGE_DEFAULT_FIELDS = (
+    'student_id', 'full_name', 'date_of_birth', 'gender', 'student_code', 'class_id', 'avatar_url'
+)
+
+STUDENT_INSERT_COLUMNS = ('full_name', 'date_of_birth', 'gender', 'student_code', 'class_id', 'avatar_url')
+
+# Câu query dùng chung cho StudentsRepository và AsyncStudentsRepository
+STUDENT_COLUMNS = """
+        student_id,
+        full_name,
+        date_of_birth,
+        gender,
+        student_code,
+        class_id,
+        avatar_url
+"""
+
+ALL_STUDENTS_QUERY = f"""
+    SELECT {STUDENT_COLUMNS}
+    FROM students
+    ORDER BY full_name
+"""
+
+STUDENT_BY_ID_QUERY = f"""
+    SELECT {STUDENT_COLUMNS}
+    FROM students
+    WHERE student_id = %s
+"""
+
+STUDENT_BY_CODE_QUERY = f"""
+    SELECT {STUDENT_COLUMNS}
+    FROM students
+    WHERE student_code = %s
+"""
+
+STUDENTS_BY_GENDER_QUERY = f"""
+    SELECT {STUDENT_COLUMNS}
+    FROM students
+    WHERE gender = %s
+    ORDER BY full_name
+"""
+
+STUDENTS_BY_CLASS_QUERY = """
+    SELECT 
+        s.student_id,
+        s.full_name,
+        s.date_of_birth,
+        s.gender,
+        s.student_code,
+        s.class_id,
+        s.avatar_url,
+        c.class_name
+    FROM students s
+    JOIN classes c ON s.class_id = c.class_id
+    WHERE s.class_id = %s
+    ORDER BY s.full_name
+"""
+
+SEARCH_STUDENTS_QUERY = """
+    SELECT 
+        s.student_id,
+        s.full_name,
+        s.date_of_birth,
+        s.gender,
+        s.student_code,
+        s.class_id,
+        s.avatar_url,
+        c.class_name
+    FROM students s
+    LEFT JOIN classes c ON s.class_id = c.class_id
+    WHERE s.full_name LIKE %s OR s.student_code LIKE %s
+    ORDER BY s.full_name
+"""
+
+CREATE_STUDENT_QUERY = """
+    INSERT INTO students 
+    (full_name, date_of_birth, gender, student_code, class_id, avatar_url)
+    VALUES (%s, %s, %s, %s, %s, %s)
+"""
+
+DELETE_STUDENT_QUERY = "DELETE FROM students WHERE student_id = %s"
+
+STUDENT_COUNT_BY_CLASS_QUERY = """
+    SELECT 
+        c.class_id,
+        c.class_name,
+        COUNT(s.student_id) as student_count
+    FROM classes c
+    LEFT JOIN students s ON c.class_id = s.class_id
+    GROUP BY c.class_id, c.class_name
+    ORDER BY c.class_name
+"""
+
+
+def student_rows(students: List[Dict]) -> List[tuple]:
+    """Tham số INSERT theo STUDENT_INSERT_COLUMNS; thiếu trường tuỳ chọn thì để NULL"""
+    return [
+        (s['full_name'], s.get('date_of_birth'), s.get('gender'), s.get('student_code'),
+         s['class_id'], s.get('avatar_url'))
+        for s in students
+    ]
+
+def build_students_page_query(limit: int, cursor: str = None, fields=None):
+    """Dựng query keyset theo student_id tăng dần"""
+    fields = parse_fields(fields, STUDENT_PAGE_FIELDS, STUDENT_PAGE_DEFAULT_FIELDS)
+    key_fields = ('student_id',)
+    columns, joins = build_select(fields, key_fields, STUDENT_PAGE_FIELDS)
+    join_sql = "LEFT JOIN classes c ON s.class_id = c.class_id" if 'classes' in joins else ""
+
+    where = ""
+    params = []
+    if cursor:
+        (last_id,) = decode_cursor(cursor, 1)
+        where = "WHERE s.student_id > %s"
+        params = [last_id]
+    params.append(limit + 1)
+
+    query = f"""
+        SELECT 
+            {columns}
+        FROM students s
+        {join_sql}
+        {where}
+        ORDER BY s.student_id
+        LIMIT %s
+    """
+    return query, tuple(params), fields, key_fields
+
+def update_student_query(student_id: int, full_name: str = None, date_of_birth: date = None,
+                         gender: str = None, student_code: str = None, class_id: int = None,
+                         avatar_url: str = None):
+    """Câu UPDATE cho các trường được truyền, None nếu không có gì để cập nhật"""
+    return update_query('students', 'student_id', student_id, {
+        'full_name': full_name,
+        'date_of_birth': date_of_birth,
+        'gender': gender,
+        'student_code': student_code,
+        'class_id': class_id,
+        'avatar_url': avatar_url,
+    })
+
 class StudentsRepository:
     """Repository để trích xuất và quản lý dữ liệu học sinh"""
     
     @staticmethod
     def get_all_students() -> List[Dict]:
         """Lấy tất cả học sinh"""
-        query = """
-            SELECT 
-                student_id,
-                full_name,
-                date_of_birth,
-                gender,
-                student_code,
-                class_id,
-                avatar_url
-            FROM students
-            ORDER BY full_name
-        """
-        return db.execute_query(query)
+        return db.execute_query(ALL_STUDENTS_QUERY)
+    
+    @staticmethod
+    def get_students_page(limit: int = None, cursor: str = None, fields=None) -> Dict:
+        """Lấy học sinh theo trang (keyset), trả về {'items', 'next_cursor'}"""
+        limit = clamp_limit(limit)
+        query, params, fields, key_fields = build_students_page_query(limit, cursor, fields)
+        return build_page(db.execute_query(query, params), limit, key_fields, fields)
     
     @staticmethod
     def get_student_by_id(student_id: int) -> Optional[Dict]:
         """Lấy học sinh theo ID"""
-        query = """
-            SELECT 
-                student_id,
-                full_name,
-                date_of_birth,
-                gender,
-                student_code,
-                class_id,
-                avatar_url
-            FROM students
-            WHERE student_id = %s
-        """
-        results = db.execute_query(query, (student_id,))
+        results = db.execute_query(STUDENT_BY_ID_QUERY, (student_id,))
         return results[0] if results else None
     
     @staticmethod
     def get_students_by_class(class_id: int) -> List[Dict]:
         """Lấy tất cả học sinh trong một lớp"""
-        query = """
-            SELECT 
-                s.student_id,
-                s.full_name,
-                s.date_of_birth,
-                s.gender,
-                s.student_code,
-                s.class_id,
-                s.avatar_url,
-                c.class_name
-            FROM students s
-            JOIN classes c ON s.class_id = c.class_id
-            WHERE s.class_id = %s
-            ORDER BY s.full_name
-        """
-        return db.execute_query(query, (class_id,))
+        return db.execute_query(STUDENTS_BY_CLASS_QUERY, (class_id,))
     
     @staticmethod
     def get_student_by_code(student_code: str) -> Optional[Dict]:
         """Lấy học sinh theo mã học sinh"""
-        query = """
-            SELECT 
-                student_id,
-                full_name,
-                date_of_birth,
-                gender,
-                student_code,
-                class_id,
-                avatar_url
-            FROM students
-            WHERE student_code = %s
-        """
-        results = db.execute_query(query, (student_code,))
+        results = db.execute_query(STUDENT_BY_CODE_QUERY, (student_code,))
         return results[0] if results else None
     
     @staticmethod
     def search_students(keyword: str) -> List[Dict]:
         """Tìm kiếm học sinh theo tên hoặc mã học sinh"""
-        query = """
-            SELECT 
-                s.student_id,
-                s.full_name,
-                s.date_of_birth,
-                s.gender,
-                s.student_code,
-                s.class_id,
-                s.avatar_url,
-                c.class_name
-            FROM students s
-            LEFT JOIN classes c ON s.class_id = c.class_id
-            WHERE s.full_name LIKE %s OR s.student_code LIKE %s
-            ORDER BY s.full_name
-        """
-        search_pattern = f"%{keyword}%"
-        return db.execute_query(query, (search_pattern, search_pattern))
+        return db.execute_query(SEARCH_STUDENTS_QUERY, like_params(keyword))
     
     @staticmethod
     def get_students_by_gender(gender: str) -> List[Dict]:
         """Lấy học sinh theo giới tính"""
-        query = """
-            SELECT 
-                student_id,
-                full_name,
-                date_of_birth,
-                gender,
-                student_code,
-                class_id,
-                avatar_url
-            FROM students
-            WHERE gender = %s
-            ORDER BY full_name
-        """
-        return db.execute_query(query, (gender,))
+        return db.execute_query(STUDENTS_BY_GENDER_QUERY, (gender,))
     
     @staticmethod
     def create_student(
@@ -127,15 +211,15 @@ class StudentsRepository:
         avatar_url: str = None
     ) -> int:
         """Tạo học sinh mới"""
-        query = """
-            INSERT INTO students 
-            (full_name, date_of_birth, gender, student_code, class_id, avatar_url)
-            VALUES (%s, %s, %s, %s, %s, %s)
-        """
         params = (full_name, date_of_birth, gender, student_code, class_id, avatar_url)
-        _, last_id = db.execute_update(query, params)
+        _, last_id = db.execute_update(CREATE_STUDENT_QUERY, params)
         return last_id
     
+    @staticmethod
+    def create_many(students: List[Dict], chunk_size: int = DEFAULT_CHUNK_SIZE) -> int:
+        """Tạo nhiều học sinh bằng INSERT nhiều dòng (một transaction); trả về số dòng đã thêm"""
+        return db.insert_many('students', STUDENT_INSERT_COLUMNS, student_rows(students), chunk_size)
+    
     @staticmethod
     def update_student(
         student_id: int,
@@ -147,55 +231,110 @@ class StudentsRepository:
         avatar_url: str = None
     ) -> bool:
         """Cập nhật thông tin học sinh"""
-        updates = []
-        params = []
-        
-        if full_name:
-            updates.append("full_name = %s")
-            params.append(full_name)
-        if date_of_birth:
-            updates.append("date_of_birth = %s")
-            params.append(date_of_birth)
-        if gender:
-            updates.append("gender = %s")
-            params.append(gender)
-        if student_code:
-            updates.append("student_code = %s")
-            params.append(student_code)
-        if class_id:
-            updates.append("class_id = %s")
-            params.append(class_id)
-        if avatar_url:
-            updates.append("avatar_url = %s")
-            params.append(avatar_url)
-        
-        if not updates:
+        update = update_student_query(student_id, full_name, date_of_birth, gender,
+                                      student_code, class_id, avatar_url)
+        if update is None:
             return False
-        
-        params.append(student_id)
-        query = f"UPDATE students SET {', '.join(updates)} WHERE student_id = %s"
-        affected_rows, _ = db.execute_update(query, tuple(params))
+        affected_rows, _ = db.execute_update(*update)
         return affected_rows > 0
     
     @staticmethod
     def delete_student(student_id: int) -> bool:
         """Xóa học sinh"""
-        query = "DELETE FROM students WHERE student_id = %s"
-        affected_rows, _ = db.execute_update(query, (student_id,))
+        affected_rows, _ = db.execute_update(DELETE_STUDENT_QUERY, (student_id,))
         return affected_rows > 0
     
     @staticmethod
     def get_student_count_by_class() -> List[Dict]:
         """Đếm số học sinh theo từng lớp"""
-        query = """
-            SELECT 
-                c.class_id,
-                c.class_name,
-                COUNT(s.student_id) as student_count
-            FROM classes c
-            LEFT JOIN students s ON c.class_id = s.class_id
-            GROUP BY c.class_id, c.class_name
-            ORDER BY c.class_name
-        """
-        return db.execute_query(query)
+        return db.execute_query(STUDENT_COUNT_BY_CLASS_QUERY)
 
+class AsyncStudentsRepository:
+    """Repository để trích xuất và quản lý dữ liệu học sinh (bất đồng bộ, dùng cho các endpoint async)"""
+    
+    @staticmethod
+    async def get_all_students() -> List[Dict]:
+        """Lấy tất cả học sinh"""
+        return await async_db.execute_query(ALL_STUDENTS_QUERY)
+    
+    @staticmethod
+    async def get_students_page(limit: int = None, cursor: str = None, fields=None) -> Dict:
+        """Lấy học sinh theo trang (keyset), trả về {'items', 'next_cursor'}"""
+        limit = clamp_limit(limit)
+        query, params, fields, key_fields = build_students_page_query(limit, cursor, fields)
+        return build_page(await async_db.execute_query(query, params), limit, key_fields, fields)
+    
+    @staticmethod
+    async def get_student_by_id(student_id: int) -> Optional[Dict]:
+        """Lấy học sinh theo ID"""
+        results = await async_db.execute_query(STUDENT_BY_ID_QUERY, (student_id,))
+        return results[0] if results else None
+    
+    @staticmethod
+    async def get_students_by_class(class_id: int) -> List[Dict]:
+        """Lấy tất cả học sinh trong một lớp"""
+        return await async_db.execute_query(STUDENTS_BY_CLASS_QUERY, (class_id,))
+    
+    @staticmethod
+    async def get_student_by_code(student_code: str) -> Optional[Dict]:
+        """Lấy học sinh theo mã học sinh"""
+        results = await async_db.execute_query(STUDENT_BY_CODE_QUERY, (student_code,))
+        return results[0] if results else None
+    
+    @staticmethod
+    async def search_students(keyword: str) -> List[Dict]:
+        """Tìm kiếm học sinh theo tên hoặc mã học sinh"""
+        return await async_db.execute_query(SEARCH_STUDENTS_QUERY, like_params(keyword))
+    
+    @staticmethod
+    async def get_students_by_gender(gender: str) -> List[Dict]:
+        """Lấy học sinh theo giới tính"""
+        return await async_db.execute_query(STUDENTS_BY_GENDER_QUERY, (gender,))
+    
+    @staticmethod
+    async def create_student(
+        full_name: str,
+        class_id: int,
+        student_code: str = None,
+        date_of_birth: date = None,
+        gender: str = None,
+        avatar_url: str = None
+    ) -> int:
+        """Tạo học sinh mới"""
+        params = (full_name, date_of_birth, gender, student_code, class_id, avatar_url)
+        _, last_id = await async_db.execute_update(CREATE_STUDENT_QUERY, params)
+        return last_id
+    
+    @staticmethod
+    async def create_many(students: List[Dict], chunk_size: int = DEFAULT_CHUNK_SIZE) -> int:
+        """Tạo nhiều học sinh bằng INSERT nhiều dòng (một transaction); trả về số dòng đã thêm"""
+        return await async_db.insert_many('students', STUDENT_INSERT_COLUMNS, student_rows(students), chunk_size)
+    
+    @staticmethod
+    async def update_student(
+        student_id: int,
+        full_name: str = None,
+        date_of_birth: date = None,
+        gender: str = None,
+        student_code: str = None,
+        class_id: int = None,
+        avatar_url: str = None
+    ) -> bool:
+        """Cập nhật thông tin học sinh"""
+        update = update_student_query(student_id, full_name, date_of_birth, gender,
+                                      student_code, class_id, avatar_url)
+        if update is None:
+            return False
+        affected_rows, _ = await async_db.execute_update(*update)
+        return affected_rows > 0
+    
+    @staticmethod
+    async def delete_student(student_id: int) -> bool:
+        """Xóa học sinh"""
+        affected_rows, _ = await async_db.execute_update(DELETE_STUDENT_QUERY, (student_id,))
+        return affected_rows > 0
+    
+    @staticmethod
+    async def get_student_count_by_class() -> List[Dict]:
+        """Đếm số học sinh theo từng lớp"""
+        return await async_db.execute_query(STUDENT_COUNT_BY_CLASS_QUERY)
@@ -1,84 +1,116 @@
 from service.db_connection import db
+from service.async_db_connection import async_db
+from service.classes import CLASSES_BY_TEACHER_QUERY
+from service.queries import like_params, update_query
 from typing import List, Dict, Optional
 
+# Câu query dùng chung cho TeachersRepository và AsyncTeachersRepository
+ALL_TEACHERS_QUERY = """
+    SELECT 
+        teacher_id,
+        full_name,
+        email,
+        phone
+    FROM teachers
+    ORDER BY full_name
+"""
+
+TEACHER_BY_ID_QUERY = """
+    SELECT 
+        teacher_id,
+        full_name,
+        email,
+        phone
+    FROM teachers
+    WHERE teacher_id = %s
+"""
+
+TEACHER_BY_EMAIL_QUERY = """
+    SELECT 
+        teacher_id,
+        full_name,
+        email,
+        phone
+    FROM teachers
+    WHERE email = %s
+"""
+
+SEARCH_TEACHERS_QUERY = """
+    SELECT 
+        teacher_id,
+        full_name,
+        email,
+        phone
+    FROM teachers
+    WHERE full_name LIKE %s OR email LIKE %s
+    ORDER BY full_name
+"""
+
+CREATE_TEACHER_QUERY = """
+    INSERT INTO teachers (full_name, email, phone)
+    VALUES (%s, %s, %s)
+"""
+
+DELETE_TEACHER_QUERY = "DELETE FROM teachers WHERE teacher_id = %s"
+
+TEACHER_STATISTICS_QUERY = """
+    SELECT 
+        t.teacher_id,
+        t.full_name,
+        COUNT(DISTINCT c.class_id) as total_classes,
+        COUNT(DISTINCT s.student_id) as total_students
+    FROM teachers t
+    LEFT JOIN classes c ON t.teacher_id = c.teacher_id
+    LEFT JOIN students s ON c.class_id = s.class_id
+    WHERE t.teacher_id = %s
+    GROUP BY t.teacher_id, t.full_name
+"""
+
+def update_teacher_query(teacher_id: int, full_name: str = None, email: str = None, phone: str = None):
+    """Câu UPDATE cho các trường được truyền, None nếu không có gì để cập nhật"""
+    return update_query('teachers', 'teacher_id', teacher_id, {
+        'full_name': full_name,
+        'email': email,
+        'phone': phone,
+    })
+
+def teacher_statistics(teacher_id: int, results: List[Dict]) -> Dict:
+    """Dòng thống kê giáo viên, hoặc số 0 nếu giáo viên không tồn tại"""
+    return results[0] if results else {
+        'teacher_id': teacher_id,
+        'total_classes': 0,
+        'total_students': 0
+    }
+
 class TeachersRepository:
     """Repository để trích xuất và quản lý dữ liệu giáo viên"""
     
     @staticmethod
     def get_all_teachers() -> List[Dict]:
         """Lấy tất cả giáo viên"""
-        query = """
-            SELECT 
-                teacher_id,
-                full_name,
-                email,
-                phone
-            FROM teachers
-            ORDER BY full_name
-        """
-        return db.execute_query(query)
+        return db.execute_query(ALL_TEACHERS_QUERY)
     
     @staticmethod
     def get_teacher_by_id(teacher_id: int) -> Optional[Dict]:
         """Lấy giáo viên theo ID"""
-        query = """
-            SELECT 
-                teacher_id,
-                full_name,
-                email,
-                phone
-            FROM teachers
-            WHERE teacher_id = %s
-        """
-        results = db.execute_query(query, (teacher_id,))
+        results = db.execute_query(TEACHER_BY_ID_QUERY, (teacher_id,))
         return results[0] if results else None
     
     @staticmethod
     def get_teacher_by_email(email: str) -> Optional[Dict]:
         """Lấy giáo viên theo email"""
-        query = """
-            SELECT 
-                teacher_id,
-                full_name,
-                email,
-                phone
-            FROM teachers
-            WHERE email = %s
-        """
-        results = db.execute_query(query, (email,))
+        results = db.execute_query(TEACHER_BY_EMAIL_QUERY, (email,))
         return results[0] if results else None
     
     @staticmethod
     def search_teachers(keyword: str) -> List[Dict]:
         """Tìm kiếm giáo viên theo tên hoặc email"""
-        query = """
-            SELECT 
-                teacher_id,
-                full_name,
-                email,
-                phone
-            FROM teachers
-            WHERE full_name LIKE %s OR email LIKE %s
-            ORDER BY full_name
-        """
-        search_pattern = f"%{keyword}%"
-        return db.execute_query(query, (search_pattern, search_pattern))
+        return db.execute_query(SEARCH_TEACHERS_QUERY, like_params(keyword))
     
     @staticmethod
     def get_teacher_classes(teacher_id: int) -> List[Dict]:
         """Lấy tất cả lớp học của một giáo viên"""
-        query = """
-            SELECT 
-                c.class_id,
-                c.class_name,
-                c.teacher_id,
-                t.full_name as teacher_name
-            FROM classes c
-            JOIN teachers t ON c.teacher_id = t.teacher_id
-            WHERE c.teacher_id = %s
-            ORDER BY c.class_name
-        """
-        return db.execute_query(query, (teacher_id,))
+        return db.execute_query(CLASSES_BY_TEACHER_QUERY, (teacher_id,))
     
     @staticmethod
     def create_teacher(
@@ -87,12 +119,7 @@ class TeachersRepository:
         phone: str = None
     ) -> int:
         """Tạo giáo viên mới"""
-        query = """
-            INSERT INTO teachers (full_name, email, phone)
-            VALUES (%s, %s, %s)
-        """
-        params = (full_name, email, phone)
-        _, last_id = db.execute_update(query, params)
+        _, last_id = db.execute_update(CREATE_TEACHER_QUERY, (full_name, email, phone))
         return last_id
     
     @staticmethod
@@ -103,53 +130,84 @@ class TeachersRepository:
         phone: str = None
     ) -> bool:
         """Cập nhật thông tin giáo viên"""
-        updates = []
-        params = []
-        
-        if full_name:
-            updates.append("full_name = %s")
-            params.append(full_name)
-        if email:
-            updates.append("email = %s")
-            params.append(email)
-        if phone:
-            updates.append("phone = %s")
-            params.append(phone)
-        
-        if not updates:
+        update = update_teacher_query(teacher_id, full_name, email, phone)
+        if update is None:
             return False
-        
-        params.append(teacher_id)
-        query = f"UPDATE teachers SET {', '.join(updates)} WHERE teacher_id = %s"
-        affected_rows, _ = db.execute_update(query, tuple(params))
+        affected_rows, _ = db.execute_update(*update)
         return affected_rows > 0
     
     @staticmethod
     def delete_teacher(teacher_id: int) -> bool:
         """Xóa giáo viên"""
-        query = "DELETE FROM teachers WHERE teacher_id = %s"
-        affected_rows, _ = db.execute_update(query, (teacher_id,))
+        affected_rows, _ = db.execute_update(DELETE_TEACHER_QUERY, (teacher_id,))
         return affected_rows > 0
     
     @staticmethod
     def get_teacher_statistics(teacher_id: int) -> Dict:
         """Lấy thống kê của giáo viên (số lớp, số học sinh)"""
-        query = """
-            SELECT 
-                t.teacher_id,
-                t.full_name,
-                COUNT(DISTINCT c.class_id) as total_classes,
-                COUNT(DISTINCT s.student_id) as total_students
-            FROM teachers t
-            LEFT JOIN classes c ON t.teacher_id = c.teacher_id
-            LEFT JOIN students s ON c.class_id = s.class_id
-            WHERE t.teacher_id = %s
-            GROUP BY t.teacher_id, t.full_name
-        """
-        results = db.execute_query(query, (teacher_id,))
-        return results[0] if results else {
-            'teacher_id': teacher_id,
-            'total_classes': 0,
-            'total_students': 0
-        }
+        return teacher_statistics(teacher_id, db.execute_query(TEACHER_STATISTICS_QUERY, (teacher_id,)))
 
+class AsyncTeachersRepository:
+    """Repository để trích xuất và quản lý dữ liệu giáo viên (bất đồng bộ, dùng cho các endpoint async)"""
+    
+    @staticmethod
+    async def get_all_teachers() -> List[Dict]:
+        """Lấy tất cả giáo viên"""
+        return await async_db.execute_query(ALL_TEACHERS_QUERY)
+    
+    @staticmethod
+    async def get_teacher_by_id(teacher_id: int) -> Optional[Dict]:
+        """Lấy giáo viên theo ID"""
+        results = await async_db.execute_query(TEACHER_BY_ID_QUERY, (teacher_id,))
+        return results[0] if results else None
+    
+    @staticmethod
+    async def get_teacher_by_email(email: str) -> Optional[Dict]:
+        """Lấy giáo viên theo email"""
+        results = await async_db.execute_query(TEACHER_BY_EMAIL_QUERY, (email,))
+        return results[0] if results else None
+    
+    @staticmethod
+    async def search_teachers(keyword: str) -> List[Dict]:
+        """Tìm kiếm giáo viên theo tên hoặc email"""
+        return await async_db.execute_query(SEARCH_TEACHERS_QUERY, like_params(keyword))
+    
+    @staticmethod
+    async def get_teacher_classes(teacher_id: int) -> List[Dict]:
+        """Lấy tất cả lớp học của một giáo viên"""
+        return await async_db.execute_query(CLASSES_BY_TEACHER_QUERY, (teacher_id,))
+    
+    @staticmethod
+    async def create_teacher(
+        full_name: str,
+        email: str = None,
+        phone: str = None
+    ) -> int:
+        """Tạo giáo viên mới"""
+        _, last_id = await async_db.execute_update(CREATE_TEACHER_QUERY, (full_name, email, phone))
+        return last_id
+    
+    @staticmethod
+    async def update_teacher(
+        teacher_id: int,
+        full_name: str = None,
+        email: str = None,
+        phone: str = None
+    ) -> bool:
+        """Cập nhật thông tin giáo viên"""
+        update = update_teacher_query(teacher_id, full_name, email, phone)
+        if update is None:
+            return False
+        affected_rows, _ = await async_db.execute_update(*update)
+        return affected_rows > 0
+    
+    @staticmethod
+    async def delete_teacher(teacher_id: int) -> bool:
+        """Xóa giáo viên"""
+        affected_rows, _ = await async_db.execute_update(DELETE_TEACHER_QUERY, (teacher_id,))
+        return affected_rows > 0
+    
+    @staticmethod
+    async def get_teacher_statistics(teacher_id: int) -> Dict:
+        """Lấy thống kê của giáo viên (số lớp, số học sinh)"""
+        return teacher_statistics(teacher_id, await async_db.execute_query(TEACHER_STATISTICS_QUERY, (teacher_id,)))
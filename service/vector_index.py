@@ -0,0 +1,386 @@
+import threading
+import time
+import numpy as np
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from service.gallery import normalize_rows
+from service.face_embeddings import FaceEmbeddingsRepository
+
+# Số vector tối thiểu mỗi cụm để k-means của IVF ổn định (cùng ngưỡng cảnh báo của FAISS)
+MIN_POINTS_PER_CENTROID = 39
+
+
+def dedupe_ids(ids: Sequence[int], vectors: np.ndarray) -> Tuple[List[int], np.ndarray]:
+    """Bỏ id lặp trong một batch, giữ lần xuất hiện cuối cùng"""
+    ids = list(ids)
+    last = {item_id: i for i, item_id in enumerate(ids)}
+    if len(last) == len(ids):
+        return ids, vectors
+    keep = sorted(last.values())
+    return [ids[i] for i in keep], vectors[keep]
+
+
+class FlatIndex:
+    """Index chính xác: quét toàn bộ bằng một phép nhân ma trận (cosine trên vector đã chuẩn hoá)"""
+
+    def __init__(self, dim: int = 512):
+        self.dim = dim
+        self._vectors = np.empty((0, dim), dtype=np.float32)
+        self._ids: List[int] = []
+        self._positions: Dict[int, int] = {}
+
+    def __len__(self):
+        return len(self._ids)
+
+    def add(self, ids: Sequence[int], vectors):
+        """Thêm hoặc thay thế vector theo id (id lặp trong batch: lần cuối được giữ)"""
+        vectors = normalize_rows(np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim))
+        ids, vectors = dedupe_ids(ids, vectors)
+        new_rows = []
+        for item_id, vector in zip(ids, vectors):
+            pos = self._positions.get(item_id)
+            if pos is not None:
+                self._vectors[pos] = vector
+            else:
+                self._positions[item_id] = len(self._ids) + len(new_rows)
+                new_rows.append((item_id, vector))
+        if new_rows:
+            self._ids.extend(item_id for item_id, _ in new_rows)
+            self._vectors = np.vstack([self._vectors, np.stack([v for _, v in new_rows])])
+
+    def remove(self, ids: Sequence[int]):
+        """Xoá vector theo id (đổi chỗ với phần tử cuối để không phải dịch mảng)"""
+        for item_id in ids:
+            pos = self._positions.pop(item_id, None)
+            if pos is None:
+                continue
+            last = len(self._ids) - 1
+            if pos != last:
+                self._vectors[pos] = self._vectors[last]
+                self._ids[pos] = self._ids[last]
+                self._positions[self._ids[pos]] = pos
+            self._ids.pop()
+            self._vectors = self._vectors[:last]
+
+    def items(self) -> Tuple[List[int], np.ndarray]:
+        """(ids, vectors) đang có trong index"""
+        return list(self._ids), self._vectors.copy()
+
+    def search(self, queries, k: int = 5) -> Tuple[np.ndarray, np.ndarray]:
+        """Top-k cho từng query: trả về (ids, scores) dạng (số query, k); id -1 nếu không đủ k"""
+        queries = normalize_rows(np.asarray(queries, dtype=np.float32).reshape(-1, self.dim))
+        ids = np.full((len(queries), k), -1, dtype=np.int64)
+        scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        if not self._ids:
+            return ids, scores
+
+        sims = queries @ self._vectors.T
+        kk = min(k, sims.shape[1])
+        top = np.argpartition(-sims, kk - 1, axis=1)[:, :kk]
+        top_scores = np.take_along_axis(sims, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        top = np.take_along_axis(top, order, axis=1)
+
+        id_array = np.asarray(self._ids, dtype=np.int64)
+        ids[:, :kk] = id_array[top]
+        scores[:, :kk] = np.take_along_axis(top_scores, order, axis=1)
+        return ids, scores
+
+
+class IVFIndex:
+    """Index IVF-Flat thuần NumPy: chia vector vào nlist cụm (k-means), khi tìm chỉ quét nprobe cụm gần nhất
+
+    Chưa train thì vector được giữ trong một FlatIndex (tìm chính xác); khi đủ
+    nlist * MIN_POINTS_PER_CENTROID vector, index tự train trên toàn bộ dữ liệu đang có.
+    Sau đó index train lại khi số vector tăng gấp retrain_factor lần so với lúc train,
+    để tâm cụm không bị cố định theo một mẫu nhỏ ban đầu. Có thể gọi train() trước trên
+    một mẫu đại diện.
+    """
+
+    def __init__(self, dim: int = 512, nlist: int = 256, nprobe: int = 16, train_iters: int = 10,
+                 retrain_factor: float = 2.0):
+        self.dim = dim
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.train_iters = train_iters
+        self.retrain_factor = retrain_factor
+        self.centroids = None
+        self.trained_size = 0
+        self._staging = FlatIndex(dim)
+        self._lists: List[FlatIndex] = []
+        self._assignment: Dict[int, int] = {}
+
+    def __len__(self):
+        return len(self._assignment) + len(self._staging)
+
+    @property
+    def is_trained(self) -> bool:
+        return self.centroids is not None
+
+    @property
+    def min_train_size(self) -> int:
+        return self.nlist * MIN_POINTS_PER_CENTROID
+
+    def train(self, vectors, seed: int = 0):
+        """Học nlist tâm cụm bằng k-means (spherical) trên mẫu dữ liệu, rồi phân lại các vector đang có"""
+        vectors = normalize_rows(np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim))
+        if len(vectors) < self.nlist:
+            raise ValueError(f"Cần ít nhất nlist={self.nlist} vector để train IVF (có {len(vectors)}), "
+                             f"nên dùng >= {self.min_train_size}")
+        rng = np.random.default_rng(seed)
+        centroids = vectors[rng.choice(len(vectors), self.nlist, replace=False)].copy()
+        for _ in range(self.train_iters):
+            assign = np.argmax(vectors @ centroids.T, axis=1)
+            for c in range(self.nlist):
+                members = vectors[assign == c]
+                if len(members):
+                    centroids[c] = members.mean(axis=0)
+            centroids = normalize_rows(centroids)
+
+        ids, stored = self.items()
+        self.centroids = centroids
+        self.trained_size = len(vectors)
+        self._staging = FlatIndex(self.dim)
+        self._lists = [FlatIndex(self.dim) for _ in range(self.nlist)]
+        self._assignment = {}
+        if ids:
+            self._assign(ids, stored)
+
+    def items(self) -> Tuple[List[int], np.ndarray]:
+        """(ids, vectors) đang có trong index"""
+        parts = [self._staging.items()] + [flat.items() for flat in self._lists]
+        ids = [item_id for part_ids, _ in parts for item_id in part_ids]
+        return ids, np.concatenate([vectors for _, vectors in parts])
+
+    def _assign(self, ids: List[int], vectors: np.ndarray):
+        lists = np.argmax(vectors @ self.centroids.T, axis=1)
+        for list_no in np.unique(lists):
+            mask = lists == list_no
+            list_ids = [item_id for item_id, m in zip(ids, mask) if m]
+            self._lists[list_no].add(list_ids, vectors[mask])
+            for item_id in list_ids:
+                self._assignment[item_id] = int(list_no)
+
+    def add(self, ids: Sequence[int], vectors):
+        """Thêm hoặc thay thế vector; tự train (lại) khi đủ dữ liệu"""
+        vectors = normalize_rows(np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim))
+        ids, vectors = dedupe_ids(ids, vectors)
+        if not self.is_trained:
+            self._staging.add(ids, vectors)
+            if len(self._staging) >= self.min_train_size:
+                self.train(self._staging.items()[1])
+            return
+        self.remove([item_id for item_id in ids if item_id in self._assignment])
+        self._assign(ids, vectors)
+        if len(self) >= self.retrain_factor * max(self.trained_size, self.min_train_size):
+            self.train(self.items()[1])
+
+    def remove(self, ids: Sequence[int]):
+        """Xoá vector theo id"""
+        self._staging.remove(ids)
+        for item_id in ids:
+            list_no = self._assignment.pop(item_id, None)
+            if list_no is not None:
+                self._lists[list_no].remove([item_id])
+
+    def search(self, queries, k: int = 5) -> Tuple[np.ndarray, np.ndarray]:
+        """Top-k gần đúng: chỉ quét nprobe cụm gần query nhất (chưa train: tìm chính xác)"""
+        if not self.is_trained:
+            return self._staging.search(queries, k)
+        queries = normalize_rows(np.asarray(queries, dtype=np.float32).reshape(-1, self.dim))
+        ids = np.full((len(queries), k), -1, dtype=np.int64)
+        scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        if not len(self):
+            return ids, scores
+
+        nprobe = min(self.nprobe, len(self.centroids))
+        probes = np.argpartition(-(queries @ self.centroids.T), nprobe - 1, axis=1)[:, :nprobe]
+        for qi, query in enumerate(queries):
+            cand_ids, cand_scores = [], []
+            for list_no in probes[qi]:
+                list_ids, list_scores = self._lists[list_no].search(query, k)
+                cand_ids.append(list_ids[0])
+                cand_scores.append(list_scores[0])
+            cand_ids = np.concatenate(cand_ids)
+            cand_scores = np.concatenate(cand_scores)
+            best = np.argsort(-cand_scores)[:k]
+            ids[qi, :len(best)] = cand_ids[best]
+            scores[qi, :len(best)] = cand_scores[best]
+        return ids, scores
+
+
+class HNSWIndex:
+    """Index đồ thị HNSW (cần cài thêm thư viện hnswlib)"""
+
+    def __init__(self, dim: int = 512, max_elements: int = 100000, M: int = 16,
+                 ef_construction: int = 200, ef_search: int = 64):
+        try:
+            import hnswlib
+        except ImportError:
+            raise ImportError("HNSWIndex cần thư viện hnswlib: pip install hnswlib")
+
+        self.dim = dim
+        self._index = hnswlib.Index(space='ip', dim=dim)
+        self._index.init_index(max_elements=max_elements, M=M, ef_construction=ef_construction)
+        self._index.set_ef(ef_search)
+        self._lock = threading.Lock()
+        self._live = set()
+        self._deleted = set()
+
+    def __len__(self):
+        return len(self._live)
+
+    def add(self, ids: Sequence[int], vectors):
+        """Thêm hoặc cập nhật vector theo id"""
+        vectors = normalize_rows(np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim))
+        ids, vectors = dedupe_ids(ids, vectors)
+        with self._lock:
+            needed = self._index.get_current_count() + len(ids)
+            if needed > self._index.get_max_elements():
+                self._index.resize_index(max(needed, 2 * self._index.get_max_elements()))
+            for item_id in ids:
+                if item_id in self._deleted:
+                    self._index.unmark_deleted(item_id)
+                    self._deleted.discard(item_id)
+            self._index.add_items(vectors, ids)
+            self._live.update(ids)
+
+    def remove(self, ids: Sequence[int]):
+        """Đánh dấu xoá (HNSW không xoá hẳn node khỏi đồ thị)"""
+        with self._lock:
+            for item_id in ids:
+                if item_id in self._live:
+                    self._index.mark_deleted(item_id)
+                    self._live.discard(item_id)
+                    self._deleted.add(item_id)
+
+    def search(self, queries, k: int = 5) -> Tuple[np.ndarray, np.ndarray]:
+        """Top-k gần đúng: trả về (ids, scores cosine)"""
+        queries = normalize_rows(np.asarray(queries, dtype=np.float32).reshape(-1, self.dim))
+        ids = np.full((len(queries), k), -1, dtype=np.int64)
+        scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        kk = min(k, len(self))
+        if kk == 0:
+            return ids, scores
+        labels, distances = self._index.knn_query(queries, k=kk)
+        ids[:, :kk] = labels
+        # space='ip' trả về 1 - inner product
+        scores[:, :kk] = 1.0 - distances
+        return ids, scores
+
+
+INDEX_TYPES = {
+    'flat': FlatIndex,
+    'ivf': IVFIndex,
+    'hnsw': HNSWIndex,
+}
+
+
+def create_index(kind: str = 'flat', dim: int = 512, **options):
+    """Tạo index theo tên: flat (chính xác), ivf, hnsw"""
+    if kind not in INDEX_TYPES:
+        raise ValueError(f"Loại index không hỗ trợ: {kind} (chọn {', '.join(INDEX_TYPES)})")
+    return INDEX_TYPES[kind](dim=dim, **options)
+
+
+class StudentEmbeddingIndex:
+    """Index toàn trường theo student_id, dựng từ bảng face_embeddings và đồng bộ tăng dần
+
+    Index nhớ embedding_id đang dùng của từng học sinh; sync() đối chiếu với embedding_id mới
+    nhất trong database nên bắt được cả embedding mới, embedding bị xoá (quay về embedding cũ
+    hơn) và học sinh không còn embedding nào (bị xoá).
+    """
+
+    def __init__(self, kind: str = 'flat', dim: int = 512, **options):
+        self.index = create_index(kind, dim, **options)
+        # student_id -> embedding_id đang có trong index
+        self.embedding_ids: Dict[int, Optional[int]] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.index)
+
+    def _apply(self, rows: List[Dict], removed: Dict[int, Optional[int]]):
+        rows = [r for r in rows if r.get('embedding') is not None]
+        with self._lock:
+            # Bỏ qua học sinh vừa được add_student trong lúc sync đọc database
+            removed = [student_id for student_id, embedding_id in removed.items()
+                       if student_id in self.embedding_ids and self.embedding_ids[student_id] == embedding_id]
+            if removed:
+                self.index.remove(removed)
+                for student_id in removed:
+                    self.embedding_ids.pop(student_id, None)
+            if rows:
+                self.index.add([r['student_id'] for r in rows], np.stack([r['embedding'] for r in rows]))
+                self.embedding_ids.update((r['student_id'], r['embedding_id']) for r in rows)
+        return len(rows)
+
+    def build(self):
+        """Nạp embedding mới nhất của mọi học sinh"""
+        return self._apply(FaceEmbeddingsRepository.get_all_embeddings_for_recognition(), {})
+
+    def sync(self) -> Dict[str, int]:
+        """Đồng bộ với database: thêm / thay embedding đã đổi, bỏ học sinh không còn embedding
+
+        Chỉ đọc blob của các embedding thay đổi; lỗi database được raise, index giữ nguyên.
+        """
+        latest = FaceEmbeddingsRepository.get_latest_embedding_ids()
+        with self._lock:
+            current = dict(self.embedding_ids)
+        removed = {student_id: embedding_id for student_id, embedding_id in current.items()
+                   if student_id not in latest}
+        changed = [embedding_id for student_id, embedding_id in latest.items()
+                   if current.get(student_id) != embedding_id]
+        added = self._apply(FaceEmbeddingsRepository.get_embeddings_by_ids(changed), removed)
+        return {'updated': added, 'removed': len(removed)}
+
+    def add_student(self, student_id: int, embedding, embedding_id: int = None):
+        """Cập nhật ngay khi học sinh có embedding mới"""
+        with self._lock:
+            self.index.add([student_id], embedding)
+            # Chưa biết embedding_id thì lần sync sau đọc lại từ database
+            self.embedding_ids[student_id] = embedding_id
+
+    def remove_student(self, student_id: int):
+        """Bỏ học sinh khỏi index (ví dụ khi xoá học sinh)"""
+        with self._lock:
+            self.index.remove([student_id])
+            self.embedding_ids.pop(student_id, None)
+
+    def search(self, queries, k: int = 5, threshold: float = None) -> List[List[Dict]]:
+        """Top-k học sinh cho từng query: [[{'student_id', 'score'}, ...], ...]"""
+        # Index không an toàn khi đọc song song với add/remove (mảng vector bị thay giữa chừng)
+        with self._lock:
+            ids, scores = self.index.search(queries, k)
+        results = []
+        for row_ids, row_scores in zip(ids, scores):
+            results.append([
+                {'student_id': int(i), 'score': float(s)}
+                for i, s in zip(row_ids, row_scores)
+                if i >= 0 and (threshold is None or s >= threshold)
+            ])
+        return results
+
+
+def benchmark_index(index, exact: FlatIndex, queries, k: int = 10) -> Dict:
+    """Đo recall@k (so với FlatIndex) và độ trễ từng query của một index"""
+    queries = np.asarray(queries, dtype=np.float32)
+    truth, _ = exact.search(queries, k)
+
+    latencies = []
+    found = []
+    for query in queries:
+        start = time.perf_counter()
+        ids, _ = index.search(query, k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        found.append(ids[0])
+
+    hits = sum(len(set(f[f >= 0]) & set(t[t >= 0])) for f, t in zip(found, truth))
+    total = sum(int((t >= 0).sum()) for t in truth)
+    latencies = np.asarray(latencies)
+    return {
+        'recall_at_k': hits / total if total else 0.0,
+        'latency_ms_p50': float(np.percentile(latencies, 50)),
+        'latency_ms_p99': float(np.percentile(latencies, 99)),
+        'queries_per_sec': float(1000.0 / latencies.mean()) if latencies.mean() > 0 else 0.0,
+    }
@@ -0,0 +1,40 @@
+import os
+import sys
+from contextlib import contextmanager
+
+import pytest
+
+# Thêm thư mục gốc của project vào path để tìm module service
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class FakeCursor:
+    """Cursor giả: ghi lại (query, params); rowcount/fetchone lấy từ các giá trị được đặt trước"""
+
+    def __init__(self, rowcounts=None, fetched=None):
+        self.executed = []
+        self.rowcount = 0
+        self._rowcounts = list(rowcounts or [])
+        self._fetched = list(fetched or [])
+
+    def execute(self, query, params=None):
+        self.executed.append((query, params))
+        self.rowcount = self._rowcounts.pop(0) if self._rowcounts else 1
+
+    def fetchone(self):
+        return self._fetched.pop(0) if self._fetched else None
+
+
+@pytest.fixture
+def fake_transaction(monkeypatch):
+    """Thay db.transaction() của repository điểm danh bằng FakeCursor, không cần MySQL"""
+    from service import attendance
+
+    cursor = FakeCursor()
+
+    @contextmanager
+    def transaction():
+        yield cursor
+
+    monkeypatch.setattr(attendance.db, 'transaction', transaction)
+    return cursor
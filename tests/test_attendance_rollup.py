@@ -0,0 +1,80 @@
+from datetime import date, datetime
+
+from service.attendance import (
+    CREATE_ATTENDANCE_ONCE_QUERY,
+    ROLLUP_DECREMENT_QUERY,
+    ROLLUP_INCREMENT_QUERY,
+    AttendanceRepository,
+    attendance_rows,
+    build_rollup_statistics_query,
+    rollup_moves,
+)
+
+MORNING = datetime(2024, 3, 4, 7, 30)
+
+
+def record(student_id, status='present', session='morning', timestamp=MORNING):
+    return {'student_id': student_id, 'class_id': 10, 'session': session, 'status': status,
+            'camera_id': 3, 'timestamp': timestamp}
+
+
+def test_attendance_rows_merges_rollup_by_key():
+    rows, rollup = attendance_rows([
+        record(1),
+        record(1, timestamp=MORNING.replace(hour=8)),
+        record(2, status='late'),
+    ])
+    assert len(rows) == 3
+    assert rows[0] == (1, 10, MORNING, 'morning', 'present', 'face_recognition', 3, None)
+    assert sorted(rollup) == [
+        (10, 1, date(2024, 3, 4), 'morning', 'present', 2),
+        (10, 2, date(2024, 3, 4), 'morning', 'late', 1),
+    ]
+
+
+def test_rollup_moves_between_status_and_session():
+    old = {'class_id': 10, 'student_id': 1, 'day': date(2024, 3, 4), 'session': 'morning', 'status': 'late'}
+    assert rollup_moves(old) == []
+    assert rollup_moves(old, status='late') == []
+    assert rollup_moves(old, status='present', session='afternoon') == [
+        (ROLLUP_DECREMENT_QUERY, (10, 1, date(2024, 3, 4), 'morning', 'late')),
+        (ROLLUP_INCREMENT_QUERY, (10, 1, date(2024, 3, 4), 'afternoon', 'present')),
+    ]
+
+
+def test_rollup_statistics_query_filters_day_range():
+    query, params = build_rollup_statistics_query('class_id', 10, date(2024, 3, 1), date(2024, 3, 31))
+    assert 'FROM attendance_daily_rollup' in query
+    assert 'day BETWEEN %s AND %s' in query
+    assert params == (10, date(2024, 3, 1), date(2024, 3, 31))
+
+
+def test_update_moves_rollup_count(fake_transaction):
+    old = {'class_id': 10, 'student_id': 1, 'day': date(2024, 3, 4), 'session': 'morning', 'status': 'late'}
+    fake_transaction._fetched = [old]
+    assert AttendanceRepository.update_attendance(5, status='present')
+    queries = [query for query, _ in fake_transaction.executed]
+    assert queries[-2:] == [ROLLUP_DECREMENT_QUERY, ROLLUP_INCREMENT_QUERY]
+
+
+def test_update_missing_record_touches_nothing(fake_transaction):
+    assert not AttendanceRepository.update_attendance(5, status='present')
+    assert len(fake_transaction.executed) == 1
+
+
+def test_delete_decrements_rollup(fake_transaction):
+    old = {'class_id': 10, 'student_id': 1, 'day': date(2024, 3, 4), 'session': 'morning', 'status': 'late'}
+    fake_transaction._fetched = [old]
+    assert AttendanceRepository.delete_attendance(5)
+    assert fake_transaction.executed[-1] == (ROLLUP_DECREMENT_QUERY, (10, 1, date(2024, 3, 4), 'morning', 'late'))
+
+
+def test_create_once_increments_rollup_only_for_inserted_rows(fake_transaction):
+    # Học sinh 2 đã có bản ghi: ON DUPLICATE KEY UPDATE không đổi gì, rowcount = 0
+    fake_transaction._rowcounts = [1, 1, 0]
+    created = AttendanceRepository.create_once([record(1), record(2)])
+    assert [r['student_id'] for r in created] == [1]
+    assert [query for query, _ in fake_transaction.executed] == [
+        CREATE_ATTENDANCE_ONCE_QUERY, ROLLUP_INCREMENT_QUERY, CREATE_ATTENDANCE_ONCE_QUERY,
+    ]
+    assert fake_transaction.executed[1][1] == (10, 1, date(2024, 3, 4), 'morning', 'present')
@@ -0,0 +1,114 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from service.batching import BatcherUnavailable, Histogram, MicroBatcher
+
+
+def test_histogram_quantiles():
+    histogram = Histogram([1, 2, 4, 8])
+    for value in (1, 1, 3, 3, 3, 20):
+        histogram.observe(value)
+    snapshot = histogram.snapshot()
+    assert snapshot['buckets'] == {'le_1': 2, 'le_2': 0, 'le_4': 3, 'le_8': 0, 'inf': 1}
+    assert snapshot['p50'] == 4.0
+    assert snapshot['p99'] == 20
+
+
+def test_concurrent_submits_share_one_batch():
+    batches = []
+
+    def run_batch(items):
+        batches.append(list(items))
+        return [item * 2 for item in items]
+
+    async def main():
+        batcher = MicroBatcher(run_batch, max_batch=8, max_wait_ms=20)
+        return await batcher.submit_many(list(range(5))), batcher.metrics()
+
+    results, metrics = asyncio.run(main())
+    assert results == [0, 2, 4, 6, 8]
+    assert batches == [[0, 1, 2, 3, 4]]
+    assert metrics['batches'] == 1 and metrics['avg_batch_size'] == 5
+
+
+def test_batches_split_at_max_batch():
+    async def main():
+        batcher = MicroBatcher(lambda items: list(items), max_batch=2, max_wait_ms=5)
+        return await batcher.submit_many(list(range(5))), batcher.metrics()
+
+    results, metrics = asyncio.run(main())
+    assert results == list(range(5))
+    assert metrics['batches'] == 3
+
+
+def test_batch_error_reaches_every_caller():
+    def run_batch(items):
+        raise RuntimeError("model lỗi")
+
+    async def main():
+        batcher = MicroBatcher(run_batch, max_wait_ms=1)
+        return await asyncio.gather(batcher.submit(1), batcher.submit(2), return_exceptions=True)
+
+    errors = asyncio.run(main())
+    assert all(isinstance(e, RuntimeError) for e in errors)
+
+
+def test_timeout_bounds_queue_wait_not_execution():
+    release = threading.Event()
+
+    def run_batch(items):
+        # Batch đầu chạy lâu hơn timeout nhưng vẫn phải trả kết quả
+        if items == ['slow']:
+            release.wait(1)
+            time.sleep(0.1)
+        return list(items)
+
+    async def main():
+        batcher = MicroBatcher(run_batch, max_batch=1, max_wait_ms=0, timeout_ms=50)
+        slow = asyncio.ensure_future(batcher.submit('slow'))
+        await asyncio.sleep(0.01)
+        # Chờ trong hàng đợi sau batch 'slow' lâu hơn timeout
+        queued = asyncio.ensure_future(batcher.submit('queued'))
+        release.set()
+        return await asyncio.gather(slow, queued, return_exceptions=True), batcher.metrics()
+
+    (slow, queued), metrics = asyncio.run(main())
+    assert slow == 'slow'
+    assert isinstance(queued, asyncio.TimeoutError)
+    assert metrics['timeouts'] == 1
+
+
+def test_stopped_worker_fails_pending_requests():
+    started = threading.Event()
+
+    def run_batch(items):
+        started.set()
+        time.sleep(0.05)
+        return list(items)
+
+    async def main():
+        batcher = MicroBatcher(run_batch, max_batch=1, max_wait_ms=0, timeout_ms=0)
+        running = asyncio.ensure_future(batcher.submit('running'))
+        queued = asyncio.ensure_future(batcher.submit('queued'))
+        await asyncio.get_running_loop().run_in_executor(None, started.wait, 1)
+        batcher._worker.cancel()
+        return await asyncio.gather(running, queued, return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert all(isinstance(result, BatcherUnavailable) for result in results)
+
+
+@pytest.mark.parametrize('env, expected', [
+    ({}, 2000.0),
+    ({'EMBED_REQUEST_TIMEOUT_MS': '750'}, 750.0),
+    ({'EMBED_REQUEST_TIMEOUT_MS': '750', 'EMBED_QUEUE_TIMEOUT_MS': '300'}, 300.0),
+])
+def test_from_env_timeout(monkeypatch, env, expected):
+    for name in ('EMBED_QUEUE_TIMEOUT_MS', 'EMBED_REQUEST_TIMEOUT_MS'):
+        monkeypatch.delenv(name, raising=False)
+    for name, value in env.items():
+        monkeypatch.setenv(name, value)
+    assert MicroBatcher.from_env(lambda items: items).timeout_ms == expected
@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+
+from service.face_tracker import FaceTracker, iou_matrix
+
+
+def box(x, y, size=100, score=0.9):
+    return np.array([x, y, x + size, y + size, score], dtype=np.float32)
+
+
+def match(student_id, score=0.8):
+    return {'student_id': student_id, 'name': f'HS {student_id}', 'score': score}
+
+
+def test_iou_matrix():
+    ious = iou_matrix(np.stack([box(0, 0), box(0, 0)]), np.stack([box(0, 0), box(50, 0), box(500, 500)]))
+    np.testing.assert_allclose(ious[0], [1.0, 50 / 150, 0.0], atol=1e-6)
+    assert iou_matrix(np.empty((0, 5)), np.stack([box(0, 0)])).shape == (0, 1)
+
+
+def test_moving_face_keeps_its_track():
+    tracker = FaceTracker(iou_threshold=0.3)
+    first = tracker.update(np.stack([box(0, 0), box(400, 0)]))
+    for step in range(1, 6):
+        tracks = tracker.update(np.stack([box(400 + 5 * step, 0), box(10 * step, 0)]))
+    assert [t.track_id for t in tracks] == [first[1].track_id, first[0].track_id]
+    assert tracker.metrics()['tracks_started'] == 2
+
+
+def test_lost_track_is_dropped_after_max_misses():
+    tracker = FaceTracker(max_misses=2)
+    tracker.update(np.stack([box(0, 0)]))
+    for _ in range(3):
+        tracker.update(np.empty((0, 5), dtype=np.float32))
+    assert tracker.tracks == []
+
+
+def test_identity_confirmed_after_k_of_n_votes():
+    tracker = FaceTracker(vote_k=3, vote_n=5)
+    track = tracker.update(np.stack([box(0, 0)]))[0]
+    results = [tracker.vote(track, m) for m in (match(7, 0.7), None, match(8), match(7, 0.9), match(7, 0.8))]
+    assert results[:4] == [None, None, None, None]
+    # Danh tính lấy lần khớp điểm cao nhất của học sinh dẫn đầu
+    assert results[4] == dict(match(7, 0.9), track_id=track.track_id)
+    assert tracker.vote(track, match(7)) is None
+    assert tracker.metrics()['tracks_confirmed'] == 1
+
+
+def test_confirmed_track_reuses_embedding_until_reverify():
+    tracker = FaceTracker(vote_k=1, vote_n=1, reverify_frames=3, quality_gain=10)
+    track = tracker.update(np.stack([box(0, 0)]))[0]
+    assert tracker.needs_embedding(track)
+    tracker.mark_embedded(track)
+    tracker.vote(track, match(7))
+
+    needed = []
+    for _ in range(3):
+        tracker.update(np.stack([box(0, 0)]))
+        needed.append(tracker.needs_embedding(track))
+    assert needed == [False, False, True]
+    assert tracker.metrics()['reused'] == 2
+
+
+def test_invalid_votes_rejected():
+    with pytest.raises(ValueError):
+        FaceTracker(vote_k=4, vote_n=3)
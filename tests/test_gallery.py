@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+
+from service.gallery import GalleryCache, TemplateGallery, build_template_gallery
+
+
+def unit(*values):
+    vector = np.asarray(values, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def gallery(pooling):
+    # Học sinh 1 có hai ảnh mẫu (trục x và trục y), học sinh 2 một ảnh mẫu (trục z)
+    return TemplateGallery(
+        [1, 2], ['An', 'Bình'],
+        [[unit(1, 0, 0), unit(0, 1, 0)], [unit(0, 0, 1)]],
+        pooling=pooling
+    )
+
+
+def test_reduceat_max_pooling_matches_per_student_loop():
+    rng = np.random.default_rng(0)
+    templates = [rng.normal(size=(n, 8)) for n in (3, 1, 4)]
+    queries = rng.normal(size=(5, 8)).astype(np.float32)
+    g = TemplateGallery([1, 2, 3], ['a', 'b', 'c'], templates, pooling='max')
+
+    normalized = queries / np.linalg.norm(queries, axis=1, keepdims=True)
+    expected = np.stack([
+        (normalized @ (t / np.linalg.norm(t, axis=1, keepdims=True)).T.astype(np.float32)).max(axis=1)
+        for t in templates
+    ], axis=1)
+    np.testing.assert_allclose(g.student_scores(queries), expected, rtol=1e-5, atol=1e-6)
+
+
+def test_max_and_mean_pooling():
+    query = unit(1, 0, 0).reshape(1, -1)
+    np.testing.assert_allclose(gallery('max').student_scores(query), [[1.0, 0.0]], atol=1e-6)
+    np.testing.assert_allclose(gallery('mean').student_scores(query), [[0.5, 0.0]], atol=1e-6)
+
+
+def test_search_and_match_faces():
+    g = gallery('max')
+    assert g.search(unit(0, 1, 0.1), top_k=1)[0]['student_id'] == 1
+    assert g.search(unit(0, 1, 0), top_k=0) == []
+    matches = g.match_faces(np.stack([unit(0, 0, 1), unit(1, 0, 0)]), threshold=0.5)
+    assert [m['student_id'] for m in matches] == [2, 1]
+
+
+def test_add_keeps_newest_templates_and_remove():
+    g = TemplateGallery([1], ['An'], [[unit(1, 0, 0)]], pooling='max', max_templates=2)
+    g = g.add(1, 'An', unit(0, 1, 0)).add(1, 'An', unit(0, 0, 1))
+    assert g.counts.tolist() == [2]
+    np.testing.assert_allclose(g.templates[0], [unit(0, 0, 1), unit(0, 1, 0)], atol=1e-6)
+    assert len(g.remove(1)) == 0
+
+
+def test_unknown_pooling_rejected():
+    with pytest.raises(ValueError):
+        gallery('median')
+
+
+def test_build_template_gallery_groups_rows_by_student():
+    rows = [
+        {'student_id': 1, 'student_name': 'An', 'embedding': unit(1, 0, 0)},
+        {'student_id': 1, 'student_name': 'An', 'embedding': unit(0, 1, 0)},
+        {'student_id': 2, 'student_name': 'Bình', 'embedding': None},
+        {'student_id': 3, 'student_name': 'Chi', 'embedding': unit(0, 0, 1)},
+    ]
+    g = build_template_gallery(rows, mode='latest', max_templates=5, pooling='max')
+    assert g.student_ids == [1, 3]
+    assert g.counts.tolist() == [2, 1]
+    assert build_template_gallery(rows, mode='single').counts.tolist() == [1, 1]
+
+
+def test_cache_drops_load_that_raced_with_enrollment():
+    cache = GalleryCache()
+    token = cache.begin_load('lop-1')
+    cache.invalidate('lop-1')
+    assert not cache.put('lop-1', gallery('max'), token)
+    assert cache.get('lop-1') is None
@@ -0,0 +1,60 @@
+import base64
+from datetime import date, datetime
+
+import pytest
+
+from service.pagination import build_page, clamp_limit, decode_cursor, encode_cursor, parse_fields
+
+
+def test_cursor_round_trip_keeps_types():
+    values = [datetime(2024, 5, 6, 7, 30, 15, 120), 42, date(2024, 5, 6), 'SV001']
+    cursor = encode_cursor(values)
+    assert '=' not in cursor
+    assert decode_cursor(cursor, len(values)) == values
+
+
+@pytest.mark.parametrize('cursor', [
+    '',
+    '!!!',
+    encode_cursor([1])[:-2] + '@@',
+    base64.urlsafe_b64encode(b'{"a":1}').decode('ascii'),
+])
+def test_decode_rejects_garbage(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor, 1)
+
+
+def test_decode_rejects_wrong_size():
+    with pytest.raises(ValueError):
+        decode_cursor(encode_cursor([1, 2]), 1)
+
+
+def test_clamp_limit():
+    assert clamp_limit(None) == 100
+    assert clamp_limit(-5) == 1
+    assert clamp_limit(10 ** 6) == 1000
+
+
+def test_parse_fields():
+    allowed = {'a': None, 'b': None}
+    assert parse_fields(None, allowed, ['a']) == ['a']
+    assert parse_fields('b, a,b', allowed, ['a']) == ['b', 'a']
+    with pytest.raises(ValueError):
+        parse_fields('a,c', allowed, ['a'])
+
+
+def attendance_rows(count):
+    return [{'attendance_id': i, 'timestamp': datetime(2024, 1, 1, 8, i), 'status': 'present'}
+            for i in range(1, count + 1)]
+
+
+def test_build_page_cursor_points_at_last_row_and_drops_key_columns():
+    page = build_page(attendance_rows(3), 2, ('timestamp', 'attendance_id'), ('status',))
+    assert page['items'] == [{'status': 'present'}, {'status': 'present'}]
+    assert decode_cursor(page['next_cursor'], 2) == [datetime(2024, 1, 1, 8, 2), 2]
+
+
+def test_build_page_last_page_has_no_cursor():
+    page = build_page(attendance_rows(2), 2, ('attendance_id',), ('attendance_id', 'status'))
+    assert page['next_cursor'] is None
+    assert [row['attendance_id'] for row in page['items']] == [1, 2]
@@ -0,0 +1,51 @@
+from datetime import date
+
+import pytest
+
+from service.student_import import parse_roster
+
+HEADER = 'full_name,student_code,class_id,date_of_birth,gender,photo\n'
+
+
+def roster(*lines):
+    return (HEADER + '\n'.join(lines) + '\n').encode('utf-8')
+
+
+def test_valid_rows_are_normalized():
+    rows, errors = parse_roster('\ufeff'.encode('utf-8') + roster(
+        ' Nguyễn Văn An ,SV001,3,2008-01-02,Male,an.jpg',
+        'Trần Thị Bình,SV002,3,,,binh.jpg',
+    ))
+    assert errors == []
+    assert rows[0] == {
+        'full_name': 'Nguyễn Văn An', 'student_code': 'SV001', 'class_id': 3,
+        'date_of_birth': date(2008, 1, 2), 'gender': 'male', 'photo': 'an.jpg', 'row': 2,
+    }
+    assert rows[1]['date_of_birth'] is None and rows[1]['gender'] is None
+
+
+@pytest.mark.parametrize('line, message', [
+    (',SV001,3,,,a.jpg', 'thiếu full_name'),
+    ('An,SV001,lop3,,,a.jpg', 'class_id không hợp lệ'),
+    ('An,SV001,3,02/01/2008,,a.jpg', 'date_of_birth'),
+    ('An,SV001,3,,unknown,a.jpg', 'gender không hợp lệ'),
+    ('An,' + 'S' * 21 + ',3,,,a.jpg', 'student_code dài quá'),
+    ('An,../etc/passwd,3,,,a.jpg', 'student_code chứa ký tự không hợp lệ'),
+    ('An,SV\\001,3,,,a.jpg', 'student_code chứa ký tự không hợp lệ'),
+])
+def test_invalid_rows_reported(line, message):
+    rows, errors = parse_roster(roster(line))
+    assert rows == []
+    assert errors[0]['row'] == 2
+    assert message in errors[0]['error']
+
+
+def test_duplicate_code_in_file_reported_once_seen():
+    rows, errors = parse_roster(roster('An,SV001,3,,,a.jpg', 'Bình,SV001,3,,,b.jpg'))
+    assert [r['row'] for r in rows] == [2]
+    assert errors == [{'row': 3, 'student_code': 'SV001', 'error': 'student_code bị trùng trong file'}]
+
+
+def test_missing_columns_rejected():
+    with pytest.raises(ValueError, match='photo'):
+        parse_roster(b'full_name,student_code,class_id\nAn,SV001,3\n')